@@ -0,0 +1,8 @@
+"""
+Benchmarks for redis-lua.
+
+Benchmarks are plain scripts and are not run as part of the test suite. Run
+them from the repository root, for instance::
+
+    python -m benchmarks.parse_regions
+"""
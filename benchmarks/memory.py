@@ -0,0 +1,135 @@
+"""
+Measure the memory footprint of a process that loads and renders many
+scripts.
+
+The slotted regions, whose directive strings are interned, are compared to a
+reference emulation of the former regions, which carried a `__dict__` and
+their own copy of every directive line.
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import tempfile
+
+try:
+    import tracemalloc
+except ImportError:  # pragma: no cover
+    tracemalloc = None
+
+from redis_lua import load_all_scripts
+from redis_lua.regions import TextRegion
+
+
+class LegacyRegion(object):
+    """
+    Reference implementation: a region with a `__dict__`.
+    """
+
+    def __init__(self, region):
+        for attribute in dir(type(region)):
+            value = getattr(region, attribute)
+
+            if attribute.startswith('__') or callable(value):
+                continue
+
+            if isinstance(value, str) and not isinstance(region, TextRegion):
+                # Directive lines used to be distinct strings.
+                value = (value + ' ')[:-1]
+
+            setattr(self, attribute, value)
+
+
+def copy_region(region):
+    """
+    Copy a region the way unpickling does.
+    """
+    result = type(region).__new__(type(region))
+    result.__setstate__(region.__getstate__())
+
+    return result
+
+
+def generate_scripts(path, count):
+    """
+    Generate scripts that all include a common library.
+
+    :param path: The directory to write the scripts to.
+    :param count: The number of scripts to generate.
+    """
+    scripts = {
+        'lib': '%pragma once\n%key lock\nlocal function lib()\n'
+        '    return redis.call("GET", lock)\nend',
+    }
+
+    for index in range(count):
+        scripts['script_%d' % index] = '\n'.join([
+            '%include "lib"',
+            '%key key',
+            '%arg name',
+            '%arg count int',
+            '%return int',
+            'local value = redis.call("HGET", key, name)',
+            'return tonumber(value or 0) + count + %d' % index,
+        ])
+
+    for name, content in scripts.items():
+        with open(os.path.join(path, name + '.lua'), 'w') as _file:
+            _file.write(content)
+
+
+def get_memory(func):
+    if tracemalloc is None:  # pragma: no cover
+        return float('nan'), None
+
+    tracemalloc.start()
+
+    try:
+        result = func()
+
+        return tracemalloc.get_traced_memory()[0], result
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--scripts', type=int, default=2000)
+    args = parser.parse_args()
+
+    path = tempfile.mkdtemp()
+
+    try:
+        generate_scripts(path=path, count=args.scripts)
+
+        loaded, scripts = get_memory(lambda: load_all_scripts(path=path))
+        regions = [
+            region
+            for script in scripts.values()
+            for region in script.regions
+        ]
+        legacy, _ = get_memory(
+            lambda: [LegacyRegion(region) for region in regions],
+        )
+        current, _ = get_memory(
+            lambda: [copy_region(region) for region in regions],
+        )
+        rendered, _ = get_memory(
+            lambda: [script.render() for script in scripts.values()],
+        )
+
+        print('scripts  %8d' % len(scripts))
+        print('regions  %8d' % len(regions))
+        print('loaded   %8.0f KB' % (loaded / 1024.0))
+        print('rendered %8.0f KB' % (rendered / 1024.0))
+        print('legacy   %8.0f B/region' % (float(legacy) / len(regions)))
+        print('current  %8.0f B/region' % (float(current) / len(regions)))
+        print('saving   %8.2fx' % (float(legacy) / current))
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    main()
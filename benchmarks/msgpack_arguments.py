@@ -0,0 +1,69 @@
+"""
+Measure the cost of serializing large nested arguments.
+
+The `msgpack` argument type is compared to the JSON serialization of the
+`list` and `dict` argument types. On the Redis side, MessagePack arguments are
+decoded by `cmsgpack.unpack`, which is cheaper than `cjson.decode`, but only
+the client side, and the size of the payloads, are measured here.
+"""
+
+from __future__ import print_function
+
+import argparse
+import timeit
+
+from redis_lua.regions import MessagePack
+from redis_lua.script import Script
+
+
+def generate_payload(count):
+    """
+    Generate a nested payload.
+
+    :param count: The number of items of the payload.
+    :return: A dict of items.
+    """
+    return {
+        'item:%d' % index: {
+            'id': index,
+            'score': index * 0.5,
+            'name': 'item number %d' % index,
+            'tags': ['a', 'b', 'c'][:index % 4],
+            'enabled': bool(index % 2),
+        }
+        for index in range(count)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--items', type=int, default=10000)
+    parser.add_argument('--number', type=int, default=10)
+    args = parser.parse_args()
+
+    payload = generate_payload(count=args.items)
+    results = []
+
+    for name, type_ in [('legacy', dict), ('current', MessagePack)]:
+        size = len(Script.convert_argument_for_call(type_, payload))
+        duration = min(
+            timeit.repeat(
+                lambda: Script.convert_argument_for_call(type_, payload),
+                repeat=3,
+                number=args.number,
+            ),
+        )
+        results.append(duration)
+        print(
+            '%-8s %8.2f ms/call %8.0f KB' % (
+                name,
+                duration * 1000 / args.number,
+                size / 1024.0,
+            ),
+        )
+
+    print('speedup  %8.2fx' % (results[0] / results[1]))
+
+
+if __name__ == '__main__':
+    main()
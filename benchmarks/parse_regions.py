@@ -0,0 +1,144 @@
+"""
+Measure the throughput of :py:meth:`ScriptParser.parse_regions
+<redis_lua.regions.ScriptParser.parse_regions>` on large synthetic scripts.
+
+The current scanner is compared to a reference implementation of the former
+line-by-line approach, which tried every directive pattern on every line.
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import re
+import timeit
+
+from redis_lua.regions import ScriptParser
+from redis_lua.script import Script
+
+
+def generate_script(line_count, directive_ratio=0.02):
+    """
+    Generate a synthetic LUA script.
+
+    :param line_count: The number of lines of the script.
+    :param directive_ratio: The proportion of lines that are directives.
+    :return: The script content.
+    """
+    lines = []
+    directive_every = max(int(1 / directive_ratio), 1)
+
+    for index in range(line_count):
+        if index % directive_every == 0:
+            lines.append('%%arg arg_%d integer' % index)
+        elif index % 7 == 0:
+            lines.append("local s_%d = string.format('%%s', 'x');" % index)
+        elif index % 5 == 0:
+            lines.append('    -- Some comment about line %d.' % index)
+        else:
+            lines.append('    local v_%d = redis.call("GET", "k");' % index)
+
+    return '\n'.join(lines)
+
+
+def legacy_parse_regions(content, current_path):
+    """
+    Reference implementation: up to five uncompiled `re.match` per line and
+    a filesystem-dependent path resolution.
+    """
+    context = ScriptParser.ParseRegionsContext()
+
+    for real_line, statement in enumerate(content.split('\n'), start=1):
+        match = re.match(
+            r'^\s*%include\s+"(?P<name>[\w\d_\-/\\.]+)"\s*$',
+            statement,
+        )
+
+        if match:
+            os.path.relpath(os.path.join(current_path, match.group('name')))
+            context.add_line(statement)
+            continue
+
+        match = re.match(r'^\s*%key\s+(?P<name>[\w\d_]+)\s*$', statement)
+
+        if match:
+            context.add_key_region(name=match.group('name'), content=statement)
+            continue
+
+        match = re.match(
+            r'^\s*%arg\s+(?P<name>[\w\d_]+)(\s+(?P<type>[\w\d_]+))?\s*$',
+            statement,
+        )
+
+        if match:
+            context.add_argument_region(
+                name=match.group('name'),
+                type_=match.group('type'),
+                content=statement,
+            )
+            continue
+
+        if re.match(r'^\s*%return\s+(?P<type>[\w\d_]+)\s*$', statement):
+            continue
+
+        if re.match(r'^\s*%pragma\s+(?P<value>[\w\d_]+)\s*$', statement):
+            continue
+
+        context.add_line(statement)
+
+    context.flush()
+
+    if not context.regions:
+        context.add_line('')
+        context.flush()
+
+    return context.regions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--lines', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    content = generate_script(line_count=args.lines)
+    script_parser = ScriptParser()
+
+    def current():
+        script_parser.parse_regions(
+            content=content,
+            current_path='.',
+            get_script_by_name=None,
+        )
+
+    def legacy():
+        legacy_parse_regions(content=content, current_path='.')
+
+    # Make sure the synthetic script is valid.
+    Script(
+        name='synthetic',
+        regions=script_parser.parse_regions(
+            content=content,
+            current_path='.',
+            get_script_by_name=None,
+        ),
+    )
+
+    results = []
+
+    for name, func in [('legacy', legacy), ('current', current)]:
+        duration = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        results.append(duration)
+        print(
+            '%-8s %8.2f ms %12.0f lines/s' % (
+                name,
+                duration * 1000,
+                args.lines / duration,
+            ),
+        )
+
+    print('speedup  %8.2fx' % (results[0] / results[1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -168,6 +168,109 @@ def test_argument_types(redis):
     assert_equal(args, result)
 
 
+@skip_if_no_redis
+def test_msgpack_argument(redis):
+    value = {'a': [1, 2, 'b'], 'c': {'d': 2.5}, 'e': 'f'}
+    result = run_code(
+        client=redis,
+        content="""
+        %arg m msgpack
+        %return dict
+
+        return cjson.encode(m)
+        """,
+        kwargs={'m': value},
+    )
+
+    assert_equal(value, result)
+
+
+@skip_if_no_redis
+def test_msgpack_return(redis):
+    value = {b'a': [1, 2, b'b'], b'c': {b'd': 2.5}, b'e': b'\xff'}
+    result = run_code(
+        client=redis,
+        content="""
+        %arg m msgpack
+        %return msgpack
+
+        return cmsgpack.pack(m)
+        """,
+        kwargs={'m': value},
+    )
+
+    assert_equal(value, result)
+
+
+@skip_if_no_redis
+def test_array_arguments(redis):
+    args = {
+        'ids': [1, -2, 2 ** 40],
+        'scores': [0.5, -1.25, 3.0],
+    }
+    result = run_code(
+        client=redis,
+        content="""
+        %arg ids int_array
+        %arg scores float_array
+        %return dict
+
+        return cjson.encode({ids=ids, scores=scores})
+        """,
+        kwargs=args,
+    )
+
+    assert_equal(args, result)
+
+
+@skip_if_no_redis
+def test_array_return(redis):
+    value = [0.5, -1.25, 3.0]
+    result = run_code(
+        client=redis,
+        content="""
+        %arg scores float_array
+        %return float_array
+
+        local parts = {}
+
+        for i, score in ipairs(scores) do
+            parts[i] = struct.pack('<d', score)
+        end
+
+        return table.concat(parts)
+        """,
+        kwargs={'scores': value},
+    )
+
+    assert_equal(value, result)
+
+
+@skip_if_no_redis
+def test_hash_arguments(redis):
+    args = {
+        'a': {'x': '1', 'y': 'b'},
+        'n': 3,
+        'b': {},
+        'c': {'z': 'c'},
+    }
+    result = run_code(
+        client=redis,
+        content="""
+        %arg a hash
+        %arg n int
+        %arg b pairs
+        %arg c hash
+        %return dict
+
+        return cjson.encode({a=a, n=n, b=next(b) == nil, c=c})
+        """,
+        kwargs=args,
+    )
+
+    assert_equal(dict(args, b=True), result)
+
+
 @skip_if_no_redis
 def test_doc_example(redis):
     result = run_code(
@@ -3,58 +3,168 @@ Helpers to ease LUA scripting with Redis.
 """
 
 import os
-import six
+import posixpath
 
 from functools import partial
 
-from .exceptions import (
-    CyclicDependencyError,
-    ScriptNotFoundError,
+from .cache import ScriptCache
+from .exceptions import CyclicDependencyError
+from .files import read_script  # noqa: F401
+from .files import (
+    close_script_bytes,
+    iter_script_names,
+    read_script_bytes,
+)
+from .loader import (
+    LazyScriptMapping,
+    ScriptLoader,
 )
 from .regions import ScriptParser
 from .script import Script
+from .script import register_scripts  # noqa: F401
+
+
+def iter_scripts(
+    path,
+    include=None,
+    exclude=None,
+    cache=None,
+    disk_cache=None,
+    graph=None,
+    intern_table=None,
+):
+    """
+    Iterate over the LUA scripts found at the specified location, loading them
+    one at a time.
 
+    Scripts are loaded as the directories are walked, which allows processing
+    huge trees as a pipeline.
 
-def load_all_scripts(path, cache=None):
+    :param path: A path to search into for LUA scripts.
+    :param include: An iterable of glob patterns. If specified, only the
+        scripts whose name matches one of them are loaded.
+    :param exclude: An iterable of glob patterns. The scripts and directories
+        whose name matches one of them are skipped.
+    :param cache: A cache of scripts to use to fasten loading. If `None`, a
+        new dict is used for the whole iteration. Pass a :py:class:`ScriptCache
+        <redis_lua.cache.ScriptCache>` instance to bound its size.
+    :param disk_cache: A :py:class:`DiskCache
+        <redis_lua.disk_cache.DiskCache>` instance to persist parsed scripts
+        into, across processes.
+    :param graph: A :py:class:`DependencyGraph
+        <redis_lua.graph.DependencyGraph>` instance to add the loaded scripts,
+        and the scripts they include, to.
+    :param intern_table: A :py:class:`ScriptInternTable
+        <redis_lua.intern.ScriptInternTable>` instance to share identical
+        scripts through, with other caches.
+    :yields: (name, script) tuples, in arbitrary order.
+    """
+    loader = ScriptLoader(
+        path=path,
+        cache=cache,
+        disk_cache=disk_cache,
+        graph=graph,
+        intern_table=intern_table,
+    )
+
+    for name in iter_script_names(path, include=include, exclude=exclude):
+        yield name, loader.load(names=[name])[name]
+
+
+def load_all_scripts(
+    path,
+    cache=None,
+    disk_cache=None,
+    workers=None,
+    lazy=False,
+    graph=None,
+    include=None,
+    exclude=None,
+    intern_table=None,
+):
     """
     Load all the LUA scripts found at the specified location.
 
     :param path: A path to search into for LUA scripts.
     :param cache: A cache of scripts to use to fasten loading. If some `names`
         are in the `cache`, then they are taken from it.
-    :return: A list of scripts that were found, in arbitrary order.
+    :param disk_cache: A :py:class:`DiskCache
+        <redis_lua.disk_cache.DiskCache>` instance to persist parsed scripts
+        into, across processes.
+    :param workers: The number of threads to use to read script files
+        concurrently. If `None`, files are read sequentially.
+    :param lazy: If `True`, scripts are only listed and each script is loaded
+        on first access.
+    :param graph: A :py:class:`DependencyGraph
+        <redis_lua.graph.DependencyGraph>` instance to add the loaded scripts,
+        and the scripts they include, to.
+    :param include: An iterable of glob patterns. If specified, only the
+        scripts whose name matches one of them are loaded.
+    :param exclude: An iterable of glob patterns. The scripts and directories
+        whose name matches one of them are skipped.
+    :param intern_table: A :py:class:`ScriptInternTable
+        <redis_lua.intern.ScriptInternTable>` instance to share identical
+        scripts through, with other caches.
+    :return: A dict of scripts that were found, in arbitrary order. If `lazy`
+        is `True`, a :py:class:`LazyScriptMapping
+        <redis_lua.loader.LazyScriptMapping>` instance.
     """
-    if cache is None:
-        cache = {}
-
-    scripts = {}
-
-    for root, dirs, files in os.walk(path):
-        prefix = os.path.relpath(root, path)
-        scripts.update(load_scripts(
-            names=[
-                os.path.splitext(
-                    os.path.normpath(os.path.join(prefix, file_)),
-                )[0]
-                for file_ in files
-            ],
+    if lazy:
+        return LazyScriptMapping(
             path=path,
             cache=cache,
-        ))
+            disk_cache=disk_cache,
+            workers=workers,
+            graph=graph,
+            include=include,
+            exclude=exclude,
+            intern_table=intern_table,
+        )
 
-    return scripts
+    return load_scripts(
+        names=iter_script_names(path, include=include, exclude=exclude),
+        path=path,
+        cache=cache,
+        disk_cache=disk_cache,
+        workers=workers,
+        graph=graph,
+        intern_table=intern_table,
+    )
 
 
-def load_scripts(names, path, cache=None):
+def load_scripts(
+    names,
+    path,
+    cache=None,
+    disk_cache=None,
+    workers=None,
+    graph=None,
+    intern_table=None,
+):
     """
     Load several LUA scripts.
 
+    The script files, and the files of the scripts they include, are read
+    first. Scripts are then parsed in an order such that every script is
+    parsed after the scripts it includes.
+
     :param names: An iterable of LUA scripts names to load. If some names
         contain backslashes, those will be replaced with forward slashes
         silently.
     :param path: A path to search into for LUA scripts.
     :param cache: A cache of scripts to use to fasten loading. If some `names`
         are in the `cache`, then they are taken from it.
+    :param disk_cache: A :py:class:`DiskCache
+        <redis_lua.disk_cache.DiskCache>` instance to persist parsed scripts
+        into, across processes.
+    :param workers: The number of threads to use to read script files
+        concurrently. If `None`, files are read sequentially.
+    :param graph: A :py:class:`DependencyGraph
+        <redis_lua.graph.DependencyGraph>` instance to add the loaded scripts,
+        and the scripts they include, to.
+    :param intern_table: A :py:class:`ScriptInternTable
+        <redis_lua.intern.ScriptInternTable>` instance to share identical
+        scripts through, with other caches.
 
     :return: A dict of scripts that were found.
 
@@ -62,23 +172,27 @@ def load_scripts(names, path, cache=None):
         immediately. This means that if some script fails to load and the
         function call throws, the cache will still have been updated.
     """
-    if cache is None:
-        cache = {}
+    loader = ScriptLoader(
+        path=path,
+        cache=cache,
+        disk_cache=disk_cache,
+        workers=workers,
+        graph=graph,
+        intern_table=intern_table,
+    )
 
-    return {
-        script.name: script
-        for script in (
-            load_script(
-                name=name,
-                path=path,
-                cache=cache,
-            )
-            for name in names
-        )
-    }
+    return loader.load(names=names)
 
 
-def load_script(name, path, cache=None, ancestors=None):
+def load_script(
+    name,
+    path,
+    cache=None,
+    ancestors=None,
+    disk_cache=None,
+    graph=None,
+    intern_table=None,
+):
     """
     Load a LUA script.
 
@@ -87,28 +201,125 @@ def load_script(name, path, cache=None, ancestors=None):
         those will be replaced with forward slashes silently.
     :param path: A path to search into for LUA scripts.
     :param cache: A cache of scripts to use to fasten loading. If `name` is in
-        the `cache`, then the result is the same as calling `cache[name]`.
+        the `cache`, then the result is the same as calling `cache[name]`. If
+        it is a :py:class:`ScriptCache <redis_lua.cache.ScriptCache>`
+        instance, concurrent loads of the same script only parse it once.
     :param ancestors: A list of names to consider as ancestors scripts.
+    :param disk_cache: A :py:class:`DiskCache
+        <redis_lua.disk_cache.DiskCache>` instance to look the script up into
+        before parsing it. Parsed scripts are stored into it.
+    :param graph: A :py:class:`DependencyGraph
+        <redis_lua.graph.DependencyGraph>` instance to add the loaded script,
+        and the scripts it includes, to.
+    :param intern_table: A :py:class:`ScriptInternTable
+        <redis_lua.intern.ScriptInternTable>` instance to share identical
+        scripts through, with other caches. If the script was loaded already
+        through it, from any cache, it is not parsed again.
     :return: A :py:class:`Script <redis_lua.script.Script>` instance.
     """
+    if isinstance(cache, ScriptCache):
+        script = cache.get(name)
+
+        if script is None:
+            name = name.replace(os.path.sep, '/')
+            script = cache.get_or_load(
+                name=name,
+                load=partial(
+                    _load_script,
+                    name=name,
+                    path=path,
+                    cache=cache,
+                    ancestors=ancestors,
+                    disk_cache=disk_cache,
+                    graph=graph,
+                    intern_table=intern_table,
+                ),
+            )
+
+        if graph is not None:
+            graph.add_script(script)
+
+        return script
+
     if cache:
         result = cache.get(name)
 
         if result:
+            if graph is not None:
+                graph.add_script(result)
+
             return result
 
     name = name.replace(os.path.sep, '/')
-    content = read_script(name=name, path=path)
 
-    return parse_script(
+    return _load_script(
         name=name,
-        content=content,
         path=path,
         cache=cache,
         ancestors=ancestors,
+        disk_cache=disk_cache,
+        graph=graph,
+        intern_table=intern_table,
     )
 
 
+def _load_script(
+    name,
+    path,
+    cache,
+    ancestors,
+    disk_cache,
+    graph,
+    intern_table,
+):
+    if disk_cache is not None:
+        if cache is None:
+            cache = {}
+
+        script = disk_cache.get(
+            name=name,
+            path=path,
+            get_script_by_name=partial(
+                load_script,
+                path=path,
+                cache=cache,
+                ancestors=(ancestors or []) + [name],
+                disk_cache=disk_cache,
+                graph=graph,
+                intern_table=intern_table,
+            ),
+        )
+
+        if script is not None:
+            cache[name] = script
+
+            if graph is not None:
+                graph.add_script(script)
+
+            return script
+
+    content = read_script_bytes(name=name, path=path)
+
+    try:
+        script = parse_script(
+            name=name,
+            content=content,
+            path=path,
+            cache=cache,
+            ancestors=ancestors,
+            disk_cache=disk_cache,
+            graph=graph,
+            intern_table=intern_table,
+        )
+    finally:
+        close_script_bytes(content)
+
+    if disk_cache is not None:
+        disk_cache.set(script=script, path=path)
+
+    return script
+
+
 def _get_cycle(name, ancestors):
     return ancestors[ancestors.index(name):] + [name]
 
@@ -119,12 +330,16 @@ def parse_script(
     path=None,
     cache=None,
     ancestors=None,
+    disk_cache=None,
+    graph=None,
+    intern_table=None,
 ):
     """
     Parse a LUA script.
 
     :param name: The name of the LUA script to parse.
-    :param content: The content of the script.
+    :param content: The content of the script. Can be text, or a bytes-like
+        object holding UTF-8 encoded text.
     :param path: The path of the script. Can be `None` if the script was loaded
         from memory. In this case, any included script must exist in the cache.
     :param cache: A dict of scripts that were already parsed. The resulting
@@ -132,6 +347,17 @@ def parse_script(
         the cache, it will be overriden.
     :param ancestors: A list of scripts that were called before this one. Used
         to detect infinite recursion.
+    :param disk_cache: A :py:class:`DiskCache
+        <redis_lua.disk_cache.DiskCache>` instance to load included scripts
+        through. Can only be used if `path` is specified.
+    :param graph: A :py:class:`DependencyGraph
+        <redis_lua.graph.DependencyGraph>` instance to add the parsed script,
+        and the scripts it includes, to.
+    :param intern_table: A :py:class:`ScriptInternTable
+        <redis_lua.intern.ScriptInternTable>` instance to share identical
+        scripts through, with other caches. The included scripts are loaded
+        first and, if an identical script was interned already, it is used
+        instead of parsing `content`.
     :return: A :py:class:`Script <redis_lua.script.Script>` instance.
     """
     if not ancestors:
@@ -144,58 +370,50 @@ def parse_script(
     if cache is None:
         cache = {}
 
-    script = ScriptParser().parse(
-        name=name,
-        content=content,
-        script_class=Script,
-        get_script_by_name=partial(
-            load_script,
-            path=path,
-            cache=cache,
-            ancestors=ancestors + [name],
-        ),
+    parser = ScriptParser()
+    load_include = partial(
+        load_script,
+        path=path,
+        cache=cache,
+        ancestors=ancestors + [name],
+        disk_cache=disk_cache,
+        graph=graph,
+        intern_table=intern_table,
     )
-    cache[name] = script
-
-    return script
-
+    key = None
+    script = None
+
+    if intern_table is not None:
+        key = intern_table.get_key(
+            name=name,
+            content=content,
+            includes=[
+                load_include(name=include)
+                for include in parser.parse_includes(
+                    content=content,
+                    current_path=posixpath.dirname(name),
+                )
+            ],
+        )
+        script = intern_table.get(key)
+
+    if script is None:
+        script = parser.parse(
+            name=name,
+            content=content,
+            script_class=Script,
+            get_script_by_name=load_include,
+        )
 
-def read_script(name, path, encoding=None):
-    """
-    Read a LUA script.
+        if key is not None:
+            script = intern_table.add(key, script)
 
-    :param name: The name of the LUA script to load, relative to the search
-        `paths`, without the '.lua' extension. `name` may contain forward slash
-        path separators to indicate that the script is to be found in a
-        sub-directory.
-    :param path: A path to search into for LUA scripts.
-    :param encoding: The encoding to use to read the file. If none is
-        specified, UTF-8 is assumed.
-    :return: The content of the script.
-    :raises: If no such script is found, a
-        :py:class:`ScriptNotFoundError
-        <redis_lua.exceptions.ScriptNotFoundError>` is thrown.
-    """
-    assert path is not None
-
-    filename = os.path.normpath(os.path.join(
-        path,
-        "{}.lua".format(name.replace('/', os.path.sep)),
-    ))
+    cache[name] = script
 
-    if encoding is None:
-        encoding = 'utf-8'
+    if graph is not None:
+        graph.add_script(script)
 
-    try:
-        if six.PY2:
-            with open(filename) as _file:
-                return _file.read().decode(encoding)
-        else:
-            with open(filename, encoding=encoding) as _file:
-                return _file.read()
-
-    except IOError:
-        raise ScriptNotFoundError(name=name, filename=filename)
+    return script
 
 
 def run_code(
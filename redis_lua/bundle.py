@@ -0,0 +1,453 @@
+"""
+Precompiled bundles of scripts.
+
+A bundle is a single file that holds, for a set of scripts and all the scripts
+they include, everything needed to run them: the rendered text and its SHA1,
+the keys, the arguments and their types, the return type and the line map
+used to translate errors. Loading a bundle neither walks the filesystem nor
+parses any script.
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import tempfile
+
+try:  # pragma: no cover
+    from collections.abc import Mapping
+except ImportError:  # pragma: no cover
+    from collections import Mapping
+
+from .disk_cache import get_included_scripts
+from .files import _replace
+from .regions import (
+    ArgumentRegion,
+    FloatArray,
+    Hash,
+    IntegerArray,
+    MessagePack,
+    ReturnRegion,
+    ScriptRegion,
+    TextRegion,
+)
+from .render import SourceMap
+from .script import Script
+
+TYPE_NAMES = {
+    str: 'str',
+    int: 'int',
+    bool: 'bool',
+    list: 'list',
+    dict: 'dict',
+    MessagePack: 'msgpack',
+    IntegerArray: 'int_array',
+    FloatArray: 'float_array',
+    Hash: 'hash',
+}
+
+
+def get_script_record(script, offset):
+    """
+    Get the bundle record of a script.
+
+    :param script: The :py:class:`Script <redis_lua.script.Script>` instance.
+    :param offset: The offset, in the bundle blobs, at which the blobs of the
+        script are to be written.
+    :return: A (record, blobs) tuple, where `record` is a dict that can be
+        serialized to JSON and `blobs` a list of the blobs of the script.
+    """
+    render = script.rendered_bytes
+    source_map = script.source_map
+    sources = json.dumps({
+        'sources': [info.region.content for info in script.line_infos],
+        'frames': [
+            [frame_script.name, parent, real_line]
+            for frame_script, parent, real_line in source_map.frames
+        ],
+        'line_frames': list(source_map.line_frames),
+        'real_lines': list(source_map.real_lines),
+    }).encode('utf-8')
+
+    return {
+        'name': script.name,
+        'digest': script.digest,
+        'sha1': script.sha1,
+        'keys': list(script.keys),
+        'args': [[name, TYPE_NAMES[type_]] for name, type_ in script.args],
+        'return_type': TYPE_NAMES.get(script.return_type),
+        'multiple_inclusion': script.multiple_inclusion,
+        'line_count': script.line_count,
+        'real_line_count': script.real_line_count,
+        'lines': [
+            [
+                info.real_line,
+                info.real_line_count,
+                info.line,
+                info.line_count,
+                info.region.script.name
+                if isinstance(info.region, ScriptRegion) else None,
+            ]
+            for info in script.line_infos
+        ],
+        'render': [offset, len(render)],
+        'sources': [offset + len(render), len(sources)],
+    }, [render, sources]
+
+
+def write_bundle(scripts, filename):
+    """
+    Write a bundle file.
+
+    :param scripts: A dict of :py:class:`Script <redis_lua.script.Script>`
+        instances, indexed by name. The scripts they include are written to
+        the bundle as well, but are only reachable through them.
+    :param filename: The bundle filename. It is replaced atomically.
+    """
+    all_scripts = dict(scripts)
+
+    for script in scripts.values():
+        all_scripts.update(get_included_scripts(script))
+
+    records = []
+    blobs = []
+    offset = 0
+
+    for name in sorted(all_scripts):
+        record, script_blobs = get_script_record(
+            script=all_scripts[name],
+            offset=offset,
+        )
+        records.append(record)
+        blobs.extend(script_blobs)
+        offset += sum(len(blob) for blob in script_blobs)
+
+    index = json.dumps({
+        'version': ScriptBundle.VERSION,
+        'names': sorted(scripts),
+        'scripts': records,
+    }).encode('utf-8')
+
+    fd, tmp_filename = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(filename)),
+        suffix='.tmp',
+    )
+
+    try:
+        with os.fdopen(fd, 'wb') as _file:
+            _file.write(ScriptBundle.MAGIC)
+            _file.write(struct.pack('<I', len(index)))
+            _file.write(index)
+
+            for blob in blobs:
+                _file.write(blob)
+
+        _replace(tmp_filename, filename)
+    except Exception:
+        os.remove(tmp_filename)
+        raise
+
+
+def build_bundle(path, filename, include=None, exclude=None, workers=None):
+    """
+    Compile all the LUA scripts found at a location into a bundle file.
+
+    :param path: A path to search into for LUA scripts.
+    :param filename: The bundle filename. It is replaced atomically.
+    :param include: An iterable of glob patterns. If specified, only the
+        scripts whose name matches one of them are bundled.
+    :param exclude: An iterable of glob patterns. The scripts and directories
+        whose name matches one of them are skipped.
+    :param workers: The number of threads to use to read script files
+        concurrently. If `None`, files are read sequentially.
+    :return: A dict of the bundled scripts, indexed by name.
+    """
+    from . import load_all_scripts
+
+    scripts = load_all_scripts(
+        path=path,
+        workers=workers,
+        include=include,
+        exclude=exclude,
+    )
+    write_bundle(scripts=scripts, filename=filename)
+
+    return scripts
+
+
+def load_bundle(filename):
+    """
+    Load a bundle file.
+
+    :param filename: The bundle filename.
+    :return: A :py:class:`ScriptBundle <redis_lua.bundle.ScriptBundle>`
+        instance.
+    """
+    return ScriptBundle(filename=filename)
+
+
+class BundledScript(Script):
+    """
+    A script loaded from a bundle.
+
+    Bundled scripts can be run, and their errors translated, exactly like
+    scripts loaded from their source files. They have no regions: their text
+    can only be rendered as it was when the bundle was built.
+    """
+
+    __slots__ = [
+        'bundle',
+        'record',
+    ]
+
+    def __init__(self, bundle, record):
+        """
+        Create a new bundled script.
+
+        :param bundle: The :py:class:`ScriptBundle
+            <redis_lua.bundle.ScriptBundle>` the script belongs to.
+        :param record: The record of the script in the bundle index.
+        """
+        return_type = record['return_type']
+
+        self.name = record['name']
+        self.digest = record['digest']
+        self.keys = record['keys']
+        self.args = [
+            (name, ArgumentRegion.get_valid_type(type_))
+            for name, type_ in record['args']
+        ]
+        self.return_type = (
+            None if return_type is None
+            else ReturnRegion.get_valid_type(return_type)
+        )
+        self.multiple_inclusion = record['multiple_inclusion']
+        self.included_scripts = frozenset()
+        self.line_infos = None
+        self.line_starts = None
+        self.real_line_starts = None
+        self.regions = []
+        self._render = None
+        self._rendered_bytes = None
+        self._source_map = None
+        self._sha1 = record['sha1']
+        self._renderings = None
+        self._line_counts = None
+        self.bundle = bundle
+        self.record = record
+
+    @property
+    def line_count(self):
+        return self.record['line_count']
+
+    @property
+    def real_line_count(self):
+        return self.record['real_line_count']
+
+    def load_line_map(self):
+        """
+        Load the line information and the source map of the script.
+
+        They are only decoded when an error must be translated.
+        """
+        blob = json.loads(self.bundle.get_blob(*self.record['sources']))
+        line_infos = []
+
+        for entry, content in zip(self.record['lines'], blob['sources']):
+            real_line, real_line_count, line, line_count, include = entry
+
+            if include is None:
+                region = TextRegion(content=content)
+            else:
+                region = ScriptRegion(
+                    script=self.bundle.scripts[include],
+                    content=content,
+                )
+
+            line_infos.append(
+                self._LineInfo(
+                    real_line,
+                    real_line,
+                    real_line_count,
+                    line,
+                    line,
+                    line_count,
+                    region,
+                ),
+            )
+
+        source_map = SourceMap()
+        source_map.frames = [
+            (self.bundle.scripts[name], parent, real_line)
+            for name, parent, real_line in blob['frames']
+        ]
+        source_map.line_frames.extend(blob['line_frames'])
+        source_map.real_lines.extend(blob['real_lines'])
+
+        self.line_infos = line_infos
+        self.line_starts = [info.line for info in line_infos]
+        self.real_line_starts = [info.real_line for info in line_infos]
+        self._source_map = source_map
+
+    def find_line_info(self, line):
+        if self.line_infos is None:
+            self.load_line_map()
+
+        return super(BundledScript, self).find_line_info(line)
+
+    def find_real_line_info(self, real_line):
+        if self.line_infos is None:
+            self.load_line_map()
+
+        return super(BundledScript, self).find_real_line_info(real_line)
+
+    @property
+    def source_map(self):
+        if self._source_map is None:
+            self.load_line_map()
+
+        return self._source_map
+
+    def render(self, context=None):
+        if context is not None:
+            raise ValueError(
+                "Bundled script %s cannot be rendered with a custom context" %
+                self,
+            )
+
+        if self._render is None:
+            self._render = self.bundle.get_blob(*self.record['render'])
+
+        return self._render
+
+
+class ScriptBundle(Mapping):
+    """
+    A read-only mapping of the scripts of a bundle file.
+
+    The file is memory-mapped and only its index is decoded when the bundle
+    is loaded. The rendered text of a script is only decoded when the script
+    is first run.
+    """
+
+    MAGIC = b'RLUABNDL'
+    VERSION = 3
+
+    def __init__(self, filename):
+        """
+        Load a bundle file.
+
+        :param filename: The bundle filename.
+        :raises: A `ValueError` if the file is not a valid bundle.
+        """
+        with open(filename, 'rb') as _file:
+            try:
+                self.data = mmap.mmap(
+                    _file.fileno(),
+                    0,
+                    access=mmap.ACCESS_READ,
+                )
+            except ValueError:
+                raise ValueError("Not a script bundle: %r" % filename)
+
+        header_size = len(self.MAGIC) + 4
+
+        if self.data[:len(self.MAGIC)] != self.MAGIC:
+            self.data.close()
+
+            raise ValueError("Not a script bundle: %r" % filename)
+
+        index_size, = struct.unpack(
+            '<I',
+            self.data[len(self.MAGIC):header_size],
+        )
+        index = json.loads(
+            self.data[header_size:header_size + index_size].decode('utf-8'),
+        )
+
+        if index['version'] != self.VERSION:
+            self.data.close()
+
+            raise ValueError(
+                "Unsupported script bundle version %r in %r" % (
+                    index['version'],
+                    filename,
+                ),
+            )
+
+        self.filename = filename
+        self.offset = header_size + index_size
+        self.scripts = {
+            record['name']: BundledScript(bundle=self, record=record)
+            for record in index['scripts']
+        }
+        self.names = frozenset(index['names'])
+
+    def __repr__(self):
+        return '{_class}(filename={self.filename!r})'.format(
+            _class=self.__class__.__name__,
+            self=self,
+        )
+
+    def __getitem__(self, name):
+        if name not in self.names:
+            raise KeyError(name)
+
+        return self.scripts[name]
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def get_blob(self, offset, length):
+        start = self.offset + offset
+
+        return self.data[start:start + length].decode('utf-8')
+
+    def close(self):
+        """
+        Release the memory-mapped file.
+
+        The scripts of the bundle can't be rendered afterwards, unless they
+        were rendered already.
+        """
+        self.data.close()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Compile a directory of LUA scripts into a bundle file.",
+    )
+    parser.add_argument('path', help="The directory to search for scripts.")
+    parser.add_argument('filename', help="The bundle file to write.")
+    parser.add_argument(
+        '--include',
+        action='append',
+        help="A glob pattern of script names to bundle. Can be repeated.",
+    )
+    parser.add_argument(
+        '--exclude',
+        action='append',
+        help="A glob pattern of script names to skip. Can be repeated.",
+    )
+    args = parser.parse_args(args)
+
+    scripts = build_bundle(
+        path=args.path,
+        filename=args.filename,
+        include=args.include,
+        exclude=args.exclude,
+    )
+    print("Bundled %d script(s) into %s." % (len(scripts), args.filename))
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
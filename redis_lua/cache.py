@@ -0,0 +1,258 @@
+"""
+A bounded, thread-safe cache of scripts.
+"""
+
+import threading
+
+from collections import (
+    OrderedDict,
+    namedtuple,
+)
+
+try:  # pragma: no cover
+    from collections.abc import MutableMapping
+except ImportError:  # pragma: no cover
+    from collections import MutableMapping
+
+from .graph import get_direct_includes
+
+CacheStats = namedtuple(
+    'CacheStats',
+    ['hits', 'misses', 'evictions', 'count', 'size'],
+)
+
+
+def get_script_size(script):
+    """
+    Get the size of a script, as accounted for by a cache.
+
+    :param script: The script.
+    :return: The length of the script source, without the scripts it
+        includes.
+    """
+    return sum(len(region.content) for region in script.regions)
+
+
+class ScriptCache(MutableMapping):
+    """
+    A cache of scripts that can be used wherever a `cache` dict is accepted.
+
+    The cache can be bounded by a number of scripts, a total size, or both.
+    When a bound is exceeded, the least recently used scripts are evicted
+    first. Scripts that are included by other scripts of the cache are pinned
+    and never evicted.
+
+    All operations are thread-safe. When several threads load the same script
+    concurrently through the cache, only one of them parses it and the others
+    wait for its result.
+    """
+
+    def __init__(self, max_count=None, max_size=None):
+        """
+        Create a new script cache.
+
+        :param max_count: The maximum number of scripts to keep. If `None`,
+            the number of scripts is not bounded.
+        :param max_size: The maximum total size of the scripts to keep, as
+            given by :py:func:`get_script_size
+            <redis_lua.cache.get_script_size>`. If `None`, the total size is
+            not bounded.
+        """
+        self.max_count = max_count
+        self.max_size = max_size
+        self.scripts = OrderedDict()
+        self.sizes = {}
+        self.size = 0
+        self.pins = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.RLock()
+        self.condition = threading.Condition(self.lock)
+        self.flights = {}
+        self.waiting = {}
+
+    def __repr__(self):
+        return (
+            '{_class}(max_count={self.max_count!r}, '
+            'max_size={self.max_size!r})'
+        ).format(
+            _class=self.__class__.__name__,
+            self=self,
+        )
+
+    def __getitem__(self, name):
+        with self.lock:
+            script = self.scripts.pop(name, None)
+
+            if script is None:
+                self.misses += 1
+
+                raise KeyError(name)
+
+            self.scripts[name] = script
+            self.hits += 1
+
+            return script
+
+    def __setitem__(self, name, script):
+        with self.lock:
+            self.remove(name=name)
+            self.scripts[name] = script
+            self.sizes[name] = get_script_size(script)
+            self.size += self.sizes[name]
+
+            for include in get_direct_includes(script):
+                self.pins[include] = self.pins.get(include, 0) + 1
+
+            self.evict()
+
+    def __delitem__(self, name):
+        with self.lock:
+            if name not in self.scripts:
+                raise KeyError(name)
+
+            self.remove(name=name)
+
+    def __contains__(self, name):
+        with self.lock:
+            return name in self.scripts
+
+    def __iter__(self):
+        with self.lock:
+            return iter(list(self.scripts))
+
+    def __len__(self):
+        with self.lock:
+            return len(self.scripts)
+
+    def remove(self, name):
+        script = self.scripts.pop(name, None)
+
+        if script is not None:
+            self.size -= self.sizes.pop(name)
+
+            for include in get_direct_includes(script):
+                self.pins[include] -= 1
+
+                if not self.pins[include]:
+                    del self.pins[include]
+
+    def is_full(self):
+        return (
+            self.max_count is not None and
+            len(self.scripts) > self.max_count
+        ) or (
+            self.max_size is not None and
+            self.size > self.max_size
+        )
+
+    def evict(self):
+        # The most recently used script is never evicted, so that a script
+        # can always be loaded, even if it alone exceeds the bounds.
+        while self.is_full():
+            candidates = list(self.scripts)[:-1]
+
+            for name in candidates:
+                if name not in self.pins:
+                    self.remove(name=name)
+                    self.evictions += 1
+                    break
+            else:
+                break
+
+    def is_deadlock(self, name):
+        # Waiting for a script would deadlock if the thread that loads it is,
+        # directly or not, waiting for a script that the current thread
+        # loads. This only happens when scripts include each other.
+        current = threading.current_thread()
+
+        while name in self.flights:
+            owner = self.flights[name]
+
+            if owner is current:
+                return True
+
+            name = self.waiting.get(owner)
+
+        return False
+
+    def get_or_load(self, name, load):
+        """
+        Get a script from the cache, or load it if it is missing.
+
+        If another thread is loading the same script already, the call waits
+        for it to finish instead of loading the script a second time. Cache
+        hits and misses are not counted.
+
+        :param name: The name of the script.
+        :param load: A callable without arguments that loads the script.
+        :return: The script.
+        """
+        current = threading.current_thread()
+        owner = False
+
+        with self.lock:
+            while True:
+                script = self.scripts.get(name)
+
+                if script is not None:
+                    return script
+
+                if name not in self.flights:
+                    self.flights[name] = current
+                    owner = True
+                    break
+
+                if self.is_deadlock(name=name):
+                    break
+
+                self.waiting[current] = name
+
+                try:
+                    self.condition.wait()
+                finally:
+                    del self.waiting[current]
+
+        try:
+            script = load()
+        except BaseException:
+            if owner:
+                with self.lock:
+                    del self.flights[name]
+                    self.condition.notify_all()
+
+            raise
+
+        with self.lock:
+            self[name] = script
+
+            if owner:
+                del self.flights[name]
+                self.condition.notify_all()
+
+        return script
+
+    def clear(self):
+        with self.lock:
+            self.scripts.clear()
+            self.sizes.clear()
+            self.size = 0
+            self.pins.clear()
+
+    def get_stats(self):
+        """
+        Get the cache statistics.
+
+        :return: A `CacheStats` named tuple with the number of `hits`,
+            `misses` and `evictions` so far, and the number of scripts
+            (`count`) and total `size` of the cache.
+        """
+        with self.lock:
+            return CacheStats(
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                count=len(self.scripts),
+                size=self.size,
+            )
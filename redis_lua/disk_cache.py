@@ -0,0 +1,288 @@
+"""
+Persistent, on-disk cache of parsed scripts.
+"""
+
+import hashlib
+import os
+import tempfile
+
+from collections import namedtuple
+from six.moves import cPickle
+
+from .files import (
+    _replace,
+    get_script_filename,
+)
+from .regions import ScriptRegion
+from .script import Script
+
+# Stands for a `ScriptRegion` in a cache entry, so that included scripts are
+# stored by name rather than along with every script that includes them.
+IncludeReference = namedtuple('IncludeReference', ['name', 'content'])
+
+
+def get_file_digest(filename):
+    """
+    Get the SHA1 digest of a file content.
+
+    :param filename: The file to hash.
+    :return: The hexadecimal digest.
+    """
+    with open(filename, 'rb') as _file:
+        return hashlib.sha1(_file.read()).hexdigest()
+
+
+def get_included_scripts(script):
+    """
+    Get all the scripts that a script includes, directly or not.
+
+    :param script: The script.
+    :return: A dict of the included scripts, indexed by name.
+    """
+    result = {}
+    stack = [script]
+
+    while stack:
+        for region in stack.pop().regions:
+            if isinstance(region, ScriptRegion):
+                name = region.script.name
+
+                if name not in result:
+                    result[name] = region.script
+                    stack.append(region.script)
+
+    return result
+
+
+class DiskCache(object):
+    """
+    A persistent cache of parsed and rendered scripts.
+
+    Each entry stores the regions of a script, its digest, its rendered text
+    and the SHA1 of that text. Included scripts are only stored by name: they
+    have their own entries, and are resolved when the entry is read, so that a
+    script included by many others is still loaded once. An entry is keyed by
+    the search path and the script name and remembers the modification time,
+    size and content digest of the script file and of every file it includes,
+    directly or not. Changing any of those files invalidates the entry.
+
+    Failing to read or write entries is never an error: the cache simply
+    behaves as if the entry did not exist.
+    """
+
+    VERSION = 10
+
+    def __init__(self, directory):
+        """
+        Create a new disk cache.
+
+        :param directory: The directory to store the cache entries into. It
+            is created if it does not exist.
+        """
+        self.directory = directory
+
+    def __repr__(self):
+        return '{_class}(directory={self.directory!r})'.format(
+            _class=self.__class__.__name__,
+            self=self,
+        )
+
+    def get_entry_filename(self, name, path):
+        """
+        Get the filename of the cache entry for a script.
+
+        :param name: The name of the script.
+        :param path: The search path the script was loaded from.
+        :return: The filename of the cache entry.
+        """
+        key = hashlib.sha1(
+            u'{}\0{}'.format(os.path.abspath(path), name).encode('utf-8'),
+        ).hexdigest()
+
+        return os.path.join(self.directory, key + '.pickle')
+
+    @staticmethod
+    def get_fingerprint(filename):
+        stat = os.stat(filename)
+
+        return stat.st_mtime, stat.st_size
+
+    @classmethod
+    def is_dependency_valid(cls, filename, fingerprint, digest):
+        try:
+            if cls.get_fingerprint(filename) == fingerprint:
+                return True
+
+            # The file was touched: it is still valid if its content did not
+            # change.
+            return get_file_digest(filename) == digest
+        except (IOError, OSError):
+            return False
+
+    def get(self, name, path, get_script_by_name):
+        """
+        Get a script from the cache.
+
+        :param name: The name of the script.
+        :param path: The search path the script is to be loaded from.
+        :param get_script_by_name: A callable that takes a named `name`
+            argument (the name of an included script) and returns a
+            :py:class:`Script <redis_lua.script.Script>` instance.
+        :return: A :py:class:`Script <redis_lua.script.Script>` instance or
+            `None` if the cache holds no valid entry for that script.
+        """
+        entry = self.get_entry(name=name, path=path)
+
+        if entry is None:
+            return None
+
+        return self.get_script(
+            entry=entry,
+            get_script_by_name=get_script_by_name,
+        )
+
+    def get_entry(self, name, path):
+        """
+        Get the entry of a script from the cache, without resolving the
+        scripts it includes.
+
+        :param name: The name of the script.
+        :param path: The search path the script is to be loaded from.
+        :return: The entry, or `None` if the cache holds no valid entry for
+            that script. The `includes` key of the entry holds the names of
+            the scripts that the script includes directly, in order of
+            inclusion.
+        """
+        filename = self.get_entry_filename(name=name, path=path)
+
+        try:
+            with open(filename, 'rb') as _file:
+                entry = cPickle.load(_file)
+        except Exception:
+            return None
+
+        if not isinstance(entry, dict):
+            return None
+
+        if entry.get('version') != self.VERSION:
+            return None
+
+        for dependency in entry['dependencies']:
+            if not self.is_dependency_valid(**dependency):
+                return None
+
+        return entry
+
+    @staticmethod
+    def get_script(entry, get_script_by_name):
+        """
+        Get the script of a cache entry.
+
+        :param entry: The entry, as returned by :py:meth:`get_entry`.
+        :param get_script_by_name: A callable that takes a named `name`
+            argument (the name of an included script) and returns a
+            :py:class:`Script <redis_lua.script.Script>` instance.
+        :return: A :py:class:`Script <redis_lua.script.Script>` instance, or
+            `None` if the included scripts differ from the ones the entry was
+            stored with.
+        """
+        regions = [
+            ScriptRegion(
+                script=get_script_by_name(name=region.name),
+                content=region.content,
+            )
+            if isinstance(region, IncludeReference) else
+            region
+            for region in entry['regions']
+        ]
+        script = Script(name=entry['name'], regions=regions)
+
+        if script.digest != entry['digest']:
+            return None
+
+        # Same digest, same rendering: no need to render it again.
+        script._render = entry['render']
+        script._sha1 = entry['sha1']
+
+        return script
+
+    def set(self, script, path):
+        """
+        Store a script in the cache.
+
+        :param script: The :py:class:`Script <redis_lua.script.Script>`
+            instance to store.
+        :param path: The search path the script was loaded from.
+        """
+        names = [script.name]
+        names.extend(sorted(get_included_scripts(script)))
+
+        try:
+            dependencies = []
+
+            for name in names:
+                filename = get_script_filename(name=name, path=path)
+                dependencies.append({
+                    'filename': filename,
+                    'fingerprint': self.get_fingerprint(filename),
+                    'digest': get_file_digest(filename),
+                })
+
+            entry = {
+                'version': self.VERSION,
+                'name': script.name,
+                'dependencies': dependencies,
+                'regions': [
+                    IncludeReference(
+                        name=region.script.name,
+                        content=region.content,
+                    )
+                    if isinstance(region, ScriptRegion) else
+                    region
+                    for region in script.regions
+                ],
+                'includes': [
+                    region.script.name
+                    for region in script.regions
+                    if isinstance(region, ScriptRegion)
+                ],
+                'digest': script.digest,
+                'render': script.render(),
+                'sha1': script.sha1,
+            }
+
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+
+            fd, tmp_filename = tempfile.mkstemp(
+                dir=self.directory,
+                suffix='.tmp',
+            )
+
+            try:
+                with os.fdopen(fd, 'wb') as _file:
+                    cPickle.dump(entry, _file, cPickle.HIGHEST_PROTOCOL)
+
+                _replace(
+                    tmp_filename,
+                    self.get_entry_filename(name=script.name, path=path),
+                )
+            except Exception:
+                os.remove(tmp_filename)
+                raise
+
+        except (IOError, OSError, cPickle.PicklingError):
+            pass
+
+    def clear(self):
+        """
+        Remove all the entries from the cache.
+        """
+        try:
+            filenames = os.listdir(self.directory)
+        except (IOError, OSError):
+            return
+
+        for filename in filenames:
+            if filename.endswith('.pickle'):
+                os.remove(os.path.join(self.directory, filename))
@@ -34,28 +34,32 @@ class CyclicDependencyError(RuntimeError):
 
 
 class ScriptError(ResponseError):
-    def __init__(self, script, line, lua_error, message):
+    def __init__(self, script, line, lua_error, message, source_map=None):
         super(ScriptError, self).__init__(message)
         self.message = message
         self.script = script
         self.line = line
         self.lua_error = lua_error
+        self.source_map = source_map
 
     def __str__(self):
         result = [
             self.lua_error,
             "LUA Traceback (most recent script last):",
         ]
-        scripts_lines = self.script.get_scripts_for_line(self.line)
+        source_map = self.source_map
 
-        for script, line in scripts_lines:
+        if source_map is None:
+            source_map = self.script.source_map
+
+        for script, line in source_map.get_scripts_for_line(self.line):
             result.extend(
                 [
                     '  Script "{script.name}", line {line}'.format(
                         script=script,
                         line=line,
                     ),
-                    "    %s" % script.get_real_line_content(line).strip(),
+                    "    %s" % script.get_source_line(line).strip(),
                 ],
             )
 
@@ -100,11 +104,14 @@ def parse_response_error_message(message):
 
 
 @contextmanager
-def error_handler(script):
+def error_handler(script, source_map=None):
     """
     Wraps LUA script errors into a more human-friendly exception.
 
     :param script: The top-level script that is being run.
+    :param source_map: The :py:class:`SourceMap
+        <redis_lua.render.SourceMap>` of the text that is being run. If
+        `None`, the text is assumed to be the default rendering of `script`.
     :yields: The script instance.
     """
     try:
@@ -118,6 +125,7 @@ def error_handler(script):
                 line=error_info['line'],
                 lua_error=error_info['lua_error'],
                 message=error_info['error'],
+                source_map=source_map,
             )
 
         raise
@@ -0,0 +1,194 @@
+"""
+Filesystem helpers.
+"""
+
+import mmap
+import os
+import six
+
+from fnmatch import fnmatchcase
+
+try:  # pragma: no cover
+    from os import scandir
+except ImportError:  # pragma: no cover
+    from scandir import scandir
+
+from .exceptions import ScriptNotFoundError
+
+SCRIPT_EXTENSION = '.lua'
+
+# Files smaller than this are read at once, as mapping them costs more than it
+# saves.
+MMAP_THRESHOLD = 64 * 1024
+
+# Python 2 has no atomic replace that works on every platform.
+_replace = getattr(os, 'replace', os.rename)
+
+
+def get_script_filename(name, path):
+    """
+    Get the filename of a LUA script.
+
+    :param name: The name of the LUA script, relative to the search `path`,
+        without the '.lua' extension. `name` may contain forward slash path
+        separators to indicate that the script is to be found in a
+        sub-directory.
+    :param path: A path to search into for LUA scripts.
+    :return: The filename of the script.
+    """
+    return os.path.normpath(os.path.join(
+        path,
+        "{}.lua".format(name.replace('/', os.path.sep)),
+    ))
+
+
+def matches_any(name, patterns):
+    """
+    Check whether a name matches any of some glob patterns.
+
+    :param name: The name to check.
+    :param patterns: An iterable of glob patterns, as understood by
+        `fnmatch`. Note that `*` also matches forward slashes.
+    :return: `True` if `name` matches at least one pattern.
+    """
+    return any(fnmatchcase(name, pattern) for pattern in patterns)
+
+
+def iter_script_entries(path, include=None, exclude=None):
+    """
+    Iterate over all the LUA scripts found at the specified location.
+
+    Only files with a '.lua' extension are considered. Directories are walked
+    with `scandir`, which avoids most of the system calls `os.walk` does, and
+    scripts are yielded as soon as they are found. As with `os.walk`, symbolic
+    links to directories are not followed.
+
+    :param path: A path to search into for LUA scripts.
+    :param include: An iterable of glob patterns. If specified, only the
+        scripts whose name matches one of them are yielded.
+    :param exclude: An iterable of glob patterns. The scripts whose name
+        matches one of them are not yielded, and the directories whose path,
+        relative to `path`, matches one of them are not walked.
+    :yields: (name, entry) tuples where `name` is the script name, relative to
+        `path`, without its '.lua' extension and using forward slashes as path
+        separators, and `entry` is the matching `os.DirEntry` instance.
+    """
+    include = list(include or [])
+    exclude = list(exclude or [])
+    stack = ['']
+
+    while stack:
+        prefix = stack.pop()
+
+        for entry in scandir(os.path.join(path, prefix) if prefix else path):
+            if entry.is_dir(follow_symlinks=False):
+                if not matches_any(prefix + entry.name, exclude):
+                    stack.append(prefix + entry.name + '/')
+            elif entry.name.endswith(SCRIPT_EXTENSION):
+                name = prefix + entry.name[:-len(SCRIPT_EXTENSION)]
+
+                if include and not matches_any(name, include):
+                    continue
+
+                if not matches_any(name, exclude):
+                    yield name, entry
+
+
+def iter_script_names(path, include=None, exclude=None):
+    """
+    Iterate over the names of all the LUA scripts found at the specified
+    location.
+
+    :param path: A path to search into for LUA scripts.
+    :param include: An iterable of glob patterns. If specified, only the
+        scripts whose name matches one of them are yielded.
+    :param exclude: An iterable of glob patterns. The scripts and directories
+        whose name matches one of them are skipped.
+    :yields: Script names, relative to `path`, without their '.lua' extension
+        and using forward slashes as path separators.
+    """
+    for name, _ in iter_script_entries(
+        path,
+        include=include,
+        exclude=exclude,
+    ):
+        yield name
+
+
+def read_script(name, path, encoding=None):
+    """
+    Read a LUA script.
+
+    :param name: The name of the LUA script to load, relative to the search
+        `paths`, without the '.lua' extension. `name` may contain forward slash
+        path separators to indicate that the script is to be found in a
+        sub-directory.
+    :param path: A path to search into for LUA scripts.
+    :param encoding: The encoding to use to read the file. If none is
+        specified, UTF-8 is assumed.
+    :return: The content of the script.
+    :raises: If no such script is found, a
+        :py:class:`ScriptNotFoundError
+        <redis_lua.exceptions.ScriptNotFoundError>` is thrown.
+    """
+    assert path is not None
+
+    filename = get_script_filename(name=name, path=path)
+
+    if encoding is None:
+        encoding = 'utf-8'
+
+    try:
+        if six.PY2:
+            with open(filename) as _file:
+                return _file.read().decode(encoding)
+        else:
+            with open(filename, encoding=encoding) as _file:
+                return _file.read()
+
+    except IOError:
+        raise ScriptNotFoundError(name=name, filename=filename)
+
+
+def read_script_bytes(name, path):
+    """
+    Read a LUA script, without decoding it.
+
+    Large files are memory-mapped rather than read, so that the parser can
+    scan them without copying them first.
+
+    :param name: The name of the LUA script to load, relative to the search
+        `path`, without the '.lua' extension. `name` may contain forward slash
+        path separators to indicate that the script is to be found in a
+        sub-directory.
+    :param path: A path to search into for LUA scripts.
+    :return: The content of the script, as a bytes-like object. It must be
+        released with :py:func:`close_script_bytes` once parsed.
+    :raises: If no such script is found, a
+        :py:class:`ScriptNotFoundError
+        <redis_lua.exceptions.ScriptNotFoundError>` is thrown.
+    """
+    assert path is not None
+
+    filename = get_script_filename(name=name, path=path)
+
+    try:
+        with open(filename, 'rb') as _file:
+            if os.fstat(_file.fileno()).st_size < MMAP_THRESHOLD:
+                return _file.read()
+
+            return mmap.mmap(_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    except (IOError, OSError):
+        raise ScriptNotFoundError(name=name, filename=filename)
+
+
+def close_script_bytes(content):
+    """
+    Release the content of a LUA script read by :py:func:`read_script_bytes`.
+
+    :param content: The content of the script. If it is memory-mapped, the
+        mapping is closed. Closing it more than once is harmless.
+    """
+    if isinstance(content, mmap.mmap):
+        content.close()
@@ -0,0 +1,216 @@
+"""
+Include dependency graph between scripts.
+"""
+
+from collections import namedtuple
+
+from .regions import ScriptRegion
+
+DependencyStats = namedtuple('DependencyStats', ['fan_in', 'fan_out'])
+
+
+def get_direct_includes(script):
+    """
+    Get the scripts that a script includes directly.
+
+    :param script: The script.
+    :return: A dict of the included scripts, indexed by name.
+    """
+    return {
+        region.script.name: region.script
+        for region in script.regions
+        if isinstance(region, ScriptRegion)
+    }
+
+
+class DependencyGraph(object):
+    """
+    The include graph of a set of scripts.
+
+    The graph keeps both forward (`includes`) and reverse (`dependents`)
+    edges so that every query only costs as much as the part of the graph it
+    affects.
+
+    A graph can be filled as scripts get loaded, by passing it to any of the
+    loading functions.
+    """
+
+    def __init__(self):
+        self.scripts = {}
+        self.includes = {}
+        self.dependents = {}
+
+    def __repr__(self):
+        return '{_class}(scripts={scripts!r})'.format(
+            _class=self.__class__.__name__,
+            scripts=sorted(self.scripts),
+        )
+
+    def __contains__(self, name):
+        return name in self.scripts
+
+    def __iter__(self):
+        return iter(self.scripts)
+
+    def __len__(self):
+        return len(self.scripts)
+
+    def add_script(self, script):
+        """
+        Add a script, and all the scripts it includes, to the graph.
+
+        If a script with the same name is in the graph already, its edges are
+        replaced. Included scripts that are in the graph already, as the exact
+        same instance, are not visited again.
+
+        :param script: The :py:class:`Script <redis_lua.script.Script>`
+            instance to add.
+        """
+        stack = [script]
+
+        while stack:
+            script = stack.pop()
+            includes = get_direct_includes(script)
+            self.remove_edges(name=script.name)
+            self.scripts[script.name] = script
+            self.includes[script.name] = set(includes)
+
+            for name, include in includes.items():
+                self.dependents.setdefault(name, set()).add(script.name)
+
+                if self.scripts.get(name) is not include:
+                    stack.append(include)
+
+    def remove_script(self, name):
+        """
+        Remove a script from the graph.
+
+        The scripts that include it keep their edges to it.
+
+        :param name: The name of the script to remove.
+        """
+        self.remove_edges(name=name)
+        self.scripts.pop(name, None)
+        self.includes.pop(name, None)
+
+    def remove_edges(self, name):
+        for include in self.includes.get(name, ()):
+            dependents = self.dependents[include]
+            dependents.discard(name)
+
+            if not dependents:
+                del self.dependents[include]
+
+    def get_includes(self, name):
+        """
+        Get the names of the scripts that a script includes directly.
+
+        :param name: The name of the script.
+        :return: A set of script names.
+        """
+        return set(self.includes.get(name, ()))
+
+    def get_dependents(self, name):
+        """
+        Get the names of the scripts that include a script directly.
+
+        :param name: The name of the script.
+        :return: A set of script names.
+        """
+        return set(self.dependents.get(name, ()))
+
+    @staticmethod
+    def get_closure(names, edges):
+        result = set(names)
+        stack = list(result)
+
+        while stack:
+            for name in edges.get(stack.pop(), ()):
+                if name not in result:
+                    result.add(name)
+                    stack.append(name)
+
+        return result
+
+    def get_all_includes(self, names):
+        """
+        Get the scripts that some scripts include, directly or not.
+
+        :param names: The names of the including scripts.
+        :return: A set that contains `names` and the names of all the scripts
+            they include, directly or not.
+        """
+        return self.get_closure(names=names, edges=self.includes)
+
+    def get_all_dependents(self, names):
+        """
+        Get the scripts that include some scripts, directly or not.
+
+        :param names: The names of the included scripts.
+        :return: A set that contains `names` and the names of all the scripts
+            that include them, directly or not.
+        """
+        return self.get_closure(names=names, edges=self.dependents)
+
+    def get_topological_order(self, names=None):
+        """
+        Sort scripts so that every script comes after the scripts it includes.
+
+        :param names: The names of the scripts to sort. If `None`, all the
+            scripts of the graph are sorted. Scripts that are not in `names`
+            are ignored, even if some scripts in `names` include them.
+        :return: A list of script names.
+        """
+        if names is None:
+            names = self.scripts
+
+        names = set(names)
+        result = []
+        visited = set()
+
+        for root in sorted(names):
+            if root in visited:
+                continue
+
+            visited.add(root)
+            stack = [(root, iter(sorted(self.includes.get(root, ()))))]
+
+            while stack:
+                name, includes = stack[-1]
+
+                for include in includes:
+                    if include in names and include not in visited:
+                        visited.add(include)
+                        stack.append((
+                            include,
+                            iter(sorted(self.includes.get(include, ()))),
+                        ))
+                        break
+                else:
+                    stack.pop()
+                    result.append(name)
+
+        return result
+
+    def get_stats(self, name):
+        """
+        Get the fan-in and fan-out of a script.
+
+        :param name: The name of the script.
+        :return: A `DependencyStats` named tuple, whose `fan_in` is the number
+            of scripts that include the script directly and `fan_out` the
+            number of scripts it includes directly.
+        """
+        return DependencyStats(
+            fan_in=len(self.dependents.get(name, ())),
+            fan_out=len(self.includes.get(name, ())),
+        )
+
+    def get_all_stats(self):
+        """
+        Get the fan-in and fan-out of all the scripts of the graph.
+
+        :return: A dict of `DependencyStats` named tuples, indexed by script
+            name.
+        """
+        return {name: self.get_stats(name) for name in self.scripts}
@@ -0,0 +1,103 @@
+"""
+A table of scripts shared across caches.
+"""
+
+import hashlib
+import threading
+import weakref
+
+import six
+
+
+class ScriptInternTable(object):
+    """
+    A thread-safe table of parsed scripts, keyed by a digest of their content.
+
+    The key of a script covers its name, its source and the digests of all
+    the scripts it includes, so two scripts with the same key are identical,
+    whatever the cache or the search path they were loaded from. Loading
+    overlapping sets of scripts through a common table, from independent
+    caches or registries, parses each distinct script only once and shares it,
+    and the whole tree of scripts it includes, among them.
+
+    The table only holds weak references to its scripts: a script is dropped
+    from the table as soon as nothing else references it.
+    """
+
+    def __init__(self):
+        """
+        Create a new, empty, intern table.
+        """
+        self.lock = threading.Lock()
+        self.scripts = weakref.WeakValueDictionary()
+
+    def __repr__(self):
+        return '{_class}(count={count})'.format(
+            _class=self.__class__.__name__,
+            count=len(self),
+        )
+
+    def __len__(self):
+        return len(self.scripts)
+
+    def get_key(self, name, content, includes):
+        """
+        Get the key of a script, before parsing it.
+
+        :param name: The name of the script.
+        :param content: The content of the script. Can be text, or a
+            bytes-like object.
+        :param includes: The list of the scripts that the script includes
+            directly, in order of inclusion.
+        :return: The key.
+        """
+        if isinstance(content, six.text_type):
+            content = content.encode('utf-8')
+
+        digest = hashlib.sha1(name.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(content)
+
+        for script in includes:
+            digest.update(b'\0')
+            digest.update(script.digest.encode('ascii'))
+
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Get an interned script.
+
+        :param key: The key of the script.
+        :return: The script, or `None` if no script has that key.
+        """
+        return self.scripts.get(key)
+
+    def add(self, key, script):
+        """
+        Intern a script.
+
+        :param key: The key of the script, as given by :py:meth:`get_key`.
+        :param script: The script.
+        :return: The interned script, which is `script` itself, unless another
+            script was interned with the same key meanwhile.
+        """
+        with self.lock:
+            result = self.scripts.get(key)
+
+            if result is not None:
+                return result
+
+            self.scripts[key] = script
+
+            return script
+
+    def clear(self):
+        """
+        Remove all the scripts from the table.
+        """
+        with self.lock:
+            self.scripts.clear()
+
+
+global_intern_table = ScriptInternTable()
@@ -0,0 +1,438 @@
+"""
+Dependency-aware script loading.
+"""
+
+import os
+import posixpath
+
+from collections import OrderedDict
+from functools import partial
+from multiprocessing.pool import ThreadPool
+
+try:  # pragma: no cover
+    from collections.abc import Mapping
+except ImportError:  # pragma: no cover
+    from collections import Mapping
+
+from .cache import ScriptCache
+from .exceptions import CyclicDependencyError
+from .files import (
+    close_script_bytes,
+    iter_script_names,
+    read_script_bytes,
+)
+from .regions import ScriptParser
+from .script import Script
+
+
+class ScriptLoader(object):
+    """
+    Load several scripts and all the scripts they include.
+
+    Loading happens in two phases. First, the script files are read, possibly
+    concurrently, and the include graph is built from their `%include`
+    statements. Then, the scripts are parsed in topological order so that
+    every script is parsed after all the scripts it includes.
+
+    Neither phase is recursive, which means there is no limit on the depth of
+    include chains.
+    """
+
+    def __init__(
+        self,
+        path,
+        cache=None,
+        disk_cache=None,
+        workers=None,
+        graph=None,
+        intern_table=None,
+    ):
+        """
+        Create a new script loader.
+
+        :param path: A path to search into for LUA scripts.
+        :param cache: A cache of scripts to use to fasten loading. Loaded
+            scripts are added to it.
+        :param disk_cache: A :py:class:`DiskCache
+            <redis_lua.disk_cache.DiskCache>` instance to look the scripts up
+            into before reading them. Parsed scripts are stored into it.
+        :param workers: The number of threads to use to read files
+            concurrently. If `None`, files are read from the calling thread.
+        :param graph: A :py:class:`DependencyGraph
+            <redis_lua.graph.DependencyGraph>` instance to add the loaded
+            scripts, and the scripts they include, to.
+        :param intern_table: A :py:class:`ScriptInternTable
+            <redis_lua.intern.ScriptInternTable>` instance to share identical
+            scripts through, with other caches. Scripts that were loaded
+            already through it are not parsed again.
+        """
+        if cache is None:
+            cache = {}
+
+        self.path = path
+        self.cache = cache
+        self.disk_cache = disk_cache
+        self.workers = workers
+        self.graph = graph
+        self.intern_table = intern_table
+        self.parser = ScriptParser()
+
+    def load(self, names):
+        """
+        Load scripts.
+
+        :param names: An iterable of LUA scripts names to load. If some names
+            contain backslashes, those will be replaced with forward slashes
+            silently.
+        :return: A dict of the requested scripts, indexed by name.
+        """
+        names = [name.replace(os.path.sep, '/') for name in names]
+        scripts = {}
+        entries = {}
+        sources = self.read_sources(
+            names=names,
+            scripts=scripts,
+            entries=entries,
+        )
+
+        try:
+            for name in self.sort_sources(sources=sources):
+                content, includes = sources[name]
+                scripts[name] = self.parse_source(
+                    name=name,
+                    content=content,
+                    scripts=scripts,
+                    includes=includes,
+                    entry=entries.get(name),
+                )
+                close_script_bytes(content)
+        finally:
+            for content, _ in sources.values():
+                close_script_bytes(content)
+
+        result = {name: scripts[name] for name in names}
+
+        if self.graph is not None:
+            for script in result.values():
+                self.graph.add_script(script)
+
+        return result
+
+    def read_source(self, name):
+        """
+        Read a script and get the names of the scripts it includes.
+
+        :param name: The name of the script.
+        :return: An (entry, content, includes) tuple. If the script was found
+            in the disk cache, `entry` is its entry and `content` is `None`.
+        """
+        if self.disk_cache is not None:
+            entry = self.disk_cache.get_entry(name=name, path=self.path)
+
+            if entry is not None:
+                return entry, None, entry['includes']
+
+        content = read_script_bytes(name=name, path=self.path)
+        includes = self.parser.parse_includes(
+            content=content,
+            current_path=posixpath.dirname(name),
+        )
+
+        return None, content, includes
+
+    def read_sources(self, names, scripts, entries):
+        """
+        Read all the scripts that are needed to load the specified scripts.
+
+        Scripts that are already in the cache are not read again.
+
+        :param names: The names of the scripts to load.
+        :param scripts: A dict that the scripts found in the cache are added
+            to.
+        :param entries: A dict that the entries of the scripts found in the
+            disk cache are added to.
+        :return: A dict of (content, includes) tuples, indexed by name, for
+            every script that must be parsed or built from its disk cache
+            entry. The content of the latter is `None`.
+        """
+        sources = OrderedDict()
+        seen = set()
+        pending = []
+
+        def add_pending(names):
+            for name in names:
+                if name not in seen:
+                    seen.add(name)
+                    script = self.cache.get(name)
+
+                    if script is None:
+                        pending.append(name)
+                    else:
+                        scripts[name] = script
+
+        add_pending(names)
+
+        if self.workers is None:
+            pool = None
+            map_ = map
+        else:
+            pool = ThreadPool(processes=self.workers)
+            map_ = pool.map
+
+        try:
+            while pending:
+                batch, pending[:] = pending[:], []
+
+                for name, (entry, content, includes) in zip(
+                    batch,
+                    map_(self.read_source, batch),
+                ):
+                    if entry is not None:
+                        entries[name] = entry
+
+                    sources[name] = content, includes
+                    add_pending(includes)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        return sources
+
+    @staticmethod
+    def sort_sources(sources):
+        """
+        Sort scripts so that every script comes after the scripts it includes.
+
+        :param sources: A dict of (content, includes) tuples, indexed by name.
+            Includes that are not in `sources` are ignored.
+        :return: A list of script names.
+        :raises: A :py:class:`CyclicDependencyError
+            <redis_lua.exceptions.CyclicDependencyError>` if some scripts
+            include each other.
+        """
+        visiting = object()
+        visited = object()
+        states = {}
+        result = []
+
+        for root in sources:
+            if root in states:
+                continue
+
+            states[root] = visiting
+            stack = [(root, iter(sources[root][1]))]
+
+            while stack:
+                name, includes = stack[-1]
+
+                for include in includes:
+                    if include not in sources:
+                        continue
+
+                    state = states.get(include)
+
+                    if state is None:
+                        states[include] = visiting
+                        stack.append((include, iter(sources[include][1])))
+                        break
+                    elif state is visiting:
+                        cycle = [entry[0] for entry in stack]
+
+                        raise CyclicDependencyError(
+                            cycle=cycle[cycle.index(include):] + [include],
+                        )
+                else:
+                    stack.pop()
+                    states[name] = visited
+                    result.append(name)
+
+        return result
+
+    @staticmethod
+    def get_loaded_script(name, scripts):
+        return scripts[name]
+
+    def parse_source(self, name, content, scripts, includes=(), entry=None):
+        """
+        Parse a script whose included scripts are all loaded already.
+
+        If the cache is a :py:class:`ScriptCache
+        <redis_lua.cache.ScriptCache>` instance and another thread is parsing
+        the same script already, its result is used instead.
+
+        :param name: The name of the script.
+        :param content: The content of the script.
+        :param scripts: A dict of the loaded scripts, indexed by name.
+        :param includes: The names of the scripts that the script includes
+            directly, in order of inclusion. Only used to look the script up
+            in the intern table.
+        :param entry: The disk cache entry of the script, if any. The script
+            is then built from it, rather than parsed.
+        :return: A :py:class:`Script <redis_lua.script.Script>` instance.
+        """
+        load = partial(
+            self.parse_content,
+            name=name,
+            content=content,
+            scripts=scripts,
+            includes=includes,
+            entry=entry,
+        )
+
+        if isinstance(self.cache, ScriptCache):
+            return self.cache.get_or_load(name=name, load=load)
+
+        script = load()
+        self.cache[name] = script
+
+        return script
+
+    def parse_content(self, name, content, scripts, includes=(), entry=None):
+        if entry is not None:
+            script = self.disk_cache.get_script(
+                entry=entry,
+                get_script_by_name=partial(
+                    self.get_loaded_script,
+                    scripts=scripts,
+                ),
+            )
+
+            if script is not None:
+                return script
+
+            # The included scripts changed since the entry was stored.
+            content = read_script_bytes(name=name, path=self.path)
+
+            try:
+                return self.parse_content(
+                    name=name,
+                    content=content,
+                    scripts=scripts,
+                    includes=includes,
+                )
+            finally:
+                close_script_bytes(content)
+
+        key = None
+
+        if self.intern_table is not None:
+            key = self.intern_table.get_key(
+                name=name,
+                content=content,
+                includes=[scripts[include] for include in includes],
+            )
+            script = self.intern_table.get(key)
+
+            if script is not None:
+                return script
+
+        script = self.parser.parse(
+            name=name,
+            content=content,
+            script_class=Script,
+            get_script_by_name=partial(
+                self.get_loaded_script,
+                scripts=scripts,
+            ),
+        )
+
+        if key is not None:
+            script = self.intern_table.add(key, script)
+
+        if self.disk_cache is not None:
+            self.disk_cache.set(script=script, path=self.path)
+
+        return script
+
+
+class LazyScriptMapping(Mapping):
+    """
+    A read-only mapping of all the LUA scripts found at a location, that only
+    loads scripts when they are accessed.
+
+    The script names are listed when the mapping is created, so membership
+    tests, iteration and length never cause any script to be read or parsed.
+    Accessing a script loads it, and the scripts it includes, on first access.
+    """
+
+    def __init__(
+        self,
+        path,
+        cache=None,
+        disk_cache=None,
+        workers=None,
+        graph=None,
+        include=None,
+        exclude=None,
+        intern_table=None,
+    ):
+        """
+        Create a new lazy script mapping.
+
+        :param path: A path to search into for LUA scripts.
+        :param cache: A cache of scripts to use to fasten loading. Loaded
+            scripts are added to it.
+        :param disk_cache: A :py:class:`DiskCache
+            <redis_lua.disk_cache.DiskCache>` instance to persist parsed
+            scripts into, across processes.
+        :param workers: The number of threads to use to read script files
+            concurrently. If `None`, files are read sequentially.
+        :param graph: A :py:class:`DependencyGraph
+            <redis_lua.graph.DependencyGraph>` instance to add the scripts to,
+            as they get loaded.
+        :param include: An iterable of glob patterns. If specified, only the
+            scripts whose name matches one of them are listed.
+        :param exclude: An iterable of glob patterns. The scripts and
+            directories whose name matches one of them are not listed.
+        :param intern_table: A :py:class:`ScriptInternTable
+            <redis_lua.intern.ScriptInternTable>` instance to share identical
+            scripts through, with other caches.
+        """
+        self.loader = ScriptLoader(
+            path=path,
+            cache=cache,
+            disk_cache=disk_cache,
+            workers=workers,
+            graph=graph,
+            intern_table=intern_table,
+        )
+        self.names = frozenset(
+            iter_script_names(path, include=include, exclude=exclude),
+        )
+
+    def __repr__(self):
+        return '{_class}(path={path!r}, names={names!r})'.format(
+            _class=self.__class__.__name__,
+            path=self.loader.path,
+            names=sorted(self.names),
+        )
+
+    def __getitem__(self, name):
+        if name not in self.names:
+            raise KeyError(name)
+
+        script = self.loader.cache.get(name)
+
+        if script is None:
+            script = self.loader.load(names=[name])[name]
+
+        return script
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def is_loaded(self, name):
+        """
+        Check whether a script was loaded already.
+
+        :param name: The name of the script.
+        :return: `True` if accessing the script won't load it.
+        """
+        return name in self.loader.cache
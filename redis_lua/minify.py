@@ -0,0 +1,168 @@
+"""
+Minification of LUA code.
+"""
+
+import re
+
+
+LONG_BRACKET_REGEX = re.compile(r'\[(?P<level>=*)\[')
+CODE_REGEX = re.compile(r'[^\s\'"\[-]+')
+WHITESPACE = frozenset(' \t\r\f\v')
+
+# Whitespace next to those characters can be removed without merging two
+# tokens. `-`, `.` and `[` are not part of it, as `- -`, `1 ..` or `[ [` would
+# become a comment, a malformed number or a long bracket.
+PUNCTUATION = frozenset('=(){},;+*/%^#<>~:]')
+
+
+def find_long_bracket_end(text, position, level):
+    """
+    Find the end of a long bracket.
+
+    :param text: The text to search.
+    :param position: The position of the first character inside the long
+        bracket.
+    :param level: The level of the long bracket, that is the number of `=`
+        signs between its brackets.
+    :return: The position right after the closing long bracket, or the length
+        of `text` if the long bracket is not closed.
+    """
+    end = text.find(']' + '=' * level + ']', position)
+
+    return len(text) if end < 0 else end + level + 2
+
+
+def find_string_end(text, position, quote):
+    """
+    Find the end of a quoted string.
+
+    :param text: The text to search.
+    :param position: The position of the first character inside the string.
+    :param quote: The quote the string started with.
+    :return: The position right after the closing quote, or the length of
+        `text` if the string is not closed.
+    """
+    length = len(text)
+
+    while position < length:
+        char = text[position]
+
+        if char == '\\':
+            position += 2
+        elif char == quote:
+            return position + 1
+        elif char == '\n':
+            # Unfinished string: let LUA report it.
+            return position
+        else:
+            position += 1
+
+    return length
+
+
+def minify(text):
+    """
+    Minify LUA code.
+
+    Comments are removed, as well as blank lines, indentation and any
+    whitespace that doesn't separate two tokens. Strings and long strings are
+    kept verbatim, as are the line breaks between the remaining lines, so
+    that every line of the minified code still comes from a single line of
+    the original code.
+
+    :param text: The LUA code to minify.
+    :return: A (text, offsets) tuple, where `text` is the minified code, or
+        `None` if nothing but whitespace and comments remained, and `offsets`
+        gives, for every line of the minified code, the 0-based index of the
+        line of the original code it comes from.
+    """
+    lines = []
+    offsets = []
+    parts = []
+    line = 0
+    start_line = 0
+    space = False
+    position = 0
+    length = len(text)
+
+    def flush():
+        if parts:
+            lines.append(''.join(parts))
+            offsets.extend(range(start_line, line + 1))
+            del parts[:]
+
+    while position < length:
+        char = text[position]
+
+        if char == '\n':
+            flush()
+            line += 1
+            start_line = line
+            space = False
+            position += 1
+            continue
+
+        if char in WHITESPACE:
+            space = True
+            position += 1
+            continue
+
+        if text.startswith('--', position):
+            match = LONG_BRACKET_REGEX.match(text, position + 2)
+
+            if match:
+                end = find_long_bracket_end(
+                    text,
+                    match.end(),
+                    len(match.group('level')),
+                )
+
+                for _ in range(text.count('\n', position, end)):
+                    flush()
+                    line += 1
+                    start_line = line
+                    space = False
+
+                space = True
+                position = end
+            else:
+                end = text.find('\n', position)
+                position = length if end < 0 else end
+
+            continue
+
+        if char in '\'"':
+            end = find_string_end(text, position + 1, char)
+        else:
+            match = (
+                LONG_BRACKET_REGEX.match(text, position)
+                if char == '[' else
+                None
+            )
+
+            if match:
+                end = find_long_bracket_end(
+                    text,
+                    match.end(),
+                    len(match.group('level')),
+                )
+            else:
+                match = CODE_REGEX.match(text, position)
+                end = match.end() if match else position + 1
+
+        if space and parts:
+            if parts[-1][-1] not in PUNCTUATION and char not in PUNCTUATION:
+                parts.append(' ')
+
+        space = False
+        token = text[position:end]
+        parts.append(token)
+        line += token.count('\n')
+        position = end
+
+    flush()
+
+    if not lines:
+        return None, []
+
+    return '\n'.join(lines), offsets
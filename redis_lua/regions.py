@@ -2,15 +2,172 @@
 Scripts regions.
 """
 
-import os
+import posixpath
 import re
+import six
+
+# All the directives are matched by a single pattern. The last matched group
+# tells which directive was found.
+DIRECTIVE_REGEX = re.compile(
+    r'^\s*%(?:'
+    r'include\s+"(?P<include>[\w\d_\-/\\.]+)"|'
+    r'key\s+(?P<key>[\w\d_]+)|'
+    r'arg\s+(?P<arg>[\w\d_]+)(?:\s+(?P<arg_type>[\w\d_]+))?|'
+    r'return\s+(?P<return_type>[\w\d_]+)|'
+    r'pragma\s+(?P<pragma_value>[\w\d_]+)'
+    r')\s*$'
+)
+
+if six.PY2:  # pragma: no cover
+    _INTERNED = {}
+
+    def intern(value):
+        """
+        Intern a string.
+
+        The `intern` builtin of Python 2 only takes byte strings.
+
+        :param value: The string to intern.
+        :return: The interned string.
+        """
+        return _INTERNED.setdefault(value, value)
+else:  # pragma: no cover
+    from sys import intern
+
+
+def iter_directives(content, end, encoding=None):
+    """
+    Iterate over the directives of a LUA script.
+
+    Only the lines that contain a `%` character are extracted from `content`
+    and matched against :py:data:`DIRECTIVE_REGEX`, so that most of the
+    content is only ever scanned by `find`.
+
+    :param content: The content of the script. Can be text, or a bytes-like
+        object such as a memory-mapped file.
+    :param end: The position in `content` to stop scanning at.
+    :param encoding: The encoding of `content`, if it is not text. If none is
+        specified, UTF-8 is assumed.
+    :yields: (start, stop, statement, match) tuples where `start` and `stop`
+        are the positions of the directive line in `content`, without its
+        line break, `statement` the decoded line and `match` the
+        :py:data:`DIRECTIVE_REGEX` match.
+    """
+    if isinstance(content, six.text_type):
+        percent, newline, carriage_return = '%', '\n', '\r'
+        encoding = None
+    else:
+        percent, newline, carriage_return = b'%', b'\n', b'\r'
+        encoding = encoding or 'utf-8'
+
+    position = content.find(percent, 0, end)
+
+    while position != -1:
+        # Lines can end with LF, CRLF or CR. The searches for CR are bounded
+        # by the surrounding LFs, so that files without CR are scanned once.
+        start = content.rfind(newline, 0, position) + 1
+        start = content.rfind(carriage_return, start, position) + 1 or start
+        stop = content.find(newline, position, end)
+
+        if stop == -1:
+            stop = end
+
+        carriage_return_stop = content.find(carriage_return, position, stop)
+
+        if carriage_return_stop != -1:
+            stop = carriage_return_stop
+
+        statement = content[start:stop]
+
+        if encoding is not None:
+            statement = statement.decode(encoding)
+
+        match = DIRECTIVE_REGEX.match(statement)
+
+        if match:
+            yield start, stop, statement, match
+
+        position = content.find(percent, stop, end)
+
+
+def resolve_script_name(current_path, name):
+    """
+    Resolve a script name relative to the current path.
+
+    Script names always use forward slashes, whatever the platform. The
+    resolution is purely lexical and never touches the filesystem.
+
+    :param current_path: The path, relative to the search path, of the
+        directory the including script lives in.
+    :param name: The script name, as written in the `%include` statement.
+    :return: The normalized script name.
+    """
+    # We don't want backslashes in script names. Life is already complex
+    # enough.
+    return posixpath.normpath(
+        posixpath.join(
+            current_path.replace('\\', '/'),
+            name.replace('\\', '/'),
+        ),
+    )
+
+
+class Region(object):
+    """
+    The base class of all regions.
+
+    Scripts can be made of thousands of regions, so regions have no
+    `__dict__`. The string attributes listed in `INTERNED_SLOTS` are interned,
+    so that identical directives share a single string, whether they were
+    parsed or unpickled.
+    """
+
+    __slots__ = ()
+    INTERNED_SLOTS = ()
+    line_count = 1
+    real_line_count = 1
+
+    def __getstate__(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    def __setstate__(self, state):
+        for slot, value in state.items():
+            if slot in self.INTERNED_SLOTS:
+                value = intern(value)
+
+            setattr(self, slot, value)
+
+    def get_digest_fields(self):
+        """
+        Get the fields that identify the region.
+
+        :return: A tuple of strings. Two regions of the same class are equal
+            if, and only if, their fields are.
+        """
+        raise NotImplementedError
+
+    def update_digest(self, digest):
+        """
+        Feed the class and the fields of the region to a hash object.
 
+        :param digest: A `hashlib` hash object.
+        """
+        for field in (type(self).__name__,) + self.get_digest_fields():
+            data = six.text_type(field).encode('utf-8')
+            digest.update(('%d:' % len(data)).encode('ascii'))
+            digest.update(data)
+
+
+class ScriptRegion(Region):
+    __slots__ = [
+        'script',
+        'content',
+    ]
+    INTERNED_SLOTS = {'content'}
 
-class ScriptRegion(object):
     def __init__(self, script, content):
         self.script = script
-        self.real_line_count = 1
-        self.content = content
+        self.content = intern(content)
 
     def __repr__(self):
         return (
@@ -26,6 +183,9 @@ class ScriptRegion(object):
     def line_count(self):
         return self.script.line_count
 
+    def get_digest_fields(self):
+        return self.script.digest, self.content
+
     def render(self, context):
         return context.render_script(script=self.script)
 
@@ -47,13 +207,50 @@ class ScriptRegion(object):
         return self.script.args
 
 
-class KeyRegion(object):
+class MessagePack(object):
+    """
+    The type of the arguments and return values that are serialized with
+    MessagePack.
+    """
+
+
+class Hash(object):
+    """
+    The type of the arguments that are dicts, flattened into consecutive
+    arguments of the script.
+    """
+
+
+class IntegerArray(object):
+    """
+    The type of the arguments and return values that are arrays of integers,
+    packed as 64-bit little-endian signed integers.
+    """
+    FORMAT = 'q'
+    LUA_FORMAT = 'i8'
+
+
+class FloatArray(object):
+    """
+    The type of the arguments and return values that are arrays of floats,
+    packed as little-endian doubles.
+    """
+    FORMAT = 'd'
+    LUA_FORMAT = 'd'
+
+
+class KeyRegion(Region):
+    __slots__ = [
+        'name',
+        'index',
+        'content',
+    ]
+    INTERNED_SLOTS = {'name', 'content'}
+
     def __init__(self, name, index, content):
-        self.name = name
+        self.name = intern(name)
         self.index = index
-        self.line_count = 1
-        self.real_line_count = 1
-        self.content = content
+        self.content = intern(content)
 
     def __repr__(self):
         return (
@@ -64,6 +261,9 @@ class KeyRegion(object):
             self=self,
         )
 
+    def get_digest_fields(self):
+        return self.name, self.index, self.content
+
     def render(self, context):
         return context.render_key(name=self.name)
 
@@ -78,7 +278,14 @@ class KeyRegion(object):
         ])
 
 
-class ArgumentRegion(object):
+class ArgumentRegion(Region):
+    __slots__ = [
+        'name',
+        'index',
+        'type_',
+        'content',
+    ]
+    INTERNED_SLOTS = {'name', 'content'}
     VALID_TYPES = {
         None: str,
         'int': int,
@@ -91,6 +298,12 @@ class ArgumentRegion(object):
         'dictionary': dict,
         'list': list,
         'array': list,
+        'msgpack': MessagePack,
+        'int_array': IntegerArray,
+        'integer_array': IntegerArray,
+        'float_array': FloatArray,
+        'hash': Hash,
+        'pairs': Hash,
     }
 
     @classmethod
@@ -103,12 +316,10 @@ class ArgumentRegion(object):
         return result
 
     def __init__(self, name, index, type_, content):
-        self.name = name
+        self.name = intern(name)
         self.index = index
         self.type_ = self.get_valid_type(type_=type_)
-        self.line_count = 1
-        self.real_line_count = 1
-        self.content = content
+        self.content = intern(content)
 
     def __repr__(self):
         return (
@@ -119,6 +330,9 @@ class ArgumentRegion(object):
             self=self,
         )
 
+    def get_digest_fields(self):
+        return self.name, self.index, self.type_.__name__, self.content
+
     def render(self, context):
         return context.render_arg(
             name=self.name,
@@ -137,7 +351,12 @@ class ArgumentRegion(object):
         ])
 
 
-class ReturnRegion(object):
+class ReturnRegion(Region):
+    __slots__ = [
+        'type_',
+        'content',
+    ]
+    INTERNED_SLOTS = {'content'}
     VALID_TYPES = {
         None: str,
         'int': int,
@@ -150,6 +369,10 @@ class ReturnRegion(object):
         'dictionary': dict,
         'list': list,
         'array': list,
+        'msgpack': MessagePack,
+        'int_array': IntegerArray,
+        'integer_array': IntegerArray,
+        'float_array': FloatArray,
     }
 
     @classmethod
@@ -163,9 +386,7 @@ class ReturnRegion(object):
 
     def __init__(self, type_, content):
         self.type_ = self.get_valid_type(type_=type_)
-        self.line_count = 1
-        self.real_line_count = 1
-        self.content = content
+        self.content = intern(content)
 
     def __repr__(self):
         return '{_class}(line_count={self.line_count})'.format(
@@ -173,6 +394,9 @@ class ReturnRegion(object):
             self=self,
         )
 
+    def get_digest_fields(self):
+        return self.type_.__name__, self.content
+
     def render(self, context):
         return context.render_return(type_=self.type_)
 
@@ -186,7 +410,12 @@ class ReturnRegion(object):
         ])
 
 
-class PragmaRegion(object):
+class PragmaRegion(Region):
+    __slots__ = [
+        'value',
+        'content',
+    ]
+    INTERNED_SLOTS = {'value', 'content'}
     VALID_VALUES = {
         'once',
     }
@@ -195,10 +424,8 @@ class PragmaRegion(object):
         if value not in self.VALID_VALUES:
             raise ValueError("Invalid value %r for pragma" % value)
 
-        self.value = value
-        self.line_count = 1
-        self.real_line_count = 1
-        self.content = content
+        self.value = intern(value)
+        self.content = intern(content)
 
     def __repr__(self):
         return '{_class}(line_count={self.line_count})'.format(
@@ -206,6 +433,9 @@ class PragmaRegion(object):
             self=self,
         )
 
+    def get_digest_fields(self):
+        return self.value, self.content
+
     def render(self, context):
         return context.render_pragma(value=self.value)
 
@@ -219,11 +449,39 @@ class PragmaRegion(object):
         ])
 
 
-class TextRegion(object):
+class TextRegion(Region):
+    __slots__ = [
+        'content',
+        'line_count',
+        '_lines',
+    ]
+
     def __init__(self, content):
         self.content = content
-        self.line_count = len(content.split('\n'))
-        self.real_line_count = self.line_count
+        self.line_count = content.count('\n') + 1
+        self._lines = None
+
+    def __getstate__(self):
+        state = super(TextRegion, self).__getstate__()
+
+        # The line table is cheap to build again and not worth persisting.
+        state['_lines'] = None
+
+        return state
+
+    @property
+    def real_line_count(self):
+        return self.line_count
+
+    @property
+    def lines(self):
+        """
+        The lines of the region, built on first access.
+        """
+        if self._lines is None:
+            self._lines = self.content.split('\n')
+
+        return self._lines
 
     def __repr__(self):
         return '{_class}(line_count={self.line_count})'.format(
@@ -231,6 +489,9 @@ class TextRegion(object):
             self=self,
         )
 
+    def get_digest_fields(self):
+        return self.content,
+
     def render(self, context):
         return context.render_text(text=self.content)
 
@@ -318,19 +579,13 @@ class ScriptParser(object):
             )
             self.regions.append(region)
 
-        def normalize(self):
-            self.flush()
-
-            if not self.regions:
-                self.add_line('')
-                self.flush()
-
     def parse(self, name, content, script_class, get_script_by_name):
         """
         Parse a LUA script.
 
         :param name: The name of the LUA script to parse.
-        :param content: The content of the script.
+        :param content: The content of the script, as text or as a bytes-like
+            object.
         :param script_class: A callable that creates
             :py:class:`Script<redis_lua.script.Script>` instances. Must take
             `name` and `regions` named arguments.
@@ -341,126 +596,166 @@ class ScriptParser(object):
         """
         regions = self.parse_regions(
             content=content,
-            current_path=os.path.dirname(name),
+            current_path=posixpath.dirname(name),
             get_script_by_name=get_script_by_name,
         )
         return script_class(name=name, regions=regions)
 
-    def parse_regions(self, content, current_path, get_script_by_name):
+    def parse_includes(self, content, current_path, encoding=None):
+        """
+        Get the names of the scripts that a LUA script includes directly,
+        without parsing it.
+
+        :param content: The content of the script to scan. Can be text, or a
+            bytes-like object such as a memory-mapped file.
+        :param current_path: The current path the parsing is taking place. Used
+            to process file-relative statements.
+        :param encoding: The encoding of `content`, if it is not text. If none
+            is specified, UTF-8 is assumed.
+        :return: A list of script names, in order of inclusion.
+        """
+        return [
+            resolve_script_name(
+                current_path=current_path,
+                name=match.group('include'),
+            )
+            for _, _, statement, match in iter_directives(
+                content=content,
+                end=len(content),
+                encoding=encoding,
+            )
+            if match.lastgroup == 'include'
+        ]
+
+    def parse_regions(
+        self,
+        content,
+        current_path,
+        get_script_by_name,
+        encoding=None,
+    ):
         """
         Parse a LUA script and split it into regions.
 
-        :param content: The content of the script to parse.
+        Only the directive lines, and the text between them, are ever
+        extracted from `content`: the content is never split into lines.
+
+        :param content: The content of the script to parse. Can be text, or a
+            bytes-like object such as a memory-mapped file, in which case only
+            the extracted parts are decoded.
         :param current_path: The current path the parsing is taking place. Used
             to process file-relative statements.
         :param get_script_by_name: A callable that takes a named `name`
             argument (the name of the script) and returns a :py:class:`Script
             <redis_lua.script.Script>` instance.
+        :param encoding: The encoding of `content`, if it is not text. If none
+            is specified, UTF-8 is assumed.
         :return: An array of regions.
         """
         context = self.ParseRegionsContext()
-        lines = content.split('\n')
 
-        # If the file ends with a newline character, the last element will be
-        # empty and we don't want it.
-        if lines and not lines[-1]:
-            lines = lines[:-1]
+        is_text = isinstance(content, six.text_type)
+        newline, carriage_return = ('\n', '\r') if is_text else (b'\n', b'\r')
+
+        def get_text(start, stop):
+            text = content[start:stop]
 
-        for real_line, statement in enumerate(lines, start=1):
-            if self._parse_include(
+            if not is_text:
+                text = text.decode(encoding or 'utf-8')
+
+            # CRLF and CR line breaks are translated, as when reading a file in
+            # universal newlines mode.
+            if '\r' in text:
+                text = text.replace('\r\n', '\n').replace('\r', '\n')
+
+            return text
+
+        end = len(content)
+
+        # If the file ends with a line break, we don't want an extra empty
+        # line.
+        if content[end - 2:end] == carriage_return + newline:
+            end -= 2
+        elif content[end - 1:end] in (newline, carriage_return):
+            end -= 1
+
+        position = 0
+        real_line = 1
+
+        for start, stop, statement, match in iter_directives(
+            content=content,
+            end=end,
+            encoding=encoding,
+        ):
+            if start > position:
+                text_end = start - 1
+
+                # The CR of a CRLF line break is not part of the text.
+                if (
+                    text_end > position and
+                    content[text_end - 1:text_end + 1] ==
+                    carriage_return + newline
+                ):
+                    text_end -= 1
+
+                text = get_text(position, text_end)
+                context.add_line(text)
+                real_line += text.count('\n') + 1
+
+            self._add_directive(
                 context,
+                real_line,
                 statement,
+                match,
                 current_path,
                 get_script_by_name,
-            ):
-                continue
-
-            elif self._parse_key(context, statement):
-                continue
-
-            elif self._parse_arg(context, real_line, statement):
-                continue
-
-            elif self._parse_return(context, real_line, statement):
-                continue
+            )
+            real_line += 1
+            position = stop + 1
 
-            elif self._parse_pragma(context, real_line, statement):
-                continue
+            if content[stop:position + 1] == carriage_return + newline:
+                position += 1
 
-            else:
-                context.add_line(statement)
+        if position <= end:
+            context.add_line(get_text(position, end))
 
-        context.normalize()
+        context.flush()
 
         return context.regions
 
-    def _parse_include(
+    def _add_directive(
         self,
         context,
+        real_line,
         statement,
+        match,
         current_path,
         get_script_by_name,
     ):
-        match = re.match(
-            r'^\s*%include\s+"(?P<name>[\w\d_\-/\\.]+)"\s*$',
-            statement,
-        )
-
-        if match:
-            # We don't want backslashes in script names. Life is already
-            # complex enough.
-            name = os.path.relpath(
-                os.path.join(
-                    current_path,
-                    match.group('name'),
-                )
-            ).replace(os.path.sep, '/')
-            script = get_script_by_name(name=name)
-
+        directive = match.lastgroup
+
+        if directive == 'include':
+            script = get_script_by_name(
+                name=resolve_script_name(
+                    current_path=current_path,
+                    name=match.group('include'),
+                ),
+            )
             context.add_script_region(
                 script=script,
                 content=statement,
             )
-
-            return True
-
-    def _parse_key(
-        self,
-        context,
-        statement,
-    ):
-        match = re.match(
-            r'^\s*%key\s+(?P<name>[\w\d_]+)\s*$',
-            statement,
-        )
-
-        if match:
-            name = match.group('name')
+        elif directive == 'key':
             context.add_key_region(
-                name=name,
+                name=match.group('key'),
                 content=statement,
             )
-
-            return True
-
-    def _parse_arg(
-        self,
-        context,
-        real_line,
-        statement,
-    ):
-        match = re.match(
-            r'^\s*%arg\s+(?P<name>[\w\d_]+)(\s+(?P<type>[\w\d_]+))?\s*$',
-            statement,
-        )
-
-        if match:
-            name = match.group('name')
-            type_ = match.group('type')
+        elif directive in {'arg', 'arg_type'}:
+            type_ = match.group('arg_type')
 
             try:
                 context.add_argument_region(
-                    name=name,
+                    name=match.group('arg'),
                     type_=type_,
                     content=statement,
                 )
@@ -472,22 +767,8 @@ class ScriptParser(object):
                         real_line,
                     ),
                 )
-
-            return True
-
-    def _parse_return(
-        self,
-        context,
-        real_line,
-        statement,
-    ):
-        match = re.match(
-            r'^\s*%return\s+(?P<type>[\w\d_]+)\s*$',
-            statement,
-        )
-
-        if match:
-            type_ = match.group('type')
+        elif directive == 'return_type':
+            type_ = match.group('return_type')
 
             try:
                 context.add_return_region(
@@ -502,22 +783,8 @@ class ScriptParser(object):
                         real_line,
                     ),
                 )
-
-            return True
-
-    def _parse_pragma(
-        self,
-        context,
-        real_line,
-        statement,
-    ):
-        match = re.match(
-            r'^\s*%pragma\s+(?P<value>[\w\d_]+)\s*$',
-            statement,
-        )
-
-        if match:
-            value = match.group('value')
+        else:
+            value = match.group('pragma_value')
 
             try:
                 context.add_pragma_region(
@@ -532,5 +799,3 @@ class ScriptParser(object):
                         real_line,
                     ),
                 )
-
-            return True
@@ -0,0 +1,244 @@
+"""
+A registry of scripts that follows the changes made to files on disk.
+"""
+
+import logging
+import os
+import threading
+
+try:  # pragma: no cover
+    from collections.abc import Mapping
+except ImportError:  # pragma: no cover
+    from collections import Mapping
+
+from .files import (
+    get_script_filename,
+    iter_script_names,
+)
+from .graph import DependencyGraph
+from .loader import ScriptLoader
+from .script import register_scripts
+from .watchers import get_watcher
+
+logger = logging.getLogger(__name__)
+
+
+class ScriptRegistry(Mapping):
+    """
+    A read-only mapping of all the LUA scripts found at a location, that can
+    be kept up-to-date with the files on disk.
+
+    When some script files change, only those scripts and the scripts that
+    include them, directly or not, as found in the registry
+    :py:class:`graph <redis_lua.graph.DependencyGraph>`, are parsed again.
+    Those scripts are then registered again on all the Redis clients of the
+    registry.
+    """
+
+    def __init__(
+        self,
+        path,
+        clients=None,
+        watcher=None,
+        workers=None,
+        intern_table=None,
+    ):
+        """
+        Create a new script registry and load all its scripts.
+
+        :param path: A path to search into for LUA scripts.
+        :param clients: A list of Redis clients to register scripts on.
+        :param watcher: The watcher to use to detect changes. If `None`, the
+            most efficient watcher for the platform is used. See
+            :py:func:`get_watcher <redis_lua.watchers.get_watcher>`.
+        :param workers: The number of threads to use to read script files
+            concurrently. If `None`, files are read sequentially.
+        :param intern_table: A :py:class:`ScriptInternTable
+            <redis_lua.intern.ScriptInternTable>` instance to share identical
+            scripts through, with other registries.
+        """
+        if watcher is None:
+            watcher = get_watcher(path=path)
+
+        self.path = path
+        self.clients = list(clients or [])
+        self.watcher = watcher
+        self.workers = workers
+        self.intern_table = intern_table
+        self.scripts = {}
+        self.graph = DependencyGraph()
+        self.lock = threading.RLock()
+        self.thread = None
+        self.stopped = threading.Event()
+
+        self.load()
+
+    def __repr__(self):
+        return '{_class}(path={self.path!r})'.format(
+            _class=self.__class__.__name__,
+            self=self,
+        )
+
+    def __getitem__(self, name):
+        return self.scripts[name]
+
+    def __iter__(self):
+        return iter(self.scripts)
+
+    def __len__(self):
+        return len(self.scripts)
+
+    def load(self):
+        """
+        Load all the scripts, replacing any script that was loaded already,
+        and register them on all the clients.
+        """
+        with self.lock:
+            cache = {}
+            graph = DependencyGraph()
+            ScriptLoader(
+                path=self.path,
+                cache=cache,
+                workers=self.workers,
+                graph=graph,
+                intern_table=self.intern_table,
+            ).load(names=iter_script_names(self.path))
+
+            self.scripts = cache
+            self.graph = graph
+            self.register(scripts=cache.values())
+
+    def reload(self, names):
+        """
+        Reload some scripts after their files changed.
+
+        The scripts that include them, directly or not, are reloaded as well.
+        Scripts whose file does not exist anymore are removed. If any script
+        fails to load, the registry is left untouched.
+
+        :param names: The names of the scripts whose files changed.
+        :return: A set of the names of the scripts that were reloaded or
+            removed.
+        """
+        with self.lock:
+            affected = self.graph.get_all_dependents(names)
+            cache = {
+                name: script
+                for name, script in self.scripts.items()
+                if name not in affected
+            }
+            existing = [
+                name
+                for name in affected
+                if os.path.isfile(
+                    get_script_filename(name=name, path=self.path),
+                )
+            ]
+            scripts = ScriptLoader(
+                path=self.path,
+                cache=cache,
+                workers=self.workers,
+                intern_table=self.intern_table,
+            ).load(names=existing)
+
+            for name in affected:
+                self.graph.remove_script(name=name)
+
+            for script in scripts.values():
+                self.graph.add_script(script)
+
+            self.scripts = cache
+            self.register(scripts=scripts.values())
+
+            return affected
+
+    def register(self, scripts, clients=None):
+        """
+        Register scripts on Redis clients.
+
+        :param scripts: An iterable of scripts.
+        :param clients: The clients to register the scripts on. If `None`,
+            the scripts are registered on all the clients of the registry.
+        """
+        if clients is None:
+            clients = self.clients
+
+        scripts = list(scripts)
+
+        for client in clients:
+            register_scripts(client=client, scripts=scripts)
+
+    def add_client(self, client):
+        """
+        Add a client to the registry and register all the scripts on it.
+
+        :param client: The Redis client.
+        """
+        with self.lock:
+            self.clients.append(client)
+            self.register(scripts=self.scripts.values(), clients=[client])
+
+    def remove_client(self, client):
+        """
+        Remove a client from the registry.
+
+        :param client: The Redis client.
+        """
+        with self.lock:
+            self.clients.remove(client)
+
+    def poll(self, timeout=0):
+        """
+        Check for changes and reload the scripts that need it.
+
+        :param timeout: The maximum time, in seconds, to wait for a change.
+        :return: A set of the names of the scripts that were reloaded or
+            removed.
+        """
+        changes = self.watcher.get_changes(timeout=timeout)
+
+        if changes:
+            return self.reload(names=changes)
+
+        return set()
+
+    def run(self, timeout=1.0):
+        while not self.stopped.is_set():
+            try:
+                self.poll(timeout=timeout)
+            except Exception:
+                logger.exception("Failed to reload scripts in %r.", self.path)
+
+    def start(self, timeout=1.0):
+        """
+        Start watching for changes from a background thread.
+
+        :param timeout: The maximum time, in seconds, to wait for changes
+            before checking whether the thread must stop.
+        """
+        assert self.thread is None, "The registry is watching already."
+
+        self.stopped.clear()
+        self.thread = threading.Thread(
+            target=self.run,
+            kwargs={'timeout': timeout},
+            name='redis-lua-registry',
+        )
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop watching for changes from a background thread.
+        """
+        if self.thread is not None:
+            self.stopped.set()
+            self.thread.join()
+            self.thread = None
+
+    def close(self):
+        """
+        Stop watching for changes and release the watcher resources.
+        """
+        self.stop()
+        self.watcher.close()
@@ -2,30 +2,579 @@
 Rendering classes and functions.
 """
 
+import threading
 
-class RenderContext(object):
+from array import array
+from collections import (
+    OrderedDict,
+    namedtuple,
+)
+
+from .minify import minify
+from .regions import (
+    FloatArray,
+    Hash,
+    IntegerArray,
+    MessagePack,
+    ScriptRegion,
+)
+
+
+class SourceMap(object):
+    """
+    Map the lines of a rendered script to the lines of the source scripts
+    they were rendered from.
+
+    Every time a script is rendered, a frame is added, that remembers the
+    script, the frame of the script that included it and the real line of the
+    `%include` statement in that script. Two arrays, indexed by rendered line,
+    then give the frame and the real line of every rendered line.
+    """
 
     def __init__(self):
+        self.frames = []
+        self.line_frames = array('i')
+        self.real_lines = array('i')
+
+    def __len__(self):
+        return len(self.real_lines)
+
+    def add_frame(self, script, parent, real_line):
+        """
+        Add a frame.
+
+        :param script: The script being rendered.
+        :param parent: The index of the frame of the including script, or -1
+            if `script` is the top-level script.
+        :param real_line: The real line of the `%include` statement in the
+            including script.
+        :return: The index of the new frame.
+        """
+        self.frames.append((script, parent, real_line))
+
+        return len(self.frames) - 1
+
+    def add_lines(self, frame, real_line, count, real_line_count):
+        """
+        Add rendered lines.
+
+        :param frame: The index of the frame the lines were rendered in.
+        :param real_line: The real line of the region the lines were rendered
+            from.
+        :param count: The number of rendered lines.
+        :param real_line_count: The number of real lines of the region. If
+            `count` is greater, the extra lines are mapped to the last real
+            line of the region.
+        """
+        self.line_frames.extend([frame] * count)
+        self.real_lines.extend(range(real_line, real_line + min(
+            count,
+            real_line_count,
+        )))
+
+        if count > real_line_count:
+            self.real_lines.extend(
+                [real_line + real_line_count - 1] * (count - real_line_count),
+            )
+
+    def add_line_offsets(self, frame, real_line, offsets):
+        """
+        Add rendered lines that don't map to the real lines of their region
+        in order.
+
+        :param frame: The index of the frame the lines were rendered in.
+        :param real_line: The real line of the region the lines were rendered
+            from.
+        :param offsets: For every rendered line, the offset of its real line
+            from the first real line of the region.
+        """
+        self.line_frames.extend([frame] * len(offsets))
+        self.real_lines.extend(real_line + offset for offset in offsets)
+
+    def get_scripts_for_line(self, line):
+        """
+        Get the list of (script, real_line) by order of traversal for a given
+        rendered line.
+
+        :param line: The rendered line.
+        :returns: A list of (script, real_line) tuples, starting with the
+            top-level script, that got traversed by that line.
+        """
+        if not 1 <= line <= len(self):
+            raise ValueError("No such line %d in source map" % line)
+
+        frame = self.line_frames[line - 1]
+        real_line = self.real_lines[line - 1]
+        result = []
+
+        while frame >= 0:
+            script, frame, parent_real_line = self.frames[frame]
+            result.append((script, real_line))
+            real_line = parent_real_line
+
+        result.reverse()
+
+        return result
+
+    def get_part(self, frame, line):
+        """
+        Get the part of the source map that a script added.
+
+        :param frame: The index of the frame of the script.
+        :param line: The first rendered line of the script.
+        :return: A new source map, whose frames still refer to each other by
+            their index in this source map.
+        """
+        result = SourceMap()
+        result.frames = self.frames[frame:]
+        result.line_frames = self.line_frames[line:]
+        result.real_lines = self.real_lines[line:]
+
+        return result
+
+    def merge(self, other, frame, script, parent, real_line):
+        """
+        Append a part of another source map, as rendered by an included
+        script.
+
+        :param other: The part of the other source map, as returned by
+            :py:meth:`get_part`. Its first frame is the frame of the included
+            script itself.
+        :param frame: The index of the frame of the included script in the
+            other source map.
+        :param script: The included script, which replaces the script of its
+            frame in `other`.
+        :param parent: The index of the frame of the including script.
+        :param real_line: The real line of the `%include` statement in the
+            including script.
+        """
+        offset = len(self.frames) - frame
+        self.frames.append((script, parent, real_line))
+        self.frames.extend(
+            (frame_script, index + offset, line)
+            for frame_script, index, line in other.frames[1:]
+        )
+        self.line_frames.extend(
+            array('i', (index + offset for index in other.line_frames))
+            if offset else
+            other.line_frames
+        )
+        self.real_lines.extend(other.real_lines)
+
+
+# The chunks and the source map of a rendered script are copies of its own
+# part of the output and of the source map of the context that first rendered
+# it. The chunks are shared with the output, rather than joined, and the frames
+# are only renumbered when the fragment is reused, so that caching the
+# fragments of nested scripts doesn't copy their text at every level. `frame`
+# is the index the frame of the script had in the original source map.
+RenderedFragment = namedtuple(
+    'RenderedFragment',
+    [
+        'chunks',
+        'key_count',
+        'arg_count',
+        'rendered_scripts',
+        'source_map',
+        'frame',
+    ],
+)
+
+
+class FragmentCache(object):
+    """
+    A thread-safe, bounded, cache of rendered scripts.
+
+    Rendering a script only depends on the rendering context, on the key and
+    argument indexes it starts at and on which of the scripts it includes were
+    already rendered. Rendering the same script in the same state twice, as
+    happens when rendering scripts that include a common library with a
+    custom context, reuses the first rendering.
+
+    The least recently used fragments are dropped when the cache is full.
+    """
+
+    def __init__(self, max_size=1024):
+        """
+        Create a new, empty, fragment cache.
+
+        :param max_size: The maximum number of fragments to keep.
+        """
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.fragments = OrderedDict()
+
+    def __repr__(self):
+        return '{_class}(count={count}, max_size={max_size})'.format(
+            _class=self.__class__.__name__,
+            count=len(self),
+            max_size=self.max_size,
+        )
+
+    def __len__(self):
+        return len(self.fragments)
+
+    def get(self, key):
+        """
+        Get a rendered fragment.
+
+        :param key: The key of the fragment.
+        :return: The :py:class:`RenderedFragment`, or `None` if there is no
+            fragment with that key.
+        """
+        with self.lock:
+            fragment = self.fragments.pop(key, None)
+
+            if fragment is not None:
+                self.fragments[key] = fragment
+
+            return fragment
+
+    def add(self, key, fragment):
+        """
+        Cache a rendered fragment.
+
+        :param key: The key of the fragment.
+        :param fragment: The :py:class:`RenderedFragment`.
+        """
+        with self.lock:
+            self.fragments.pop(key, None)
+            self.fragments[key] = fragment
+
+            while len(self.fragments) > self.max_size:
+                self.fragments.popitem(last=False)
+
+    def clear(self):
+        """
+        Remove all the fragments from the cache.
+        """
+        with self.lock:
+            self.fragments.clear()
+
+
+# A fragment cache for rendering contexts to share, when they reuse rendered
+# scripts.
+global_fragment_cache = FragmentCache()
+
+
+class _RenderFrame(object):
+    """
+    The state of a script being rendered.
+    """
+
+    __slots__ = [
+        'script',
+        'regions',
+        'index',
+        'real_line',
+        'empty',
+        'region',
+        'line',
+        'memo',
+    ]
+
+    def __init__(self, script, index, memo):
+        self.script = script
+        self.regions = iter(script.regions)
+        self.index = index
+        self.real_line = 1
+        self.empty = True
+        self.region = None
+        self.line = 0
+        self.memo = memo
+
+
+class RenderContext(object):
+
+    def __init__(self, fragment_cache=None):
+        """
+        Create a new rendering context.
+
+        :param fragment_cache: The :py:class:`FragmentCache` to reuse rendered
+            scripts from. If `None`, rendered scripts are not reused.
+        """
         self.rendered_scripts = set()
         self.last_key_index = 0
         self.last_arg_index = 0
+        self.source_map = SourceMap()
+        self.frame = -1
+        self.real_line = 0
+        # Rendering methods that drop lines of a region set this to the
+        # offsets of the real lines of the lines they rendered.
+        self.line_offsets = None
+        self.fragment_cache = fragment_cache
+
+    @property
+    def memo_key(self):
+        """
+        A hashable value that identifies how the context renders scripts, or
+        `None` if scripts rendered by the context must not be reused.
+
+        Subclasses that don't override this property don't reuse rendered
+        scripts. Subclasses whose rendering only depends on their class can
+        return `()`, while subclasses whose rendering depends on some of their
+        attributes must return those attributes.
+        """
+        if type(self) is RenderContext:
+            return ()
+
+        return None
 
     def render_script(self, script):
+        """
+        Render a script.
+
+        :param script: The script to render.
+        :return: The rendered script, or `None` if the script can only be
+            included once and was already rendered.
+        """
         if script in self.rendered_scripts:
             return None
+
+        output = []
+        self._render_script(script, write=output.append, output=output)
+
+        return ''.join(output)
+
+    def write_script(self, script, stream):
+        """
+        Render a script into a file-like object, as it gets rendered.
+
+        Cached fragments are reused, but the fragments of the script are not
+        cached, so that the rendered script is never buffered in memory.
+
+        :param script: The script to render.
+        :param stream: The file-like object to write the rendered script to.
+        :return: `False` if the script can only be included once and was
+            already rendered, `True` otherwise.
+        """
+        if script in self.rendered_scripts:
+            return False
+
+        self._render_script(script, write=stream.write)
+
+        return True
+
+    def _render_script(self, script, write, output=None):
+        """
+        Render a script, chunk by chunk.
+
+        The tree of included scripts is walked iteratively, so that rendering
+        deeply nested scripts is linear in the size of the rendered script
+        and doesn't depend on the recursion limit.
+
+        :param script: The script to render.
+        :param write: The function to call with every rendered chunk.
+        :param output: The list that `write` appends the chunks to, if any.
+            Rendered fragments are only cached when it is given.
+        """
+        source_map = self.source_map
+        parent, parent_real_line = self.frame, self.real_line
+        stack = []
+
+        # The chunks rendered so far, if fragments are cached. Streamed
+        # scripts reuse cached fragments but don't record new ones, so that
+        # their output is never buffered.
+        if self.fragment_cache is None or self.memo_key is None:
+            recorded = None
         else:
-            if not script.multiple_inclusion:
-                self.rendered_scripts.add(script)
-
-        return '\n'.join(
-            line
-            for line in (
-                region.render(self)
-                for region in script.regions
+            recorded = output
+
+        try:
+            chunks = self._enter_script(script, stack, recorded)
+
+            if chunks is not None:
+                for chunk in chunks:
+                    write(chunk)
+
+            while stack:
+                frame = stack[-1]
+                region = next(frame.regions, None)
+
+                if region is None:
+                    stack.pop()
+                    self._leave_script(frame, recorded)
+
+                    if stack:
+                        self._leave_region(stack[-1])
+
+                    continue
+
+                if isinstance(region, ScriptRegion):
+                    if region.script in self.rendered_scripts:
+                        frame.real_line += region.real_line_count
+                        continue
+
+                    frame.region, frame.line = region, len(source_map)
+
+                    if frame.empty:
+                        frame.empty = False
+                    else:
+                        write('\n')
+
+                    self.frame, self.real_line = frame.index, frame.real_line
+                    chunks = self._enter_script(region.script, stack, recorded)
+
+                    if chunks is not None:
+                        for chunk in chunks:
+                            write(chunk)
+
+                        self._leave_region(frame)
+
+                    continue
+
+                line = region.render(self)
+
+                if line is not None:
+                    if self.line_offsets is None:
+                        source_map.add_lines(
+                            frame=frame.index,
+                            real_line=frame.real_line,
+                            count=line.count('\n') + 1,
+                            real_line_count=region.real_line_count,
+                        )
+                    else:
+                        source_map.add_line_offsets(
+                            frame=frame.index,
+                            real_line=frame.real_line,
+                            offsets=self.line_offsets,
+                        )
+                        self.line_offsets = None
+
+                    if frame.empty:
+                        frame.empty = False
+                    else:
+                        write('\n')
+
+                    write(line)
+
+                frame.real_line += region.real_line_count
+        finally:
+            self.frame, self.real_line = parent, parent_real_line
+
+    def _enter_script(self, script, stack, recorded):
+        """
+        Start rendering a script.
+
+        :param script: The script to render.
+        :param stack: The stack of the scripts being rendered.
+        :param recorded: The list of the chunks rendered so far, or `None` if
+            fragments aren't cached.
+        :return: The chunks of the rendered script, if it was reused from the
+            fragment cache, or `None` if a frame for it was pushed on `stack`.
+        """
+        memo_key = None if self.fragment_cache is None else self.memo_key
+        memo = None
+
+        if memo_key is not None:
+            rendered_scripts = frozenset(
+                self.rendered_scripts.intersection(script.included_scripts),
+            )
+            key = (
+                type(self),
+                memo_key,
+                script.digest,
+                self.last_key_index,
+                self.last_arg_index,
+                rendered_scripts,
             )
-            if line is not None
+            fragment = self.fragment_cache.get(key)
+
+            if fragment is not None:
+                if not script.multiple_inclusion:
+                    self.rendered_scripts.add(script)
+
+                self.rendered_scripts.update(fragment.rendered_scripts)
+                self.last_key_index += fragment.key_count
+                self.last_arg_index += fragment.arg_count
+                self.source_map.merge(
+                    fragment.source_map,
+                    frame=fragment.frame,
+                    script=script,
+                    parent=self.frame,
+                    real_line=self.real_line,
+                )
+
+                return fragment.chunks
+
+            if recorded is not None:
+                memo = (
+                    key,
+                    rendered_scripts,
+                    len(recorded),
+                    len(self.source_map),
+                    self.last_key_index,
+                    self.last_arg_index,
+                )
+
+        if not script.multiple_inclusion:
+            self.rendered_scripts.add(script)
+
+        stack.append(
+            _RenderFrame(
+                script=script,
+                index=self.source_map.add_frame(
+                    script=script,
+                    parent=self.frame,
+                    real_line=self.real_line,
+                ),
+                memo=memo,
+            ),
         )
 
+    def _leave_script(self, frame, recorded):
+        """
+        Finish rendering a script, and cache its fragment if needed.
+
+        :param frame: The frame of the script.
+        :param recorded: The list of the chunks rendered so far, or `None` if
+            fragments aren't cached.
+        """
+        if frame.memo is None:
+            return
+
+        key, rendered_scripts, chunk, line, last_key_index, last_arg_index = (
+            frame.memo
+        )
+        self.fragment_cache.add(
+            key,
+            RenderedFragment(
+                chunks=tuple(recorded[chunk:]),
+                key_count=self.last_key_index - last_key_index,
+                arg_count=self.last_arg_index - last_arg_index,
+                rendered_scripts=frozenset(
+                    self.rendered_scripts.intersection(
+                        frame.script.included_scripts,
+                    ),
+                ) - rendered_scripts,
+                source_map=self.source_map.get_part(
+                    frame=frame.index,
+                    line=line,
+                ),
+                frame=frame.index,
+            ),
+        )
+
+    def _leave_region(self, frame):
+        """
+        Finish rendering a script region.
+
+        :param frame: The frame of the script that contains the region.
+        """
+        region = frame.region
+
+        # Included scripts map their own lines, unless they rendered to
+        # nothing but an empty line.
+        if len(self.source_map) == frame.line:
+            self.source_map.add_lines(
+                frame=frame.index,
+                real_line=frame.real_line,
+                count=1,
+                real_line_count=region.real_line_count,
+            )
+
+        frame.real_line += region.real_line_count
+
     def render_key(self, name):
         self.last_key_index += 1
 
@@ -56,6 +605,39 @@ class RenderContext(object):
                 name=name,
                 index=self.last_arg_index,
             )
+        elif type_ is MessagePack:
+            return (
+                "local {name} = cmsgpack.unpack(ARGV[{index}])"
+            ).format(
+                name=name,
+                index=self.last_arg_index,
+            )
+        elif type_ in {IntegerArray, FloatArray}:
+            # Both array types pack their numbers on 8 bytes. They are unpacked
+            # one at a time, as unpacking them all at once would overflow the
+            # LUA stack for large arrays.
+            return (
+                "local {name} = (function(s) local t = {{}} "
+                "for i = 1, #s / 8 do "
+                "t[i] = struct.unpack('<{format}', s, i * 8 - 7) "
+                "end return t end)(ARGV[{index}])"
+            ).format(
+                name=name,
+                format=type_.LUA_FORMAT,
+                index=self.last_arg_index,
+            )
+        elif type_ is Hash:
+            # The argument holds the index of the number of pairs, which are
+            # right after it.
+            return (
+                "local {name} = (function(s) local t = {{}} "
+                "for i = s + 1, s + 2 * ARGV[s], 2 do "
+                "t[ARGV[i]] = ARGV[i + 1] "
+                "end return t end)(tonumber(ARGV[{index}]))"
+            ).format(
+                name=name,
+                index=self.last_arg_index,
+            )
         else:
             return "local {name} = ARGV[{index}]".format(
                 name=name,
@@ -73,3 +655,50 @@ class RenderContext(object):
 
     def render_text(self, text):
         return text
+
+
+class MinifyingRenderContext(RenderContext):
+    """
+    A rendering context that minifies the rendered scripts.
+
+    Comments, blank lines and indentation are removed, as well as the comments
+    rendered for `%return` and `%pragma` directives. The source map still maps
+    every rendered line to the real line it comes from, so that errors raised
+    by Redis can be translated with it.
+    """
+
+    @property
+    def memo_key(self):
+        if type(self) is MinifyingRenderContext:
+            return ()
+
+        return None
+
+    def render_key(self, name):
+        return minify(
+            super(MinifyingRenderContext, self).render_key(name=name),
+        )[0]
+
+    def render_arg(self, name, type_):
+        return minify(
+            super(MinifyingRenderContext, self).render_arg(
+                name=name,
+                type_=type_,
+            ),
+        )[0]
+
+    def render_return(self, type_):
+        return None
+
+    def render_pragma(self, value):
+        super(MinifyingRenderContext, self).render_pragma(value=value)
+
+        return None
+
+    def render_text(self, text):
+        text, offsets = minify(text)
+
+        if text is not None:
+            self.line_offsets = offsets
+
+        return text
@@ -11,37 +11,208 @@ except ImportError:
     from json import loads as jloads
     jdumps = partial(dumps, separators=(',', ':'))
 
+try:  # pragma: no cover
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+import hashlib
 import six
+import struct
 
+from bisect import bisect_right
 from collections import namedtuple
 from functools import partial
-from redis.client import Script as RedisScript
 from redis.client import BasePipeline
+from redis.exceptions import NoScriptError
 
 from .exceptions import error_handler
 from .regions import (
     ArgumentRegion,
+    FloatArray,
+    Hash,
+    IntegerArray,
     KeyRegion,
+    MessagePack,
     ReturnRegion,
     PragmaRegion,
     ScriptRegion,
+    TextRegion,
 )
 from .render import RenderContext
 
+# Defined at the module level so that it can be pickled.
+_LineInfo = namedtuple(
+    '_LineInfo',
+    [
+        'first_real_line',
+        'real_line',
+        'real_line_count',
+        'first_line',
+        'line',
+        'line_count',
+        'region',
+    ],
+)
+
+
+Rendering = namedtuple('Rendering', ['text', 'sha1', 'source_map'])
+
+
+class _LineCountFrame(object):
+    """
+    The state of an included script being walked to count its lines.
+    """
+
+    __slots__ = [
+        'script',
+        'regions',
+        'visited',
+        'line_count',
+    ]
+
+    def __init__(self, script, visited):
+        self.script = script
+        self.regions = iter(script.regions)
+        self.visited = visited
+        self.line_count = 0
+
+
+class _PipelineScript(object):
+    """
+    A script, as redis-py pipelines expect it to be before they can load it.
+    """
+
+    __slots__ = [
+        'sha',
+        '_script',
+        '_rendering',
+    ]
+
+    def __init__(self, script, rendering=None):
+        self.sha = script.sha1 if rendering is None else rendering.sha1
+        self._script = script
+        self._rendering = rendering
+
+    def __eq__(self, other):
+        if not isinstance(other, _PipelineScript):
+            return NotImplemented
+
+        return other.sha == self.sha
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.sha)
+
+    @property
+    def script(self):
+        if self._rendering is None:
+            return self._script.rendered_bytes
+
+        return self._rendering.text.encode('utf-8')
+
+
+def mdumps(value):
+    """
+    Serialize a value with MessagePack.
+
+    :param value: The value to serialize.
+    :return: The serialized value, as bytes.
+    """
+    if msgpack is None:
+        raise ImportError(
+            "The `msgpack` package is required for MessagePack arguments",
+        )
+
+    return msgpack.packb(value, use_bin_type=True)
+
+
+def mloads(value):
+    """
+    Deserialize a value serialized with MessagePack.
+
+    Strings are not decoded, and are returned as bytes, like the strings of
+    any other Redis reply: LUA strings are binary, and `cmsgpack` packs them
+    with the MessagePack string type, whether they hold text or not.
+
+    :param value: The serialized value, as bytes.
+    :return: The value.
+    """
+    if msgpack is None:
+        raise ImportError(
+            "The `msgpack` package is required for MessagePack return values",
+        )
+
+    return msgpack.unpackb(value, raw=True)
+
+
+def pack_array(type_, values):
+    """
+    Pack an array of numbers into a binary string.
+
+    :param type_: The type of the array, either
+        :py:class:`IntegerArray <redis_lua.regions.IntegerArray>` or
+        :py:class:`FloatArray <redis_lua.regions.FloatArray>`.
+    :param values: An iterable of numbers.
+    :return: The packed array, as bytes.
+    """
+    values = list(values)
+
+    return struct.pack('<%d%s' % (len(values), type_.FORMAT), *values)
+
+
+def unpack_array(type_, value):
+    """
+    Unpack an array of numbers from a binary string.
+
+    :param type_: The type of the array, either
+        :py:class:`IntegerArray <redis_lua.regions.IntegerArray>` or
+        :py:class:`FloatArray <redis_lua.regions.FloatArray>`.
+    :param value: The packed array, as bytes.
+    :return: The list of numbers.
+    """
+    count = len(value) // struct.calcsize('<' + type_.FORMAT)
+
+    return list(struct.unpack('<%d%s' % (count, type_.FORMAT), value))
+
+
+def _get_duplicates(values):
+    seen = set()
+    result = set()
+
+    for value in values:
+        if value in seen:
+            result.add(value)
+        else:
+            seen.add(value)
+
+    return result
+
 
 @six.python_2_unicode_compatible
 class Script(object):
     SENTINEL = object()
     __slots__ = [
         'name',
+        'digest',
         'keys',
         'args',
         'return_type',
         'multiple_inclusion',
+        'included_scripts',
         'line_infos',
+        'line_starts',
+        'real_line_starts',
         'regions',
         '_render',
-        '_redis_script',
+        '_rendered_bytes',
+        '_source_map',
+        '_sha1',
+        '_renderings',
+        '_line_counts',
+        '__weakref__',
     ]
 
     @classmethod
@@ -62,9 +233,9 @@ class Script(object):
 
                 result.append(region.name)
             elif isinstance(region, ScriptRegion):
-                result.extend(cls.get_keys_from_regions(region.script.regions))
+                result.extend(region.script.keys)
 
-        duplicates = {x for x in result if result.count(x) > 1}
+        duplicates = _get_duplicates(result)
 
         if duplicates:
             raise ValueError("Duplicate key(s) %r" % list(duplicates))
@@ -89,9 +260,9 @@ class Script(object):
 
                 result.append((region.name, region.type_))
             elif isinstance(region, ScriptRegion):
-                result.extend(cls.get_args_from_regions(region.script.regions))
+                result.extend(region.script.args)
 
-        duplicates = {x for x in result if result.count(x) > 1}
+        duplicates = _get_duplicates(result)
 
         if duplicates:
             raise ValueError("Duplicate arguments(s) %r" % list(duplicates))
@@ -123,18 +294,7 @@ class Script(object):
 
         return result
 
-    _LineInfo = namedtuple(
-        '_LineInfo',
-        [
-            'first_real_line',
-            'real_line',
-            'real_line_count',
-            'first_line',
-            'line',
-            'line_count',
-            'region',
-        ],
-    )
+    _LineInfo = _LineInfo
 
     @classmethod
     def get_line_info_for_regions(cls, regions, included_scripts):
@@ -143,15 +303,20 @@ class Script(object):
         first_line, line, line_count, region) for the specified list of
         regions.
 
+        The lines are the ones of the default rendering: scripts that can only
+        be included once and that were visited already have no lines, and
+        neither have their regions.
+
         :params regions: A list of regions to get the line information from.
-        :params included_scripts: A set of scripts that were visited already.
+        :params included_scripts: A set of the scripts that can only be
+            included once and that were visited already.
         :returns: A list of tuples.
         """
         result = []
         real_line = 1
         line = 1
 
-        def add_region(real_line, line, region):
+        def add_region(real_line, line, line_count, region):
             result.append(
                 cls._LineInfo(
                     real_line,
@@ -159,32 +324,181 @@ class Script(object):
                     region.real_line_count,
                     line,
                     line,
-                    region.line_count,
+                    line_count,
                     region,
                 ),
             )
 
         for region in regions:
             if isinstance(region, ScriptRegion):
-                if region.script in included_scripts:
+                script = region.script
+
+                if script in included_scripts:
                     real_line += region.real_line_count
                     continue
 
-                included_scripts.add(region.script)
-                sub_result = cls.get_line_info_for_regions(
-                    regions=region.script.regions,
+                if not script.multiple_inclusion:
+                    included_scripts.add(script)
+
+                line_count = cls.get_line_count_for_script(
+                    script=script,
                     included_scripts=included_scripts,
                 )
-                add_region(real_line, line, region)
+
+                add_region(real_line, line, line_count, region)
                 real_line += region.real_line_count
-                line += sub_result[-1].line + sub_result[-1].line_count - 1
+                line += line_count
             else:
-                add_region(real_line, line, region)
+                add_region(real_line, line, region.line_count, region)
                 real_line += region.real_line_count
                 line += region.line_count
 
         return result
 
+    @classmethod
+    def get_known_line_count(cls, script, included_scripts):
+        """
+        Get the number of lines an included script renders to, if it is known
+        without walking the script.
+
+        :params script: The included script, which wasn't visited yet.
+        :params included_scripts: A set of the scripts that can only be
+            included once and that were visited already. If the line count is
+            known, the scripts that `script` includes, and that can only be
+            included once, are added to it.
+        :returns: A (line_count, visited) tuple, where `line_count` is `None`
+            if the script must be walked, and `visited` is the set of the
+            scripts that `script` includes and that were visited already.
+        """
+        if included_scripts.isdisjoint(script.included_scripts):
+            # None of the scripts it includes were visited: the included
+            # script lines are exactly its own lines.
+            included_scripts.update(
+                included_script
+                for included_script in script.included_scripts
+                if not included_script.multiple_inclusion
+            )
+
+            return script.line_count, frozenset()
+
+        visited = frozenset(
+            included_scripts.intersection(script.included_scripts),
+        )
+        line_count, added = (script._line_counts or {}).get(
+            visited,
+            (None, None),
+        )
+
+        if line_count is not None:
+            included_scripts.update(added)
+
+        return line_count, visited
+
+    @classmethod
+    def get_line_count_for_script(cls, script, included_scripts):
+        """
+        Get the number of lines an included script renders to.
+
+        The included scripts are walked iteratively. The line count of every
+        walked script is remembered, for the set of the scripts it includes
+        that were visited before it, so that building scripts that include
+        each other doesn't walk the same scripts over and over again.
+
+        :params script: The included script, which wasn't visited yet.
+        :params included_scripts: A set of the scripts that can only be
+            included once and that were visited already. The scripts that
+            `script` includes, and that can only be included once, are added
+            to it.
+        :returns: The number of lines.
+        """
+        line_count, visited = cls.get_known_line_count(
+            script=script,
+            included_scripts=included_scripts,
+        )
+
+        if line_count is not None:
+            return line_count
+
+        stack = [_LineCountFrame(script=script, visited=visited)]
+
+        while True:
+            frame = stack[-1]
+            region = next(frame.regions, None)
+
+            if region is None:
+                stack.pop()
+                # A script whose regions all got skipped still renders as an
+                # empty line.
+                line_count = frame.line_count or 1
+
+                if frame.script._line_counts is None:
+                    frame.script._line_counts = {}
+
+                frame.script._line_counts[frame.visited] = (
+                    line_count,
+                    frozenset(
+                        included_scripts.intersection(
+                            frame.script.included_scripts,
+                        ),
+                    ) - frame.visited,
+                )
+
+                if not stack:
+                    return line_count
+
+                stack[-1].line_count += line_count
+            elif isinstance(region, ScriptRegion):
+                if region.script in included_scripts:
+                    continue
+
+                if not region.script.multiple_inclusion:
+                    included_scripts.add(region.script)
+
+                line_count, visited = cls.get_known_line_count(
+                    script=region.script,
+                    included_scripts=included_scripts,
+                )
+
+                if line_count is None:
+                    stack.append(
+                        _LineCountFrame(script=region.script, visited=visited),
+                    )
+                else:
+                    frame.line_count += line_count
+            else:
+                frame.line_count += region.line_count
+
+    @classmethod
+    def get_digest_from_regions(cls, name, regions):
+        """
+        Get the structural digest of a script.
+
+        The digest covers the name of the script and all its regions. Included
+        scripts are covered through their own digest, so computing the digest
+        of a script never walks the scripts it includes.
+
+        :param name: The name of the script.
+        :param regions: The regions of the script.
+        :returns: The hexadecimal SHA1 digest.
+        """
+        digest = hashlib.sha1(name.encode('utf-8'))
+
+        for region in regions:
+            region.update_digest(digest)
+
+        return digest.hexdigest()
+
+    @classmethod
+    def get_included_scripts_from_regions(cls, regions):
+        result = set()
+
+        for region in regions:
+            if isinstance(region, ScriptRegion):
+                result.add(region.script)
+                result.update(region.script.included_scripts)
+
+        return frozenset(result)
+
     def __init__(self, name, regions):
         """
         Create a new script object.
@@ -196,13 +510,22 @@ class Script(object):
             raise ValueError('regions cannot be empty')
 
         self.name = name
+        self.digest = self.get_digest_from_regions(name, regions)
         self.keys = self.get_keys_from_regions(regions)
         self.args = self.get_args_from_regions(regions)
         self.return_type = self.get_return_from_regions(regions)
         self.multiple_inclusion = self.get_multiple_inclusion_from_regions(
             regions,
         )
-        self.line_infos = self.get_line_info_for_regions(regions, {self})
+        self.included_scripts = self.get_included_scripts_from_regions(
+            regions,
+        )
+        self.line_infos = self.get_line_info_for_regions(
+            regions,
+            set() if self.multiple_inclusion else {self},
+        )
+        self.line_starts = [info.line for info in self.line_infos]
+        self.real_line_starts = [info.real_line for info in self.line_infos]
 
         duplicates = set(self.keys) & {arg for arg, _ in self.args}
 
@@ -215,7 +538,31 @@ class Script(object):
 
         self.regions = regions
         self._render = None
-        self._redis_script = None
+        self._rendered_bytes = None
+        self._source_map = None
+        self._sha1 = None
+        self._renderings = None
+        self._line_counts = None
+
+    def __getstate__(self):
+        state = {
+            slot: getattr(self, slot)
+            for slot in self.__slots__
+            if slot != '__weakref__'
+        }
+
+        # The encoded rendering, the source map, the custom renderings and the
+        # line counts are rebuilt on first use, if ever.
+        state['_rendered_bytes'] = None
+        state['_source_map'] = None
+        state['_renderings'] = None
+        state['_line_counts'] = None
+
+        return state
+
+    def __setstate__(self, state):
+        for slot, value in state.items():
+            setattr(self, slot, value)
 
     def __repr__(self):
         return '{_class}(name={self.name!r})'.format(
@@ -224,7 +571,7 @@ class Script(object):
         )
 
     def __hash__(self):
-        return hash(self.name)
+        return hash(self.digest)
 
     @property
     def line_count(self):
@@ -245,12 +592,12 @@ class Script(object):
         :param line: The line.
         :returns: A line content.
         """
-        info = self.get_line_info(line)
+        info = self.find_line_info(line)
 
-        if isinstance(info.region, ScriptRegion):
-            return info.region.content
+        if isinstance(info.region, TextRegion):
+            return info.region.lines[line - info.first_line]
         else:
-            return info.region.content.split('\n')[line - info.first_line]
+            return info.region.content
 
     def get_scripts_for_line(self, line):
         """
@@ -259,17 +606,67 @@ class Script(object):
         :param line: The line.
         :returns: A list of (script, line) that got traversed by that line.
         """
-        info = self.get_line_info(line)
-        result = [(self, info.real_line)]
+        return self.source_map.get_scripts_for_line(line)
 
-        if isinstance(info.region, ScriptRegion):
-            result.extend(
-                info.region.script.get_scripts_for_line(
-                    line - info.first_line + 1,
-                ),
-            )
+    def get_source_line(self, real_line):
+        """
+        Get the content of a line of the script source.
 
-        return result
+        :param real_line: The real line.
+        :returns: The line content or, if the line is a directive, the
+            directive statement.
+        """
+        info = self.find_real_line_info(real_line)
+
+        if isinstance(info.region, TextRegion):
+            return info.region.lines[real_line - info.first_real_line]
+        else:
+            return info.region.content
+
+    def find_real_line_info(self, real_line):
+        """
+        Find the line information of the region that holds the specified real
+        line.
+
+        :param real_line: The real line.
+        :returns: The (first_real_line, real_line, real_line_count,
+            first_line, line, line_count, region) tuple of the region or
+            `ValueError` if no such real line exists or if it belongs to a
+            region that is never rendered.
+        """
+        index = bisect_right(self.real_line_starts, real_line) - 1
+
+        if index >= 0:
+            info = self.line_infos[index]
+
+            if real_line < info.real_line + info.real_line_count:
+                return info
+
+        raise ValueError(
+            "No such real line %d in script %s" % (real_line, self),
+        )
+
+    def find_line_info(self, line):
+        """
+        Find the line information of the region that holds the specified line.
+
+        The lookup is a binary search and the result is shared: it is the
+        line information of the whole region, as found in `line_infos`.
+
+        :param line: The line.
+        :returns: The (first_real_line, real_line, real_line_count,
+            first_line, line, line_count, region) tuple of the region or
+            `ValueError` if no such line exists.
+        """
+        index = bisect_right(self.line_starts, line) - 1
+
+        if index >= 0:
+            info = self.line_infos[index]
+
+            if line < info.line + info.line_count:
+                return info
+
+        raise ValueError("No such line %d in script %s" % (line, self))
 
     def get_line_info(self, line):
         """
@@ -279,32 +676,104 @@ class Script(object):
         :returns: The (real_line, real_line_count, line, line_count, region)
             tuple or `ValueError` if no such line exists.
         """
-        for info in self.line_infos:
-            if line >= info.line and line < info.line + info.line_count:
-                return self._LineInfo(
-                    first_real_line=info.first_real_line,
-                    real_line=info.real_line + min(
-                        line - info.line,
-                        info.real_line_count - 1,
-                    ),
-                    real_line_count=info.real_line_count,
-                    first_line=info.first_line,
-                    line=line,
-                    line_count=info.line_count,
-                    region=info.region,
-                )
-
-        raise ValueError("No such line %d in script %s" % (line, self))
+        info = self.find_line_info(line)
+
+        return self._LineInfo(
+            first_real_line=info.first_real_line,
+            real_line=info.real_line + min(
+                line - info.line,
+                info.real_line_count - 1,
+            ),
+            real_line_count=info.real_line_count,
+            first_line=info.first_line,
+            line=line,
+            line_count=info.line_count,
+            region=info.region,
+        )
 
     def __str__(self):
         return self.name + ".lua"
 
-    def render(self, context=None):
-        if context is None:
+    @property
+    def source_map(self):
+        """
+        The :py:class:`SourceMap <redis_lua.render.SourceMap>` of the default
+        rendering of the script.
+        """
+        if self._source_map is None:
             context = RenderContext()
+            self._render = context.render_script(self)
+            self._source_map = context.source_map
+
+        return self._source_map
+
+    @property
+    def rendered_bytes(self):
+        """
+        The default rendering of the script, encoded in UTF-8, as it is sent
+        to Redis.
+        """
+        if self._rendered_bytes is None:
+            self._rendered_bytes = self.render().encode('utf-8')
+
+        return self._rendered_bytes
+
+    @property
+    def sha1(self):
+        """
+        The SHA1 of the default rendering of the script, which identifies the
+        script in the script cache of Redis.
+        """
+        if self._sha1 is None:
+            self._sha1 = hashlib.sha1(self.rendered_bytes).hexdigest()
+
+        return self._sha1
 
+    def get_rendering(self, context_class=None):
+        """
+        Get a rendering of the script, along with its SHA1 and its source map.
+
+        Renderings are cached: the script is only rendered once with each
+        context class.
+
+        :param context_class: The :py:class:`RenderContext
+            <redis_lua.render.RenderContext>` subclass to render the script
+            with, such as :py:class:`MinifyingRenderContext
+            <redis_lua.render.MinifyingRenderContext>`. It must be
+            instantiable without arguments. If `None`, the default rendering
+            is returned.
+        :returns: A (text, sha1, source_map) named tuple.
+        """
+        if context_class is None:
+            return Rendering(
+                text=self.render(),
+                sha1=self.sha1,
+                source_map=self.source_map,
+            )
+
+        if self._renderings is None:
+            self._renderings = {}
+
+        rendering = self._renderings.get(context_class)
+
+        if rendering is None:
+            context = context_class()
+            text = self.render(context)
+            rendering = Rendering(
+                text=text,
+                sha1=hashlib.sha1(text.encode('utf-8')).hexdigest(),
+                source_map=context.source_map,
+            )
+            self._renderings[context_class] = rendering
+
+        return rendering
+
+    def render(self, context=None):
+        if context is None:
             if not self._render:
+                context = RenderContext()
                 self._render = context.render_script(self)
+                self._source_map = context.source_map
 
             return self._render
         else:
@@ -314,10 +783,7 @@ class Script(object):
         if not isinstance(other, Script):
             return NotImplemented
 
-        return all([
-            other.name == self.name,
-            other.regions == self.regions,
-        ])
+        return other.digest == self.digest
 
     @classmethod
     def convert_argument_for_call(cls, type_, value):
@@ -329,6 +795,18 @@ class Script(object):
             return jdumps(list(value))
         elif type_ is dict:
             return jdumps(dict(value))
+        elif type_ is MessagePack:
+            return mdumps(value)
+        elif type_ in [IntegerArray, FloatArray]:
+            return pack_array(type_, value)
+        elif type_ is Hash:
+            value = dict(value)
+
+            return [len(value)] + [
+                item
+                for pair in value.items()
+                for item in pair
+            ]
         else:
             return str(value)
 
@@ -345,6 +823,10 @@ class Script(object):
                 value = value.decode('utf-8')
 
             return jloads(value)
+        elif type_ is MessagePack:
+            return mloads(value)
+        elif type_ in [IntegerArray, FloatArray]:
+            return unpack_array(type_, value)
         else:
             return value
 
@@ -354,6 +836,9 @@ class Script(object):
 
         :returns: The script result.
         """
+        return self._run(client, None, **kwargs)
+
+    def _run(self, client, rendering, **kwargs):
         sentinel = self.SENTINEL
         keys = {
             key: index
@@ -402,38 +887,112 @@ class Script(object):
                 "Missing argument(s) %r" % list(missing_args),
             )
 
-        with error_handler(self):
-            if not self._redis_script:
-                self._redis_script = RedisScript(
-                    registered_client=client,
-                    script=self.render(),
-                )
+        # The pairs of the hash arguments are appended after all the other
+        # arguments, each hash argument being replaced by the index of its
+        # pairs.
+        for index, (arg, type_) in enumerate(self.args):
+            if type_ is Hash:
+                pairs = args_params[index]
+                args_params[index] = len(args_params) + 1
+                args_params.extend(pairs)
 
-            result = self._redis_script(
-                keys=keys_params,
-                args=args_params,
-                client=client,
-            )
+        params = keys_params + args_params
+
+        if rendering is None:
+            sha1 = self.sha1
+            source_map = None
+        else:
+            sha1 = rendering.sha1
+            source_map = rendering.source_map
 
+        with error_handler(self, source_map=source_map):
             if isinstance(client, BasePipeline):
+                # The pipeline loads the scripts that Redis lacks before
+                # running its commands.
+                client.scripts.add(_PipelineScript(self, rendering))
+                client.evalsha(sha1, len(keys_params), *params)
+
                 return partial(
                     self.convert_return_value_from_call,
                     self.return_type,
                 )
-            else:
-                return self.convert_return_value_from_call(
-                    self.return_type,
-                    result,
+
+            try:
+                result = client.evalsha(sha1, len(keys_params), *params)
+            except NoScriptError:
+                client.script_load(
+                    self.rendered_bytes if rendering is None else
+                    rendering.text.encode('utf-8'),
                 )
+                result = client.evalsha(sha1, len(keys_params), *params)
+
+            return self.convert_return_value_from_call(
+                self.return_type,
+                result,
+            )
 
-    def get_runner(self, client):
+    def get_runner(self, client, context_class=None):
         """
         Get a runner for the script on the specified `client`.
 
         :param client: The Redis instance to call the script on.
+        :param context_class: The :py:class:`RenderContext
+            <redis_lua.render.RenderContext>` subclass to render the script
+            with, such as :py:class:`MinifyingRenderContext
+            <redis_lua.render.MinifyingRenderContext>`. The rendering is
+            cached, as explained in :py:meth:`get_rendering`. If `None`, the
+            default rendering is run.
         :returns: The runner, a callable that takes the script named arguments
             and returns its result. If `client` is a pipeline, then the runner
             returns another callable, through which the resulting value must be
             passed to be parsed.
         """
-        return partial(self.runner, client)
+        if context_class is None:
+            return partial(self.runner, client)
+
+        return partial(
+            self._run,
+            client,
+            self.get_rendering(context_class=context_class),
+        )
+
+
+def register_scripts(client, scripts):
+    """
+    Make sure that scripts are in the script cache of a Redis server.
+
+    The SHA1 of all the scripts are checked in a single round trip, and the
+    scripts that Redis lacks are then loaded in a second, pipelined, one. No
+    script is sent if Redis already knows them all.
+
+    :param client: The Redis client.
+    :param scripts: An iterable of scripts.
+    :return: The list of the scripts that were loaded.
+    """
+    shas = set()
+    unique_scripts = []
+
+    for script in scripts:
+        if script.sha1 not in shas:
+            shas.add(script.sha1)
+            unique_scripts.append(script)
+
+    if not unique_scripts:
+        return []
+
+    exists = client.script_exists(*[script.sha1 for script in unique_scripts])
+    missing = [
+        script
+        for script, script_exists in zip(unique_scripts, exists)
+        if not script_exists
+    ]
+
+    if missing:
+        pipeline = client.pipeline(transaction=False)
+
+        for script in missing:
+            pipeline.script_load(script.rendered_bytes)
+
+        pipeline.execute()
+
+    return missing
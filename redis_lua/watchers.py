@@ -0,0 +1,232 @@
+"""
+File watchers, used to detect changes to scripts on disk.
+"""
+
+import os
+import sys
+import time
+
+try:  # pragma: no cover
+    import inotify_simple
+except ImportError:  # pragma: no cover
+    inotify_simple = None
+
+from .files import (
+    SCRIPT_EXTENSION,
+    iter_script_entries,
+    iter_script_names,
+    scandir,
+)
+
+
+class PollingWatcher(object):
+    """
+    Detect changes to scripts by periodically comparing the modification
+    time and size of all the script files.
+
+    This watcher works everywhere but its cost grows with the number of
+    scripts.
+    """
+
+    def __init__(self, path, interval=1.0):
+        """
+        Create a new polling watcher.
+
+        :param path: A path to watch for LUA scripts changes.
+        :param interval: The interval, in seconds, between two polls when
+            waiting for changes.
+        """
+        self.path = path
+        self.interval = interval
+        self.snapshot = self.take_snapshot()
+
+    def __repr__(self):
+        return '{_class}(path={self.path!r})'.format(
+            _class=self.__class__.__name__,
+            self=self,
+        )
+
+    def take_snapshot(self):
+        result = {}
+
+        for name, entry in iter_script_entries(self.path):
+            stat = entry.stat()
+            result[name] = stat.st_mtime, stat.st_size
+
+        return result
+
+    def get_changes(self, timeout=0):
+        """
+        Get the names of the scripts that were added, modified or removed
+        since the last call.
+
+        :param timeout: The maximum time, in seconds, to wait for a change.
+        :return: A set of script names, possibly empty if nothing changed
+            within `timeout`.
+        """
+        deadline = time.time() + timeout
+
+        while True:
+            snapshot = self.take_snapshot()
+            result = {
+                name
+                for name in set(snapshot) | set(self.snapshot)
+                if snapshot.get(name) != self.snapshot.get(name)
+            }
+            self.snapshot = snapshot
+            remaining = deadline - time.time()
+
+            if result or remaining <= 0:
+                return result
+
+            time.sleep(min(self.interval, remaining))
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher(object):
+    """
+    Detect changes to scripts through Linux's inotify.
+
+    The cost of this watcher only depends on the number of changes. It
+    requires the `inotify_simple` package.
+    """
+
+    def __init__(self, path):
+        """
+        Create a new inotify watcher.
+
+        :param path: A path to watch for LUA scripts changes.
+        """
+        flags = inotify_simple.flags
+
+        self.path = path
+        self.inotify = inotify_simple.INotify()
+        self.mask = (
+            flags.CREATE |
+            flags.DELETE |
+            flags.CLOSE_WRITE |
+            flags.MOVED_FROM |
+            flags.MOVED_TO
+        )
+        self.directories = {}
+        self.names = set()
+        self.add_directory('')
+
+    def __repr__(self):
+        return '{_class}(path={self.path!r})'.format(
+            _class=self.__class__.__name__,
+            self=self,
+        )
+
+    def add_directory(self, prefix):
+        """
+        Watch a directory and all its sub-directories.
+
+        :param prefix: The path of the directory relative to the watched path,
+            with a trailing forward slash, or an empty string for the watched
+            path itself.
+        :return: The set of the names of the scripts in the directory.
+        """
+        names = {
+            prefix + name
+            for name in iter_script_names(os.path.join(self.path, prefix))
+        }
+        self.names.update(names)
+        stack = [prefix]
+
+        while stack:
+            prefix = stack.pop()
+            directory = os.path.join(self.path, prefix)
+            watch = self.inotify.add_watch(directory, self.mask)
+            self.directories[watch] = prefix
+            stack.extend(
+                prefix + entry.name + '/'
+                for entry in scandir(directory)
+                if entry.is_dir(follow_symlinks=False)
+            )
+
+        return names
+
+    def remove_directory(self, prefix):
+        """
+        Stop watching a directory and all its sub-directories.
+
+        :param prefix: The path of the directory relative to the watched path,
+            with a trailing forward slash.
+        :return: The set of the names of the scripts that were known in the
+            directory.
+        """
+        for watch, directory in list(self.directories.items()):
+            if directory.startswith(prefix):
+                del self.directories[watch]
+
+                try:
+                    self.inotify.rm_watch(watch)
+                except OSError:
+                    # The directory was deleted, and its watch with it.
+                    pass
+
+        names = {name for name in self.names if name.startswith(prefix)}
+        self.names -= names
+
+        return names
+
+    def get_changes(self, timeout=0):
+        """
+        Get the names of the scripts that were added, modified or removed
+        since the last call.
+
+        :param timeout: The maximum time, in seconds, to wait for a change.
+        :return: A set of script names, possibly empty if nothing changed
+            within `timeout`.
+        """
+        flags = inotify_simple.flags
+        result = set()
+
+        for event in self.inotify.read(timeout=int(timeout * 1000)):
+            if event.mask & flags.IGNORED:
+                self.directories.pop(event.wd, None)
+                continue
+
+            prefix = self.directories.get(event.wd)
+
+            if prefix is None:
+                continue
+
+            if event.mask & flags.ISDIR:
+                prefix = prefix + event.name + '/'
+
+                if event.mask & (flags.CREATE | flags.MOVED_TO):
+                    result.update(self.add_directory(prefix))
+                else:
+                    # The directory was deleted or moved away.
+                    result.update(self.remove_directory(prefix))
+            elif event.name.endswith(SCRIPT_EXTENSION):
+                name = prefix + event.name[:-len(SCRIPT_EXTENSION)]
+                result.add(name)
+
+                if event.mask & (flags.DELETE | flags.MOVED_FROM):
+                    self.names.discard(name)
+                else:
+                    self.names.add(name)
+
+        return result
+
+    def close(self):
+        self.inotify.close()
+
+
+def get_watcher(path):
+    """
+    Get the most efficient watcher available on the current platform.
+
+    :param path: A path to watch for LUA scripts changes.
+    :return: An :py:class:`InotifyWatcher` instance if inotify is available,
+        a :py:class:`PollingWatcher` instance otherwise.
+    """
+    if inotify_simple is not None and sys.platform.startswith('linux'):
+        return InotifyWatcher(path=path)
+
+    return PollingWatcher(path=path)
@@ -17,12 +17,17 @@ setup(
 redis-lua provides helpers that deal with redis-py to ease LUA scripting.
 """,
     packages=find_packages(exclude=[
+        'benchmarks',
         'tests',
     ]),
     install_requires=[
         'redis>=2.10.3',
         'six>=1.10.0,<2.0.0',
+        'scandir>=1.5;python_version<"3.5"',
     ],
+    extras_require={
+        'msgpack': ['msgpack>=0.5.2'],
+    },
     test_suite='tests',
     classifiers=[
         'Intended Audience :: Developers',
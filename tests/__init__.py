@@ -17,6 +17,7 @@ from nose.tools import (
 )
 
 from redis_lua import (
+    iter_scripts,
     load_all_scripts,
     load_script,
     load_scripts,
@@ -76,6 +77,64 @@ def test_load_all_scripts_cache():
     assert_not_equal({}, cache)
 
 
+def test_load_all_scripts_lazy():
+    cache = {}
+    scripts = load_all_scripts(
+        path=LUA_SEARCH_PATH,
+        cache=cache,
+        lazy=True,
+    )
+
+    assert_equal(
+        {'error', 'json', 'sum', 'unicode', 'subdir/a', 'subdir/b'},
+        set(scripts),
+    )
+    assert_equal({}, cache)
+    assert_equal('subdir/b', scripts['subdir/b'].name)
+    assert_equal({'subdir/a', 'subdir/b'}, set(cache))
+
+
+def test_load_all_scripts_include_exclude():
+    scripts = load_all_scripts(
+        path=LUA_SEARCH_PATH,
+        include=['s*'],
+        exclude=['subdir/a'],
+    )
+
+    assert_equal({'sum', 'subdir/b'}, set(scripts))
+
+    scripts = load_all_scripts(
+        path=LUA_SEARCH_PATH,
+        exclude=['subdir'],
+        lazy=True,
+    )
+
+    assert_equal({'error', 'json', 'sum', 'unicode'}, set(scripts))
+
+
+def test_iter_scripts():
+    cache = {}
+    scripts = iter_scripts(
+        path=LUA_SEARCH_PATH,
+        include=['subdir/*'],
+        cache=cache,
+    )
+
+    assert_equal({}, cache)
+
+    scripts = dict(scripts)
+
+    assert_equal({'subdir/a', 'subdir/b'}, set(scripts))
+    assert_is(cache['subdir/a'], scripts['subdir/a'])
+
+
+def test_iter_scripts_no_cache():
+    scripts = dict(iter_scripts(path=LUA_SEARCH_PATH, include=['subdir/*']))
+
+    assert_equal({'subdir/a', 'subdir/b'}, set(scripts))
+    assert_is(scripts['subdir/a'], scripts['subdir/b'].regions[0].script)
+
+
 def test_load_scripts_no_cache():
     names = ['sum', 'unicode']
     scripts = load_scripts(
@@ -0,0 +1,35 @@
+import os
+import shutil
+import six
+import tempfile
+
+
+class ScriptDirectoryMixin(object):
+    """
+    A mixin for test cases that work on scripts written to a temporary
+    directory, which is removed after every test.
+    """
+
+    def setUp(self):
+        super(ScriptDirectoryMixin, self).setUp()
+        self.path = self.make_directory()
+
+    def make_directory(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+
+        return path
+
+    def write(self, name, content, path=None):
+        filename = os.path.join(path or self.path, name + '.lua')
+
+        if not os.path.isdir(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+
+        if isinstance(content, six.text_type):
+            content = content.encode('utf-8')
+
+        with open(filename, 'wb') as _file:
+            _file.write(content)
+
+        return filename
@@ -0,0 +1,217 @@
+import hashlib
+import os
+
+from mock import (
+    MagicMock,
+    patch,
+)
+from unittest import TestCase
+
+from redis_lua import load_all_scripts
+from redis_lua.bundle import (
+    BundledScript,
+    ScriptBundle,
+    build_bundle,
+    load_bundle,
+    main,
+    write_bundle,
+)
+from redis_lua.exceptions import ScriptError
+from redis_lua.render import RenderContext
+
+from .helpers import ScriptDirectoryMixin
+
+
+class BundleTests(ScriptDirectoryMixin, TestCase):
+
+    def setUp(self):
+        super(BundleTests, self).setUp()
+        self.filename = os.path.join(self.path, 'scripts.bundle')
+        self.write('lib', '%key lib_key\nlocal lib = 1;\nlocal x = y;')
+        self.write(
+            'sub/main',
+            '%include "../lib"\n%arg count int\n%arg items list\n'
+            '%return dict\nreturn {}',
+        )
+        self.write('other', u'-- caf\xe9\n%arg data msgpack\nreturn 1')
+        self.scripts = build_bundle(path=self.path, filename=self.filename)
+        self.bundle = load_bundle(self.filename)
+
+    def tearDown(self):
+        self.bundle.close()
+
+    def test_load_bundle(self):
+        self.assertIsInstance(self.bundle, ScriptBundle)
+        self.assertEqual(['lib', 'other', 'sub/main'], sorted(self.bundle))
+        self.assertEqual(3, len(self.bundle))
+        self.assertIn('sub/main', self.bundle)
+        self.assertNotIn('missing', self.bundle)
+        self.assertEqual(
+            'ScriptBundle(filename=%r)' % self.filename,
+            repr(self.bundle),
+        )
+
+        with self.assertRaises(KeyError):
+            self.bundle['missing']
+
+    def test_bundled_script(self):
+        for name, script in self.scripts.items():
+            bundled = self.bundle[name]
+
+            self.assertIsInstance(bundled, BundledScript)
+            self.assertEqual(script.name, bundled.name)
+            self.assertEqual(script.keys, bundled.keys)
+            self.assertEqual(script.args, bundled.args)
+            self.assertEqual(script.return_type, bundled.return_type)
+            self.assertEqual(script.line_count, bundled.line_count)
+            self.assertEqual(script.real_line_count, bundled.real_line_count)
+            self.assertEqual(script.render(), bundled.render())
+            self.assertIs(bundled.render(), bundled.render())
+            self.assertEqual(
+                hashlib.sha1(script.render().encode('utf-8')).hexdigest(),
+                bundled.sha1,
+            )
+
+    def test_bundled_script_equality(self):
+        bundle = load_bundle(self.filename)
+        self.addCleanup(bundle.close)
+
+        self.assertEqual(self.bundle['lib'], bundle['lib'])
+        self.assertEqual(hash(self.bundle['lib']), hash(bundle['lib']))
+        self.assertNotEqual(self.bundle['lib'], bundle['other'])
+
+        # Bundled scripts are the scripts they were built from.
+        self.assertEqual(self.scripts['lib'], self.bundle['lib'])
+        self.assertEqual(self.bundle['lib'], self.scripts['lib'])
+        self.assertEqual(hash(self.scripts['lib']), hash(self.bundle['lib']))
+
+    def test_bundled_script_render_context(self):
+        with self.assertRaises(ValueError):
+            self.bundle['lib'].render(RenderContext())
+
+        with self.assertRaises(ValueError):
+            self.bundle['lib'].get_runner(
+                client=MagicMock(),
+                context_class=RenderContext,
+            )
+
+    def test_bundled_script_line_info(self):
+        script = self.scripts['sub/main']
+        bundled = self.bundle['sub/main']
+
+        for line in range(1, script.line_count + 1):
+            self.assertEqual(
+                [
+                    (script_.name, real_line)
+                    for script_, real_line in script.get_scripts_for_line(line)
+                ],
+                [
+                    (script_.name, real_line)
+                    for script_, real_line
+                    in bundled.get_scripts_for_line(line)
+                ],
+            )
+            self.assertEqual(
+                script.get_real_line_content(line),
+                bundled.get_real_line_content(line),
+            )
+
+    def test_bundled_script_error(self):
+        kwargs = {
+            'line': 3,
+            'lua_error': 'unknown variable y',
+            'message': 'ERR Error',
+        }
+
+        self.assertEqual(
+            str(ScriptError(script=self.scripts['sub/main'], **kwargs)),
+            str(ScriptError(script=self.bundle['sub/main'], **kwargs)),
+        )
+
+    def test_bundled_script_run(self):
+        client = MagicMock()
+        client.evalsha.return_value = b'{"a": 1}'
+        script = self.bundle['sub/main']
+        result = script.get_runner(client=client)(
+            lib_key='KEY',
+            count=2,
+            items=[1],
+        )
+
+        self.assertEqual({'a': 1}, result)
+        self.assertEqual(self.scripts['sub/main'].sha1, script.sha1)
+        client.evalsha.assert_called_once_with(
+            script.sha1,
+            1,
+            'KEY',
+            2,
+            '[1]',
+        )
+
+    def test_write_bundle_include_only(self):
+        scripts = load_all_scripts(path=self.path)
+        write_bundle(
+            scripts={'sub/main': scripts['sub/main']},
+            filename=self.filename,
+        )
+        bundle = load_bundle(self.filename)
+        self.addCleanup(bundle.close)
+
+        self.assertEqual(['sub/main'], list(bundle))
+        self.assertEqual(
+            scripts['sub/main'].get_real_line_content(2),
+            bundle['sub/main'].get_real_line_content(2),
+        )
+
+    def test_write_bundle_error(self):
+        scripts = load_all_scripts(path=self.path)
+
+        with patch.object(ScriptBundle, 'MAGIC', None):
+            with self.assertRaises(TypeError):
+                write_bundle(scripts=scripts, filename=self.filename)
+
+        with patch(
+            'redis_lua.bundle._replace',
+            side_effect=OSError("Read-only file system"),
+        ):
+            with self.assertRaises(OSError):
+                write_bundle(scripts=scripts, filename=self.filename)
+
+        # No temporary file is left, and the bundle is left untouched.
+        self.assertEqual(
+            [],
+            [name for name in os.listdir(self.path) if name.endswith('.tmp')],
+        )
+        bundle = load_bundle(self.filename)
+        self.addCleanup(bundle.close)
+
+        self.assertEqual(['lib', 'other', 'sub/main'], sorted(bundle))
+
+    def test_load_bundle_invalid(self):
+        for content in [b'', b'not a bundle']:
+            with open(self.filename, 'wb') as _file:
+                _file.write(content)
+
+            with self.assertRaises(ValueError):
+                load_bundle(self.filename)
+
+    def test_load_bundle_unsupported_version(self):
+        with patch.object(ScriptBundle, 'VERSION', 0):
+            write_bundle(scripts={}, filename=self.filename)
+
+        with self.assertRaises(ValueError):
+            load_bundle(self.filename)
+
+    def test_main(self):
+        filename = os.path.join(self.path, 'other.bundle')
+
+        with patch('redis_lua.bundle.print', create=True) as print_mock:
+            main([self.path, filename, '--exclude', 'sub'])
+
+        bundle = load_bundle(filename)
+        self.addCleanup(bundle.close)
+
+        self.assertEqual(['lib', 'other'], sorted(bundle))
+        print_mock.assert_called_once_with(
+            'Bundled 2 script(s) into %s.' % filename,
+        )
@@ -0,0 +1,288 @@
+import threading
+
+from mock import patch
+from unittest import TestCase
+
+from redis_lua import (
+    load_script,
+    load_scripts,
+    parse_script,
+)
+from redis_lua.cache import (
+    CacheStats,
+    ScriptCache,
+    get_script_size,
+)
+from redis_lua.exceptions import CyclicDependencyError
+from redis_lua.regions import TextRegion
+from redis_lua.script import Script
+
+from .helpers import ScriptDirectoryMixin
+
+
+def make_script(name, content='local a = 1;'):
+    return Script(name=name, regions=[TextRegion(content=content)])
+
+
+class ScriptCacheTests(ScriptDirectoryMixin, TestCase):
+
+    def test_get_script_size(self):
+        self.assertEqual(12, get_script_size(make_script('a')))
+
+    def test_script_cache_mapping(self):
+        cache = ScriptCache()
+        script = make_script('a')
+
+        self.assertFalse(cache)
+        self.assertIsNone(cache.get('a'))
+
+        cache['a'] = script
+
+        self.assertTrue(cache)
+        self.assertIn('a', cache)
+        self.assertIs(script, cache['a'])
+        self.assertIs(script, cache.get('a'))
+        self.assertEqual(['a'], list(cache))
+        self.assertEqual(1, len(cache))
+        self.assertEqual(
+            'ScriptCache(max_count=None, max_size=None)',
+            repr(cache),
+        )
+
+        del cache['a']
+
+        self.assertNotIn('a', cache)
+
+        with self.assertRaises(KeyError):
+            del cache['a']
+
+    def test_script_cache_replace(self):
+        cache = ScriptCache()
+        cache['a'] = make_script('a', 'a')
+        cache['a'] = make_script('a', 'abc')
+
+        self.assertEqual(1, len(cache))
+        self.assertEqual(3, cache.size)
+
+    def test_script_cache_clear(self):
+        cache = ScriptCache()
+        cache['a'] = make_script('a')
+        cache.clear()
+
+        self.assertEqual(0, len(cache))
+        self.assertEqual(0, cache.size)
+
+    def test_script_cache_max_count(self):
+        cache = ScriptCache(max_count=2)
+        cache['a'] = make_script('a')
+        cache['b'] = make_script('b')
+        cache['a']
+        cache['c'] = make_script('c')
+
+        self.assertEqual(['a', 'c'], sorted(cache))
+        self.assertEqual(1, cache.evictions)
+
+    def test_script_cache_max_size(self):
+        cache = ScriptCache(max_size=5)
+        cache['a'] = make_script('a', 'aaa')
+        cache['b'] = make_script('b', 'bbb')
+
+        self.assertEqual(['b'], list(cache))
+        self.assertEqual(3, cache.size)
+
+        cache['c'] = make_script('c', 'cccccccc')
+
+        self.assertEqual(['c'], list(cache))
+
+    def test_script_cache_pinned(self):
+        self.write('lib', 'local lib = 1;')
+        self.write('main', '%include "lib"')
+        self.write('other', 'local other = 1;')
+
+        cache = ScriptCache(max_count=2)
+        load_script(name='main', path=self.path, cache=cache)
+        load_script(name='other', path=self.path, cache=cache)
+
+        self.assertEqual(['lib', 'other'], sorted(cache))
+
+        load_script(name='main', path=self.path, cache=cache)
+        del cache['main']
+        cache['x'] = make_script('x')
+        cache['y'] = make_script('y')
+
+        self.assertEqual(['x', 'y'], sorted(cache))
+
+    def test_script_cache_pinned_by_several_scripts(self):
+        self.write('lib', 'local lib = 1;')
+        self.write('main', '%include "lib"')
+        self.write('other', '%include "lib"')
+
+        cache = ScriptCache(max_count=3)
+        load_script(name='main', path=self.path, cache=cache)
+        load_script(name='other', path=self.path, cache=cache)
+        del cache['main']
+        cache['x'] = make_script('x')
+        cache['y'] = make_script('y')
+
+        # 'lib' is still included by 'other'.
+        self.assertEqual(['lib', 'x', 'y'], sorted(cache))
+
+    def test_script_cache_stats(self):
+        cache = ScriptCache(max_count=1)
+        cache['a'] = make_script('a')
+        cache['a']
+        cache.get('b')
+        cache['b'] = make_script('b')
+
+        self.assertEqual(
+            CacheStats(hits=1, misses=1, evictions=1, count=1, size=12),
+            cache.get_stats(),
+        )
+
+    def test_get_or_load(self):
+        cache = ScriptCache()
+        script = make_script('a')
+
+        self.assertIs(script, cache.get_or_load('a', lambda: script))
+        self.assertIs(script, cache.get_or_load('a', lambda: None))
+        self.assertIs(script, cache['a'])
+
+    def test_get_or_load_single_flight(self):
+        cache = ScriptCache()
+        script = make_script('a')
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def load():
+            calls.append(None)
+            started.set()
+            release.wait()
+
+            return script
+
+        def target():
+            results.append(cache.get_or_load('a', load))
+
+        threads = [threading.Thread(target=target) for _ in range(4)]
+        threads[0].start()
+        started.wait()
+
+        for thread in threads[1:]:
+            thread.start()
+
+        release.set()
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(1, len(calls))
+        self.assertEqual([script] * 4, results)
+
+    def test_get_or_load_error(self):
+        cache = ScriptCache()
+
+        def load():
+            raise ValueError
+
+        with self.assertRaises(ValueError):
+            cache.get_or_load('a', load)
+
+        self.assertEqual({}, cache.flights)
+        self.assertIsNotNone(cache.get_or_load('a', lambda: make_script('a')))
+
+    def test_get_or_load_reentrant(self):
+        cache = ScriptCache()
+        script = make_script('a')
+
+        def load():
+            return cache.get_or_load('a', lambda: script)
+
+        self.assertIs(script, cache.get_or_load('a', load))
+
+
+class LoadWithScriptCacheTests(ScriptDirectoryMixin, TestCase):
+
+    def setUp(self):
+        super(LoadWithScriptCacheTests, self).setUp()
+        self.write('lib', 'local lib = 1;')
+        self.write('main', '%include "lib"')
+
+    def test_load_script(self):
+        cache = ScriptCache()
+        script = load_script(name='main', path=self.path, cache=cache)
+
+        self.assertIs(
+            script,
+            load_script(name='main', path=self.path, cache=cache),
+        )
+        self.assertEqual(['lib', 'main'], sorted(cache))
+        self.assertEqual(1, cache.hits)
+
+    def test_load_script_concurrent(self):
+        cache = ScriptCache()
+        results = []
+        parse = parse_script
+
+        def slow_parse_script(**kwargs):
+            release.wait()
+
+            return parse(**kwargs)
+
+        def target():
+            results.append(
+                load_script(name='lib', path=self.path, cache=cache),
+            )
+
+        release = threading.Event()
+        threads = [threading.Thread(target=target) for _ in range(4)]
+
+        with patch(
+            'redis_lua.parse_script',
+            side_effect=slow_parse_script,
+        ) as parse_script_mock:
+            for thread in threads:
+                thread.start()
+
+            release.set()
+
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(1, parse_script_mock.call_count)
+        self.assertEqual(4, len(results))
+        self.assertEqual(1, len(set(map(id, results))))
+
+    def test_load_script_cyclic_dependency(self):
+        self.write('x', '%include "y"')
+        self.write('y', '%include "x"')
+
+        with self.assertRaises(CyclicDependencyError) as error:
+            load_script(name='x', path=self.path, cache=ScriptCache())
+
+        self.assertEqual(['x', 'y', 'x'], error.exception.cycle)
+
+    def test_load_scripts_bounded(self):
+        cache = ScriptCache(max_count=1)
+        self.write('other', 'local other = 1;')
+        scripts = load_scripts(
+            names=['main', 'other'],
+            path=self.path,
+            cache=cache,
+            workers=2,
+        )
+
+        self.assertEqual(['main', 'other'], sorted(scripts))
+        self.assertEqual(
+            ['lib'],
+            [region.script.name for region in scripts['main'].regions],
+        )
+        self.assertEqual(1, len(cache))
+
+    def test_load_scripts_cache_hit(self):
+        cache = ScriptCache()
+        lib = load_script(name='lib', path=self.path, cache=cache)
+        scripts = load_scripts(names=['main'], path=self.path, cache=cache)
+
+        self.assertIs(lib, scripts['main'].regions[0].script)
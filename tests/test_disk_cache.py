@@ -0,0 +1,262 @@
+import os
+
+from mock import patch
+from unittest import TestCase
+
+from redis_lua import (
+    load_all_scripts,
+    load_script,
+)
+from redis_lua.disk_cache import (
+    DiskCache,
+    IncludeReference,
+    get_included_scripts,
+)
+from redis_lua.regions import TextRegion
+from redis_lua.script import Script
+
+from .helpers import ScriptDirectoryMixin
+
+
+class DiskCacheTests(ScriptDirectoryMixin, TestCase):
+
+    def setUp(self):
+        super(DiskCacheTests, self).setUp()
+        self.directory = os.path.join(self.make_directory(), 'cache')
+        self.disk_cache = DiskCache(directory=self.directory)
+        self.write('lib', 'local lib = 1;')
+        self.write('main', '%key key1\n%include "lib"\nreturn lib;')
+        self.write('other', '%include "lib"\nreturn lib;')
+
+    def load(self, name):
+        return load_script(
+            name=name,
+            path=self.path,
+            cache={},
+            disk_cache=self.disk_cache,
+        )
+
+    def get_entry(self, name):
+        return self.disk_cache.get_entry(name=name, path=self.path)
+
+    def test_disk_cache_representation(self):
+        self.assertEqual(
+            'DiskCache(directory=%r)' % self.directory,
+            repr(self.disk_cache),
+        )
+
+    def test_disk_cache_miss(self):
+        self.assertIsNone(self.get_entry('main'))
+
+    def test_disk_cache_hit(self):
+        script = self.load('main')
+
+        with patch('redis_lua.ScriptParser.parse') as parse_mock:
+            cached_script = self.load('main')
+
+        self.assertEqual(0, parse_mock.call_count)
+        self.assertIsNot(script, cached_script)
+        self.assertEqual(script, cached_script)
+        self.assertEqual(['key1'], cached_script.keys)
+        self.assertEqual(script.render(), cached_script.render())
+
+    def test_disk_cache_hit_shares_included_scripts(self):
+        load_all_scripts(path=self.path, disk_cache=self.disk_cache)
+
+        with patch('redis_lua.loader.ScriptParser.parse') as parse_mock:
+            scripts = load_all_scripts(
+                path=self.path,
+                disk_cache=self.disk_cache,
+            )
+
+        self.assertEqual(0, parse_mock.call_count)
+        self.assertIs(scripts['lib'], scripts['main'].regions[1].script)
+        self.assertIs(scripts['lib'], scripts['other'].regions[0].script)
+
+        cache = {}
+        main, other = [
+            load_script(
+                name=name,
+                path=self.path,
+                cache=cache,
+                disk_cache=self.disk_cache,
+            )
+            for name in ['main', 'other']
+        ]
+
+        self.assertIs(cache['lib'], main.regions[1].script)
+        self.assertIs(cache['lib'], other.regions[0].script)
+
+    def test_disk_cache_hit_sha1(self):
+        script = self.load('main')
+
+        with patch('redis_lua.script.RenderContext') as render_context_mock:
+            self.assertEqual(script.sha1, self.load('main').sha1)
+
+        self.assertEqual(0, render_context_mock.call_count)
+
+    def test_disk_cache_hit_render(self):
+        script = self.load('main')
+
+        self.assertEqual(script.render(), self.get_entry('main')['render'])
+
+        with patch('redis_lua.script.RenderContext') as render_context_mock:
+            self.assertEqual(script.render(), self.load('main').render())
+
+        self.assertEqual(0, render_context_mock.call_count)
+
+    def test_disk_cache_hit_different_include(self):
+        self.load('main')
+        entry = self.get_entry('main')
+        lib = self.load('other')
+
+        self.assertIsNone(
+            self.disk_cache.get_script(
+                entry=entry,
+                get_script_by_name=lambda name: lib,
+            ),
+        )
+
+    def test_disk_cache_hit_populates_cache(self):
+        self.load('main')
+        cache = {}
+        script = load_script(
+            name='main',
+            path=self.path,
+            cache=cache,
+            disk_cache=self.disk_cache,
+        )
+
+        self.assertEqual({'lib', 'main'}, set(cache))
+        self.assertIs(script, cache['main'])
+        self.assertIs(cache['lib'], script.regions[1].script)
+
+    def test_disk_cache_hit_no_cache(self):
+        self.load('main')
+        script = load_script(
+            name='main',
+            path=self.path,
+            disk_cache=self.disk_cache,
+        )
+
+        self.assertEqual('main', script.name)
+
+    def test_disk_cache_touched_file(self):
+        self.load('main')
+        filename = os.path.join(self.path, 'lib.lua')
+        stat = os.stat(filename)
+        os.utime(filename, (stat.st_atime, stat.st_mtime + 10))
+
+        self.assertIsNotNone(self.get_entry('main'))
+
+    def test_disk_cache_modified_file(self):
+        self.load('main')
+        self.write('main', '%key key2\n%include "lib"')
+
+        self.assertIsNone(self.get_entry('main'))
+        self.assertEqual(['key2'], self.load('main').keys)
+
+    def test_disk_cache_modified_included_file(self):
+        load_all_scripts(path=self.path, disk_cache=self.disk_cache)
+        self.write('lib', 'local lib = 2;')
+
+        self.assertIsNone(self.get_entry('main'))
+        self.assertIsNone(self.get_entry('other'))
+        self.assertIsNone(self.get_entry('lib'))
+        self.assertIn('local lib = 2;', self.load('main').render())
+
+    def test_disk_cache_removed_included_file(self):
+        self.load('main')
+        os.remove(os.path.join(self.path, 'lib.lua'))
+
+        self.assertIsNone(self.get_entry('main'))
+
+    def test_disk_cache_corrupted_entry(self):
+        self.load('main')
+        filename = self.disk_cache.get_entry_filename(
+            name='main',
+            path=self.path,
+        )
+
+        with open(filename, 'wb') as _file:
+            _file.write(b'garbage')
+
+        self.assertIsNone(self.get_entry('main'))
+
+    @patch('redis_lua.disk_cache.cPickle.load')
+    def test_disk_cache_invalid_entries(self, load_mock):
+        self.load('main')
+        load_mock.return_value = 42
+
+        self.assertIsNone(self.get_entry('main'))
+
+        load_mock.return_value = {'version': DiskCache.VERSION + 1}
+
+        self.assertIsNone(self.get_entry('main'))
+
+        lib = Script(name='lib', regions=[TextRegion(content='')])
+        load_mock.return_value = {
+            'version': DiskCache.VERSION,
+            'dependencies': [],
+            'name': 'main',
+            'regions': [
+                IncludeReference(name='lib', content='%include "lib"'),
+            ],
+            'includes': ['lib'],
+            'digest': 'a',
+            'render': 'b',
+            'sha1': 'c',
+        }
+
+        self.assertIsNone(
+            self.disk_cache.get(
+                name='main',
+                path=self.path,
+                get_script_by_name=lambda name: lib,
+            ),
+        )
+
+    def test_disk_cache_set_write_error(self):
+        with patch('redis_lua.disk_cache.cPickle.dump', side_effect=IOError):
+            script = self.load('main')
+
+        self.assertEqual([], os.listdir(self.directory))
+        self.assertEqual('main', script.name)
+
+    def test_disk_cache_set_file_not_found(self):
+        script = self.load('main')
+        os.remove(os.path.join(self.path, 'main.lua'))
+        self.disk_cache.clear()
+        self.disk_cache.set(script=script, path=self.path)
+
+        self.assertEqual([], os.listdir(self.directory))
+
+    def test_disk_cache_clear(self):
+        self.load('main')
+        self.disk_cache.clear()
+
+        self.assertEqual([], os.listdir(self.directory))
+
+    def test_disk_cache_clear_foreign_files(self):
+        self.load('main')
+
+        with open(os.path.join(self.directory, 'foo.txt'), 'w'):
+            pass
+
+        self.disk_cache.clear()
+
+        self.assertEqual(['foo.txt'], os.listdir(self.directory))
+
+    def test_disk_cache_clear_no_directory(self):
+        self.disk_cache.clear()
+
+        self.assertFalse(os.path.exists(self.directory))
+
+    def test_get_included_scripts(self):
+        self.write('top', '%include "main"\n%include "other"')
+        script = self.load('top')
+
+        self.assertEqual(
+            {'lib', 'main', 'other'},
+            set(get_included_scripts(script)),
+        )
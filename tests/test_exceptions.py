@@ -3,6 +3,10 @@ from unittest import TestCase
 from redis.exceptions import ResponseError
 
 from redis_lua import parse_script
+from redis_lua.render import (
+    MinifyingRenderContext,
+    RenderContext,
+)
 from redis_lua.exceptions import (
     ScriptNotFoundError,
     CyclicDependencyError,
@@ -66,6 +70,75 @@ LUA Traceback (most recent script last):
             str(exception),
         )
 
+    def test_script_error_as_string_multiple_inclusion(self):
+        cache = {}
+        parse_script(
+            name='foo',
+            content='local a = 1;\nlocal b = c;',
+            cache=cache,
+        )
+        script = parse_script(
+            name='bar',
+            content='%include "foo"\n%include "foo"\nreturn a',
+            cache=cache,
+        )
+        exception = ScriptError(
+            script=script,
+            line=4,
+            lua_error="unknown variable c",
+            message="ERR Error",
+        )
+
+        self.assertEqual(
+            """
+unknown variable c
+LUA Traceback (most recent script last):
+  Script "bar", line 2
+    %include "foo"
+  Script "foo", line 2
+    local b = c;
+            """.strip(),
+            str(exception),
+        )
+
+    def test_script_error_as_string_with_source_map(self):
+        cache = {}
+        parse_script(name='foo', content='local a = b;', cache=cache)
+        script = parse_script(
+            name='bar',
+            content='%key key\n%include "foo"',
+            cache=cache,
+        )
+
+        class CommentedRenderContext(RenderContext):
+            def render_key(self, name):
+                return '-- Key: %s\n%s' % (
+                    name,
+                    super(CommentedRenderContext, self).render_key(name),
+                )
+
+        context = CommentedRenderContext()
+        script.render(context)
+        exception = ScriptError(
+            script=script,
+            line=3,
+            lua_error="unknown variable b",
+            message="ERR Error",
+            source_map=context.source_map,
+        )
+
+        self.assertEqual(
+            """
+unknown variable b
+LUA Traceback (most recent script last):
+  Script "bar", line 2
+    %include "foo"
+  Script "foo", line 1
+    local a = b;
+            """.strip(),
+            str(exception),
+        )
+
     def test_parse_response_error_message(self):
         message = (
             "Error running script (call to f_5b4ae8e72ea3e17bf3d44082ade715c88"
@@ -133,6 +206,43 @@ local l = 12;
             error.exception.message,
         )
 
+    def test_error_handler_minified(self):
+        cache = {}
+        parse_script(
+            name='foo',
+            content='-- Foo.\n\nlocal a = 1;\n    local b = c;',
+            cache=cache,
+        )
+        script = parse_script(
+            name='bar',
+            content='%return int\n%include "foo"\nreturn b',
+            cache=cache,
+        )
+        context = MinifyingRenderContext()
+
+        self.assertEqual(
+            'local a=1;\nlocal b=c;\nreturn b',
+            script.render(context),
+        )
+
+        with self.assertRaises(ScriptError) as error:
+            with error_handler(script=script, source_map=context.source_map):
+                raise ResponseError(
+                    "ERR something is wrong: f_1234abc:2: unknown variable c",
+                )
+
+        self.assertEqual(
+            """
+unknown variable c
+LUA Traceback (most recent script last):
+  Script "bar", line 2
+    %include "foo"
+  Script "foo", line 4
+    local b = c;
+            """.strip(),
+            str(error.exception),
+        )
+
     def test_error_handler_unknown_message(self):
         name = 'foo'
         content = ""
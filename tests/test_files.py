@@ -0,0 +1,147 @@
+import os
+import shutil
+import tempfile
+
+from mock import patch
+from unittest import TestCase
+
+from redis_lua.exceptions import ScriptNotFoundError
+from redis_lua.files import (
+    MMAP_THRESHOLD,
+    close_script_bytes,
+    iter_script_names,
+    read_script,
+    read_script_bytes,
+    scandir,
+)
+
+
+class FilesTests(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+        for filename in [
+            'a.lua',
+            'README.md',
+            'sub/b.lua',
+            'sub/.b.lua.swp',
+            'sub/deeper/c.lua',
+        ]:
+            filename = os.path.join(self.path, filename)
+
+            if not os.path.isdir(os.path.dirname(filename)):
+                os.makedirs(os.path.dirname(filename))
+
+            with open(filename, 'w'):
+                pass
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_iter_script_names(self):
+        self.assertEqual(
+            ['a', 'sub/b', 'sub/deeper/c'],
+            sorted(iter_script_names(path=self.path)),
+        )
+
+    def test_iter_script_names_empty_directory(self):
+        shutil.rmtree(os.path.join(self.path, 'sub'))
+        os.remove(os.path.join(self.path, 'a.lua'))
+
+        self.assertEqual([], list(iter_script_names(path=self.path)))
+
+    def test_iter_script_names_include(self):
+        self.assertEqual(
+            ['sub/b', 'sub/deeper/c'],
+            sorted(iter_script_names(path=self.path, include=['sub/*'])),
+        )
+
+    def test_iter_script_names_exclude(self):
+        self.assertEqual(
+            ['a', 'sub/b'],
+            sorted(iter_script_names(path=self.path, exclude=['*/c'])),
+        )
+
+    def test_iter_script_names_exclude_directory(self):
+        with patch(
+            'redis_lua.files.scandir',
+            side_effect=scandir,
+        ) as scandir_mock:
+            self.assertEqual(
+                ['a'],
+                sorted(iter_script_names(path=self.path, exclude=['sub'])),
+            )
+
+        self.assertEqual(1, scandir_mock.call_count)
+
+    def test_iter_script_names_directory_symlink(self):
+        os.symlink('..', os.path.join(self.path, 'sub', 'loop'))
+
+        self.assertEqual(
+            ['a', 'sub/b', 'sub/deeper/c'],
+            sorted(iter_script_names(path=self.path)),
+        )
+
+    def test_iter_script_names_is_lazy(self):
+        names = iter_script_names(path=self.path)
+
+        self.assertIn(next(names), {'a', 'sub/b', 'sub/deeper/c'})
+
+    def test_read_script(self):
+        with open(os.path.join(self.path, 'a.lua'), 'wb') as _file:
+            _file.write(u"local a = 'caf\xe9';\r\n".encode('utf-8'))
+
+        self.assertEqual(
+            u"local a = 'caf\xe9';\n",
+            read_script(name='a', path=self.path),
+        )
+
+    def test_read_script_not_found(self):
+        with self.assertRaises(ScriptNotFoundError):
+            read_script(name='missing', path=self.path, encoding='utf-8')
+
+    def test_read_script_bytes(self):
+        with open(os.path.join(self.path, 'a.lua'), 'wb') as _file:
+            _file.write(b'local a = 1;\n')
+
+        self.assertEqual(
+            b'local a = 1;\n',
+            read_script_bytes(name='a', path=self.path),
+        )
+
+    def test_read_script_bytes_empty(self):
+        self.assertEqual(b'', read_script_bytes(name='a', path=self.path))
+
+    def test_read_script_bytes_large(self):
+        content = b'-- ' + b'x' * MMAP_THRESHOLD + b'\n%key a\n'
+
+        with open(os.path.join(self.path, 'a.lua'), 'wb') as _file:
+            _file.write(content)
+
+        result = read_script_bytes(name='a', path=self.path)
+
+        try:
+            self.assertNotIsInstance(result, bytes)
+            self.assertEqual(content, result[:])
+        finally:
+            result.close()
+
+    def test_close_script_bytes(self):
+        with open(os.path.join(self.path, 'a.lua'), 'wb') as _file:
+            _file.write(b'x' * MMAP_THRESHOLD)
+
+        result = read_script_bytes(name='a', path=self.path)
+        close_script_bytes(result)
+        close_script_bytes(result)
+
+        with self.assertRaises(ValueError):
+            result[:1]
+
+        close_script_bytes(b'local a = 1;')
+
+    def test_read_script_bytes_not_found(self):
+        with self.assertRaises(ScriptNotFoundError) as error:
+            read_script_bytes(name='missing', path=self.path)
+
+        self.assertEqual('missing', error.exception.name)
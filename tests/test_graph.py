@@ -0,0 +1,217 @@
+from mock import MagicMock
+from unittest import TestCase
+
+from redis_lua import (
+    load_script,
+    load_scripts,
+    parse_script,
+)
+from redis_lua.cache import ScriptCache
+from redis_lua.graph import (
+    DependencyGraph,
+    DependencyStats,
+    get_direct_includes,
+)
+
+from .helpers import ScriptDirectoryMixin
+
+
+class DependencyGraphTests(ScriptDirectoryMixin, TestCase):
+
+    def setUp(self):
+        super(DependencyGraphTests, self).setUp()
+        self.write('lib', 'local lib = 1;')
+        self.write('mid', '%include "lib"\nlocal mid = 1;')
+        self.write('top', '%include "mid"\n%include "lib"')
+        self.write('other', 'local other = 1;')
+        self.scripts = load_scripts(
+            names=['lib', 'mid', 'top', 'other'],
+            path=self.path,
+        )
+        self.graph = DependencyGraph()
+
+        for script in self.scripts.values():
+            self.graph.add_script(script)
+
+    def test_get_direct_includes(self):
+        self.assertEqual(
+            {'mid': self.scripts['mid'], 'lib': self.scripts['lib']},
+            get_direct_includes(self.scripts['top']),
+        )
+        self.assertEqual({}, get_direct_includes(self.scripts['lib']))
+
+    def test_dependency_graph_container(self):
+        self.assertEqual(4, len(self.graph))
+        self.assertIn('top', self.graph)
+        self.assertNotIn('missing', self.graph)
+        self.assertEqual(['lib', 'mid', 'other', 'top'], sorted(self.graph))
+        self.assertEqual(
+            "DependencyGraph(scripts=['lib', 'mid', 'other', 'top'])",
+            repr(self.graph),
+        )
+
+    def test_add_script_includes(self):
+        graph = DependencyGraph()
+        graph.add_script(self.scripts['top'])
+
+        self.assertEqual(['lib', 'mid', 'top'], sorted(graph))
+        self.assertIs(self.scripts['lib'], graph.scripts['lib'])
+
+    def test_add_script_replace(self):
+        self.write('mid', 'local mid = 2;')
+        mid = load_script(name='mid', path=self.path)
+        self.graph.add_script(mid)
+
+        self.assertIs(mid, self.graph.scripts['mid'])
+        self.assertEqual(set(), self.graph.get_includes('mid'))
+        self.assertEqual({'top'}, self.graph.get_dependents('lib'))
+
+    def test_remove_script(self):
+        self.graph.remove_script('mid')
+
+        self.assertNotIn('mid', self.graph)
+        self.assertEqual({'top'}, self.graph.get_dependents('lib'))
+        self.assertEqual({'top'}, self.graph.get_dependents('mid'))
+
+        self.graph.remove_script('missing')
+
+    def test_get_includes(self):
+        self.assertEqual({'lib', 'mid'}, self.graph.get_includes('top'))
+        self.assertEqual(set(), self.graph.get_includes('lib'))
+        self.assertEqual(set(), self.graph.get_includes('missing'))
+
+    def test_get_dependents(self):
+        self.assertEqual({'mid', 'top'}, self.graph.get_dependents('lib'))
+        self.assertEqual(set(), self.graph.get_dependents('top'))
+        self.assertEqual(set(), self.graph.get_dependents('missing'))
+
+    def test_get_all_includes(self):
+        self.assertEqual(
+            {'lib', 'mid', 'top'},
+            self.graph.get_all_includes(['top']),
+        )
+        self.assertEqual({'other'}, self.graph.get_all_includes(['other']))
+
+    def test_get_all_dependents(self):
+        self.assertEqual(
+            {'lib', 'mid', 'top'},
+            self.graph.get_all_dependents(['lib']),
+        )
+        self.assertEqual(
+            {'mid', 'other', 'top'},
+            self.graph.get_all_dependents(['mid', 'other']),
+        )
+
+    def test_get_topological_order(self):
+        self.assertEqual(
+            ['lib', 'mid', 'other', 'top'],
+            self.graph.get_topological_order(),
+        )
+        self.assertEqual(
+            ['mid', 'top'],
+            self.graph.get_topological_order(names=['top', 'mid']),
+        )
+
+    def test_get_topological_order_includers_first(self):
+        self.write('z', 'local z = 1;')
+        self.write('m', '%include "z"\n%include "lib"')
+        self.write('a', '%include "m"')
+        graph = DependencyGraph()
+
+        for script in load_scripts(names=['a', 'z'], path=self.path).values():
+            graph.add_script(script)
+
+        self.assertEqual(['lib', 'z', 'm', 'a'], graph.get_topological_order())
+        self.assertEqual(
+            ['z', 'm', 'a'],
+            graph.get_topological_order(names=['a', 'm', 'z']),
+        )
+
+    def test_get_stats(self):
+        self.assertEqual(
+            DependencyStats(fan_in=2, fan_out=0),
+            self.graph.get_stats('lib'),
+        )
+        self.assertEqual(
+            DependencyStats(fan_in=0, fan_out=2),
+            self.graph.get_stats('top'),
+        )
+        self.assertEqual(
+            DependencyStats(fan_in=0, fan_out=0),
+            self.graph.get_stats('missing'),
+        )
+
+    def test_get_all_stats(self):
+        self.assertEqual(
+            {
+                'lib': DependencyStats(fan_in=2, fan_out=0),
+                'mid': DependencyStats(fan_in=1, fan_out=1),
+                'top': DependencyStats(fan_in=0, fan_out=2),
+                'other': DependencyStats(fan_in=0, fan_out=0),
+            },
+            self.graph.get_all_stats(),
+        )
+
+
+class LoadWithGraphTests(ScriptDirectoryMixin, TestCase):
+
+    def setUp(self):
+        super(LoadWithGraphTests, self).setUp()
+        self.write('lib', 'local lib = 1;')
+        self.write('main', '%include "lib"')
+
+    def test_load_scripts_graph(self):
+        graph = DependencyGraph()
+        load_scripts(names=['main'], path=self.path, graph=graph)
+
+        self.assertEqual({'lib'}, graph.get_includes('main'))
+
+    def test_load_script_graph(self):
+        graph = DependencyGraph()
+        load_script(name='main', path=self.path, graph=graph)
+
+        self.assertEqual({'lib'}, graph.get_includes('main'))
+
+    def test_load_script_graph_cache_hit(self):
+        graph = DependencyGraph()
+        cache = {}
+        load_script(name='main', path=self.path, cache=cache)
+        load_script(name='main', path=self.path, cache=cache, graph=graph)
+
+        self.assertEqual(['lib', 'main'], sorted(graph))
+
+    def test_load_script_graph_script_cache(self):
+        graph = DependencyGraph()
+        load_script(
+            name='main',
+            path=self.path,
+            cache=ScriptCache(),
+            graph=graph,
+        )
+
+        self.assertEqual({'lib'}, graph.get_includes('main'))
+
+    def test_load_script_graph_disk_cache_hit(self):
+        graph = DependencyGraph()
+        disk_cache = MagicMock()
+        disk_cache.get.return_value = load_script(name='main', path=self.path)
+        load_script(
+            name='main',
+            path=self.path,
+            disk_cache=disk_cache,
+            graph=graph,
+        )
+
+        self.assertEqual(['lib', 'main'], sorted(graph))
+
+    def test_parse_script_graph(self):
+        graph = DependencyGraph()
+        parse_script(
+            name='code',
+            content='%include "main"',
+            path=self.path,
+            graph=graph,
+        )
+
+        self.assertEqual(['code', 'lib', 'main'], sorted(graph))
+        self.assertEqual({'code', 'main'}, graph.get_all_dependents(['main']))
@@ -0,0 +1,191 @@
+import gc
+import pickle
+
+from mock import patch
+from unittest import TestCase
+
+from redis_lua import (
+    load_all_scripts,
+    load_script,
+)
+from redis_lua.intern import ScriptInternTable
+from redis_lua.regions import (
+    ScriptParser,
+    ScriptRegion,
+    TextRegion,
+)
+from redis_lua.registry import ScriptRegistry
+from redis_lua.script import Script
+
+from .helpers import ScriptDirectoryMixin
+
+
+class ScriptInternTableTests(TestCase):
+
+    def test_add(self):
+        table = ScriptInternTable()
+        script = Script(
+            name='a',
+            regions=[TextRegion(content='local a = 1;')],
+        )
+        key = table.get_key(name='a', content=b'local a = 1;', includes=[])
+
+        self.assertIsNone(table.get(key))
+        self.assertIs(script, table.add(key, script))
+        self.assertIs(script, table.get(key))
+        self.assertIs(
+            script,
+            table.add(
+                key,
+                Script(name='a', regions=[TextRegion(content='local a = 1;')]),
+            ),
+        )
+        self.assertEqual(1, len(table))
+        self.assertEqual('ScriptInternTable(count=1)', repr(table))
+
+        table.clear()
+
+        self.assertEqual(0, len(table))
+        self.assertIsNone(table.get(key))
+
+    def test_get_key(self):
+        table = ScriptInternTable()
+        lib = Script(
+            name='lib',
+            regions=[TextRegion(content='local a = 1;')],
+        )
+        lib_key = table.get_key(name='lib', content=u'caf\xe9', includes=[])
+
+        self.assertEqual(
+            lib_key,
+            table.get_key(
+                name='lib',
+                content=u'caf\xe9'.encode('utf-8'),
+                includes=[],
+            ),
+        )
+        self.assertNotEqual(
+            lib_key,
+            table.get_key(name='other', content=u'caf\xe9', includes=[]),
+        )
+        self.assertEqual(
+            table.get_key(name='main', content='', includes=[lib]),
+            table.get_key(
+                name='main',
+                content='',
+                includes=[
+                    Script(
+                        name='lib',
+                        regions=[TextRegion(content='local a = 1;')],
+                    ),
+                ],
+            ),
+        )
+        self.assertNotEqual(
+            table.get_key(name='main', content='', includes=[lib]),
+            table.get_key(name='main', content='', includes=[]),
+        )
+
+    def test_weak_references(self):
+        table = ScriptInternTable()
+        script = Script(
+            name='a',
+            regions=[TextRegion(content='local a = 1;')],
+        )
+        table.add('key', script)
+
+        del script
+        gc.collect()
+
+        self.assertIsNone(table.get('key'))
+        self.assertEqual(0, len(table))
+
+    def test_pickle_interned_script(self):
+        table = ScriptInternTable()
+        script = Script(
+            name='a',
+            regions=[TextRegion(content='local a = 1;')],
+        )
+        table.add('key', script)
+        result = pickle.loads(pickle.dumps(script))
+
+        self.assertEqual(script, result)
+        self.assertIsNot(script, result)
+
+
+class LoadWithInternTableTests(ScriptDirectoryMixin, TestCase):
+
+    def setUp(self):
+        super(LoadWithInternTableTests, self).setUp()
+        self.paths = [self.path, self.make_directory()]
+
+        for path in self.paths:
+            self.write('lib', 'local lib = 1;', path=path)
+            self.write('main', '%include "lib"\nreturn lib', path=path)
+
+        self.table = ScriptInternTable()
+
+    def test_load_all_scripts(self):
+        parse = ScriptParser.parse
+
+        with patch.object(
+            ScriptParser,
+            'parse',
+            autospec=True,
+            side_effect=parse,
+        ) as parse_mock:
+            results = [
+                load_all_scripts(path=path, intern_table=self.table)
+                for path in self.paths
+            ]
+
+        self.assertEqual(2, parse_mock.call_count)
+        self.assertIs(results[0]['lib'], results[1]['lib'])
+        self.assertIs(results[0]['main'], results[1]['main'])
+
+    def test_load_all_scripts_different_include(self):
+        self.write('lib', 'local lib = 2;', path=self.paths[1])
+        results = [
+            load_all_scripts(path=path, intern_table=self.table)
+            for path in self.paths
+        ]
+
+        self.assertIsNot(results[0]['lib'], results[1]['lib'])
+        self.assertIsNot(results[0]['main'], results[1]['main'])
+        self.assertEqual(
+            results[1]['lib'],
+            results[1]['main'].regions[0].script,
+        )
+
+    def test_load_script(self):
+        scripts = [
+            load_script(name='main', path=path, intern_table=self.table)
+            for path in self.paths
+        ]
+
+        self.assertIs(scripts[0], scripts[1])
+        self.assertIsInstance(scripts[0].regions[0], ScriptRegion)
+        self.assertIs(
+            scripts[0].regions[0].script,
+            load_all_scripts(
+                path=self.paths[1],
+                intern_table=self.table,
+            )['lib'],
+        )
+
+    def test_registry(self):
+        registries = [
+            ScriptRegistry(path=path, intern_table=self.table)
+            for path in self.paths
+        ]
+
+        for registry in registries:
+            self.addCleanup(registry.close)
+
+        self.assertIs(registries[0]['main'], registries[1]['main'])
+
+        self.write('lib', 'local lib = 2;', path=self.paths[1])
+        registries[1].reload(['lib'])
+
+        self.assertIsNot(registries[0]['main'], registries[1]['main'])
+        self.assertIsNot(registries[0]['lib'], registries[1]['lib'])
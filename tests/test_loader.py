@@ -0,0 +1,267 @@
+import os
+import sys
+
+from collections import OrderedDict
+
+from mock import (
+    MagicMock,
+    patch,
+)
+from unittest import TestCase
+
+from redis_lua import iter_scripts
+from redis_lua.disk_cache import DiskCache
+from redis_lua.exceptions import (
+    CyclicDependencyError,
+    ScriptNotFoundError,
+)
+from redis_lua.files import read_script_bytes
+from redis_lua.loader import (
+    LazyScriptMapping,
+    ScriptLoader,
+)
+from redis_lua.regions import TextRegion
+from redis_lua.script import Script
+
+from .helpers import ScriptDirectoryMixin
+
+
+class ScriptLoaderTests(ScriptDirectoryMixin, TestCase):
+
+    def setUp(self):
+        super(ScriptLoaderTests, self).setUp()
+        self.write('lib', 'local lib = 1;')
+        self.write('sub/a', '%include "../lib"\n%key key_a')
+        self.write('sub/b', '%include "a"\n%include "../lib"\n%key key_b')
+
+    def test_load(self):
+        cache = {}
+        loader = ScriptLoader(path=self.path, cache=cache)
+        scripts = loader.load(names=['sub/b'])
+
+        self.assertEqual(['sub/b'], list(scripts))
+        self.assertEqual({'lib', 'sub/a', 'sub/b'}, set(cache))
+        self.assertEqual(['key_a', 'key_b'], scripts['sub/b'].keys)
+        self.assertIs(
+            cache['sub/a'],
+            scripts['sub/b'].regions[0].script,
+        )
+
+    def test_load_with_workers(self):
+        loader = ScriptLoader(path=self.path, workers=4)
+        scripts = loader.load(names=['sub/a', 'sub/b', 'lib'])
+
+        self.assertEqual({'lib', 'sub/a', 'sub/b'}, set(scripts))
+
+    def test_load_os_separators(self):
+        loader = ScriptLoader(path=self.path)
+        scripts = loader.load(names=[os.path.join('sub', 'a')])
+
+        self.assertEqual(['sub/a'], list(scripts))
+
+    def test_load_cache_hit(self):
+        lib = Script(name='lib', regions=[TextRegion(content='')])
+        cache = {'lib': lib}
+        loader = ScriptLoader(path=self.path, cache=cache)
+
+        with patch(
+            'redis_lua.loader.read_script_bytes',
+            side_effect=lambda name, path: b'local a = 1;',
+        ) as read_script_mock:
+            loader.load(names=['lib', 'sub/a'])
+
+        self.assertIs(lib, cache['lib'])
+        self.assertEqual(1, read_script_mock.call_count)
+
+    def test_load_disk_cache(self):
+        disk_cache = MagicMock()
+        disk_cache.get_entry.return_value = None
+        loader = ScriptLoader(path=self.path, disk_cache=disk_cache)
+        loader.load(names=['sub/a'])
+
+        self.assertEqual(2, disk_cache.get_entry.call_count)
+        self.assertEqual(2, disk_cache.set.call_count)
+
+    def test_load_disk_cache_hit(self):
+        disk_cache = DiskCache(directory=os.path.join(self.path, 'cache'))
+        ScriptLoader(path=self.path, disk_cache=disk_cache).load(
+            names=['sub/b'],
+        )
+        cache = {}
+        loader = ScriptLoader(
+            path=self.path,
+            cache=cache,
+            disk_cache=disk_cache,
+        )
+
+        with patch.object(loader.parser, 'parse') as parse_mock:
+            scripts = loader.load(names=['sub/a', 'sub/b'])
+
+        self.assertEqual(0, parse_mock.call_count)
+        self.assertEqual({'lib', 'sub/a', 'sub/b'}, set(cache))
+        self.assertIs(cache['lib'], scripts['sub/a'].regions[0].script)
+        self.assertIs(cache['lib'], scripts['sub/b'].regions[1].script)
+        self.assertIs(scripts['sub/a'], scripts['sub/b'].regions[0].script)
+
+    def test_load_disk_cache_stale_entry(self):
+        disk_cache = DiskCache(directory=os.path.join(self.path, 'cache'))
+        ScriptLoader(path=self.path, disk_cache=disk_cache).load(
+            names=['sub/a'],
+        )
+        lib = Script(name='lib', regions=[TextRegion(content='')])
+        loader = ScriptLoader(
+            path=self.path,
+            cache={'lib': lib},
+            disk_cache=disk_cache,
+        )
+        script = loader.load(names=['sub/a'])['sub/a']
+
+        self.assertIs(lib, script.regions[0].script)
+        self.assertEqual('\nlocal key_a = KEYS[1]', script.render())
+
+    def test_load_not_found(self):
+        self.write('broken', '%include "missing"')
+        loader = ScriptLoader(path=self.path, workers=2)
+
+        with self.assertRaises(ScriptNotFoundError) as error:
+            loader.load(names=['broken'])
+
+        self.assertEqual('missing', error.exception.name)
+
+    def test_load_cyclic_dependency(self):
+        self.write('x', '%include "y"')
+        self.write('y', '%include "lib"\n%include "z"')
+        self.write('z', '%include "x"')
+        loader = ScriptLoader(path=self.path)
+
+        with self.assertRaises(CyclicDependencyError) as error:
+            loader.load(names=['x'])
+
+        self.assertEqual(['x', 'y', 'z', 'x'], error.exception.cycle)
+
+    def test_load_self_dependency(self):
+        self.write('x', '%include "x"')
+        loader = ScriptLoader(path=self.path)
+
+        with self.assertRaises(CyclicDependencyError) as error:
+            loader.load(names=['x'])
+
+        self.assertEqual(['x', 'x'], error.exception.cycle)
+
+    def test_load_long_include_chain(self):
+        depth = 100
+
+        for index in range(depth):
+            self.write('chain/%d' % index, '%%include "%d"' % (index + 1))
+
+        self.write('chain/%d' % depth, 'local a = 1;')
+        loader = ScriptLoader(path=self.path, workers=4)
+        scripts = loader.load(names=['chain/0'])
+
+        self.assertEqual('local a = 1;', scripts['chain/0'].render())
+
+    def test_iter_scripts_long_include_chain(self):
+        depth = sys.getrecursionlimit()
+
+        for index in range(depth):
+            self.write('chain/%d' % index, '%%include "%d"' % (index + 1))
+
+        self.write('chain/%d' % depth, 'local a = 1;')
+        cache = {}
+        scripts = dict(
+            iter_scripts(path=self.path, include=['chain/*'], cache=cache),
+        )
+
+        self.assertEqual(depth + 1, len(scripts))
+        self.assertIs(cache['chain/0'], scripts['chain/0'])
+        self.assertEqual('local a = 1;', scripts['chain/0'].render())
+
+    def test_load_large_script(self):
+        table = '\n'.join('  [%d] = %d,' % (i, i) for i in range(10000))
+        self.write('big', '%include "lib"\nlocal t = {\n' + table + '\n}')
+        loader = ScriptLoader(path=self.path)
+        contents = []
+
+        def read(name, path):
+            contents.append(read_script_bytes(name=name, path=path))
+
+            return contents[-1]
+
+        with patch('redis_lua.loader.read_script_bytes', side_effect=read):
+            script = loader.load(names=['big'])['big']
+
+        self.assertEqual(10003, script.real_line_count)
+        self.assertEqual(
+            '  [9999] = 9999,',
+            script.get_real_line_content(10002),
+        )
+
+        # The memory-mapped content of the script is released once parsed.
+        self.assertNotIsInstance(contents[0], bytes)
+
+        with self.assertRaises(ValueError):
+            contents[0][:1]
+
+    def test_sort_sources(self):
+        sources = OrderedDict([
+            ('a', (None, ['b', 'c', 'unknown'])),
+            ('b', (None, ['c'])),
+            ('c', (None, [])),
+            ('d', (None, ['a'])),
+        ])
+
+        self.assertEqual(
+            ['c', 'b', 'a', 'd'],
+            ScriptLoader.sort_sources(sources=sources),
+        )
+
+
+class LazyScriptMappingTests(ScriptDirectoryMixin, TestCase):
+
+    def setUp(self):
+        super(LazyScriptMappingTests, self).setUp()
+        self.write('lib', 'local lib = 1;')
+        self.write('main', '%include "lib"\n%key key1')
+        self.write('broken', '%include "missing"')
+        self.mapping = LazyScriptMapping(path=self.path)
+
+    def test_lazy_script_mapping_listing(self):
+        with patch('redis_lua.loader.read_script_bytes') as read_script_mock:
+            self.assertEqual(3, len(self.mapping))
+            self.assertIn('main', self.mapping)
+            self.assertNotIn('missing', self.mapping)
+            self.assertEqual(
+                ['broken', 'lib', 'main'],
+                sorted(self.mapping),
+            )
+            self.assertEqual(
+                (
+                    "LazyScriptMapping(path=%r, names=['broken', 'lib', "
+                    "'main'])" % self.path
+                ),
+                repr(self.mapping),
+            )
+
+        self.assertEqual(0, read_script_mock.call_count)
+
+    def test_lazy_script_mapping_getitem(self):
+        self.assertFalse(self.mapping.is_loaded('main'))
+
+        script = self.mapping['main']
+
+        self.assertEqual(['key1'], script.keys)
+        self.assertTrue(self.mapping.is_loaded('main'))
+        self.assertTrue(self.mapping.is_loaded('lib'))
+        self.assertFalse(self.mapping.is_loaded('broken'))
+        self.assertIs(script, self.mapping['main'])
+        self.assertIs(script, self.mapping.get('main'))
+
+    def test_lazy_script_mapping_getitem_unknown(self):
+        with self.assertRaises(KeyError):
+            self.mapping['missing']
+
+        self.assertIsNone(self.mapping.get('missing'))
+
+    def test_lazy_script_mapping_getitem_error(self):
+        with self.assertRaises(ScriptNotFoundError):
+            self.mapping['broken']
@@ -0,0 +1,83 @@
+from unittest import TestCase
+
+from redis_lua.minify import minify
+
+
+class MinifyTests(TestCase):
+
+    def test_minify(self):
+        text, offsets = minify(
+            '-- A comment.\n'
+            '\n'
+            'local function add(a, b)\n'
+            '    return a + b -- Sum.\n'
+            'end\n',
+        )
+
+        self.assertEqual('local function add(a,b)\nreturn a+b\nend', text)
+        self.assertEqual([2, 3, 4], offsets)
+
+    def test_minify_nothing_left(self):
+        self.assertEqual((None, []), minify('  -- A comment.\n\n--[[ b ]]'))
+
+    def test_minify_strings(self):
+        text, offsets = minify(
+            'local a = "b -- c"  \n'
+            "local d = 'e\\' -- f'\n"
+            'local g = "h\\\n  i"\n',
+        )
+
+        self.assertEqual(
+            'local a="b -- c"\n'
+            "local d='e\\' -- f'\n"
+            'local g="h\\\n  i"',
+            text,
+        )
+        self.assertEqual([0, 1, 2, 3], offsets)
+
+    def test_minify_long_strings(self):
+        text, offsets = minify(
+            'local a = [[\n'
+            '  -- b  \n'
+            ']] .. [==[ ]] ]==]\n'
+            'local c = d[ [[e]] ]\n',
+        )
+
+        self.assertEqual(
+            'local a=[[\n'
+            '  -- b  \n'
+            ']].. [==[ ]] ]==]\n'
+            'local c=d[ [[e]]]',
+            text,
+        )
+        self.assertEqual([0, 1, 2, 3], offsets)
+
+    def test_minify_long_comments(self):
+        text, offsets = minify(
+            'local a --[==[ b\n'
+            ']] c ]==] = 1\n'
+            '---[[ d\n'
+            'return a\n',
+        )
+
+        self.assertEqual('local a\n=1\nreturn a', text)
+        self.assertEqual([0, 1, 3], offsets)
+
+    def test_minify_keeps_token_separators(self):
+        text, _ = minify('local a = b - -c .. 1 .. d\nif a ~= b then end')
+
+        self.assertEqual(
+            'local a=b - -c .. 1 .. d\nif a~=b then end',
+            text,
+        )
+
+    def test_minify_unfinished_strings(self):
+        # Unfinished strings are kept as-is, for LUA to report them.
+        self.assertEqual(
+            ('local a="b  -- c\nlocal d=1', [0, 1]),
+            minify('local a = "b  -- c\nlocal d = 1\n'),
+        )
+        self.assertEqual(
+            ("local a='b  -- c", [0]),
+            minify("local a = 'b  -- c"),
+        )
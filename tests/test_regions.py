@@ -1,3 +1,5 @@
+import pickle
+
 from mock import (
     MagicMock,
     call,
@@ -6,16 +8,29 @@ from unittest import TestCase
 
 from redis_lua.script import Script
 from redis_lua.regions import (
+    Region,
     ScriptRegion,
     TextRegion,
     KeyRegion,
     ArgumentRegion,
+    FloatArray,
+    Hash,
+    IntegerArray,
+    MessagePack,
     ReturnRegion,
     PragmaRegion,
     ScriptParser,
+    resolve_script_name,
 )
 
 
+class RegionTests(TestCase):
+
+    def test_region_digest_fields(self):
+        with self.assertRaises(NotImplementedError):
+            Region().get_digest_fields()
+
+
 class ScriptRegionTests(TestCase):
 
     def test_script_region_instanciation(self):
@@ -254,6 +269,23 @@ class KeyRegionTests(TestCase):
         self.assertFalse(key_region_a == key_region_e)
         self.assertFalse(key_region_a == 42)
 
+    def test_key_region_slots(self):
+        key_region = KeyRegion(name='foo', index=1, content='%key foo')
+
+        self.assertFalse(hasattr(key_region, '__dict__'))
+
+    def test_key_region_pickle(self):
+        key_region = KeyRegion(
+            name=''.join(['f', 'oo']),
+            index=1,
+            content=''.join(['%key ', 'foo']),
+        )
+        result = pickle.loads(pickle.dumps(key_region))
+
+        self.assertEqual(key_region, result)
+        self.assertIs(key_region.name, result.name)
+        self.assertIs(key_region.content, result.content)
+
 
 class ArgumentRegionTests(TestCase):
 
@@ -364,6 +396,64 @@ class ArgumentRegionTests(TestCase):
         )
         self.assertEqual(render_context.render_arg.return_value, result)
 
+    def test_argument_region_as_string_msgpack_type(self):
+        name = 'bar'
+        index = 2
+        argument_region = ArgumentRegion(
+            name=name,
+            index=index,
+            type_='msgpack',
+            content='%arg bar msgpack',
+        )
+        render_context = MagicMock()
+        result = argument_region.render(context=render_context)
+
+        render_context.render_arg.assert_called_once_with(
+            name=name,
+            type_=MessagePack,
+        )
+        self.assertEqual(render_context.render_arg.return_value, result)
+
+    def test_argument_region_as_string_array_types(self):
+        for type_name, type_ in [
+            ('int_array', IntegerArray),
+            ('integer_array', IntegerArray),
+            ('float_array', FloatArray),
+        ]:
+            argument_region = ArgumentRegion(
+                name='bar',
+                index=2,
+                type_=type_name,
+                content='%arg bar ' + type_name,
+            )
+            render_context = MagicMock()
+            argument_region.render(context=render_context)
+
+            render_context.render_arg.assert_called_once_with(
+                name='bar',
+                type_=type_,
+            )
+
+    def test_argument_region_as_string_hash_type(self):
+        for type_name in ['hash', 'pairs']:
+            argument_region = ArgumentRegion(
+                name='bar',
+                index=2,
+                type_=type_name,
+                content='%arg bar ' + type_name,
+            )
+            render_context = MagicMock()
+            argument_region.render(context=render_context)
+
+            render_context.render_arg.assert_called_once_with(
+                name='bar',
+                type_=Hash,
+            )
+
+    def test_return_region_hash_type_is_invalid(self):
+        with self.assertRaises(ValueError):
+            ReturnRegion(type_='hash', content='%return hash')
+
     def test_argument_region_equality(self):
         argument_region_a = ArgumentRegion(
             name="foo",
@@ -508,6 +598,35 @@ class ReturnRegionTests(TestCase):
         render_context.render_return.assert_called_once_with(type_=dict)
         self.assertEqual(render_context.render_return.return_value, result)
 
+    def test_return_region_as_string_msgpack_type(self):
+        return_region = ReturnRegion(
+            type_='msgpack',
+            content='%return msgpack',
+        )
+        render_context = MagicMock()
+        result = return_region.render(context=render_context)
+
+        render_context.render_return.assert_called_once_with(
+            type_=MessagePack,
+        )
+        self.assertEqual(render_context.render_return.return_value, result)
+
+    def test_return_region_as_string_array_types(self):
+        for type_name, type_ in [
+            ('int_array', IntegerArray),
+            ('float_array', FloatArray),
+        ]:
+            return_region = ReturnRegion(
+                type_=type_name,
+                content='%return ' + type_name,
+            )
+            render_context = MagicMock()
+            return_region.render(context=render_context)
+
+            render_context.render_return.assert_called_once_with(
+                type_=type_,
+            )
+
     def test_return_region_equality(self):
         return_region_a = ReturnRegion(
             type_='string',
@@ -625,6 +744,22 @@ class TextRegionTests(TestCase):
         self.assertEqual(3, text_region.line_count)
         self.assertEqual(3, text_region.real_line_count)
 
+    def test_text_region_lines(self):
+        content = 'a\nb\nc'
+        text_region = TextRegion(content=content)
+
+        self.assertIsNone(text_region._lines)
+        self.assertEqual(['a', 'b', 'c'], text_region.lines)
+        self.assertIs(text_region.lines, text_region.lines)
+
+    def test_text_region_pickle(self):
+        text_region = TextRegion(content='a\nb')
+        text_region.lines
+        result = pickle.loads(pickle.dumps(text_region))
+
+        self.assertIsNone(result._lines)
+        self.assertEqual(['a', 'b'], result.lines)
+
     def test_text_region_render(self):
         content = 'a\nb\nc'
         text_region = TextRegion(content=content)
@@ -645,6 +780,12 @@ class TextRegionTests(TestCase):
         self.assertFalse(text_region_a == text_region_c)
         self.assertFalse(text_region_a == 42)
 
+    def test_text_region_slots(self):
+        text_region = TextRegion(content='a')
+
+        self.assertFalse(hasattr(text_region, '__dict__'))
+        self.assertEqual(1, text_region.real_line_count)
+
 
 class ScriptParserTests(TestCase):
     def setUp(self):
@@ -1102,3 +1243,183 @@ class ScriptParserTests(TestCase):
             ),
             str(error.exception),
         )
+
+    def test_extract_regions_percent_in_text(self):
+        contents = [
+            "local a = string.format('%s', 1);",
+            '  %key key1',
+            "-- %key is not a directive here.",
+            '%keys key2',
+        ]
+        content = '\n'.join(contents)
+        regions = self.parser.parse_regions(
+            content=content,
+            current_path=".",
+            get_script_by_name=None,
+        )
+
+        self.assertEqual(
+            [
+                TextRegion(content=contents[0]),
+                KeyRegion(
+                    name='key1',
+                    index=1,
+                    content=contents[1],
+                ),
+                TextRegion(content='\n'.join(contents[2:4])),
+            ],
+            regions,
+        )
+
+    def test_extract_regions_include_backslashes(self):
+        contents = [
+            '%include "bar\\foo"',
+        ]
+        content = '\n'.join(contents)
+        script = Script(
+            name='foo',
+            regions=[
+                TextRegion(content='local b = 2;'),
+            ],
+        )
+        get_script_by_name = MagicMock(return_value=script)
+        self.parser.parse_regions(
+            content=content,
+            current_path="sub",
+            get_script_by_name=get_script_by_name,
+        )
+
+        self.assertEqual(
+            [call(name='sub/bar/foo')],
+            get_script_by_name.mock_calls[:],
+        )
+
+    def test_extract_regions_bytes(self):
+        contents = [
+            u"local a = 'caf\xe9';",
+            u'  %key key1',
+            u'',
+            u'%arg arg1 int',
+            u'',
+        ]
+        content = u'\n'.join(contents)
+        regions = self.parser.parse_regions(
+            content=content.encode('utf-8'),
+            current_path=".",
+            get_script_by_name=None,
+        )
+
+        self.assertEqual(
+            self.parser.parse_regions(
+                content=content,
+                current_path=".",
+                get_script_by_name=None,
+            ),
+            regions,
+        )
+        self.assertEqual(
+            [
+                TextRegion(content=contents[0]),
+                KeyRegion(
+                    name='key1',
+                    index=1,
+                    content=contents[1],
+                ),
+                TextRegion(content=contents[2]),
+                ArgumentRegion(
+                    name='arg1',
+                    index=1,
+                    type_='int',
+                    content=contents[3],
+                ),
+            ],
+            regions,
+        )
+
+    def test_extract_regions_crlf(self):
+        expected = self.parser.parse_regions(
+            content='local a = 1\n\n%key foo\nreturn a\n',
+            current_path=".",
+            get_script_by_name=None,
+        )
+
+        for content in [
+            'local a = 1\r\n\r\n%key foo\r\nreturn a\r\n',
+            b'local a = 1\r\n\r\n%key foo\r\nreturn a\r\n',
+            b'local a = 1\r\r%key foo\nreturn a\r',
+        ]:
+            regions = self.parser.parse_regions(
+                content=content,
+                current_path=".",
+                get_script_by_name=None,
+            )
+
+            self.assertEqual(expected, regions)
+            self.assertEqual('%key foo', regions[1].content)
+            self.assertEqual(
+                'local a = 1\n\nlocal foo = KEYS[1]\nreturn a',
+                Script(name='foo', regions=regions).render(),
+            )
+
+    def test_extract_regions_crlf_invalid_line(self):
+        content = b'local a = 1;\r\n\r\n%arg arg1 foo\r\n'
+
+        with self.assertRaises(ValueError) as error:
+            self.parser.parse_regions(
+                content=content,
+                current_path=".",
+                get_script_by_name=None,
+            )
+
+        self.assertIn('line 3', str(error.exception))
+
+    def test_extract_regions_bytes_invalid_line(self):
+        content = b'local a = 1;\n\n%arg arg1 foo'
+
+        with self.assertRaises(ValueError) as error:
+            self.parser.parse_regions(
+                content=content,
+                current_path=".",
+                get_script_by_name=None,
+            )
+
+        self.assertIn('line 3', str(error.exception))
+
+    def test_parse_includes_bytes(self):
+        self.assertEqual(
+            ['sub/a', 'b'],
+            self.parser.parse_includes(
+                content=b'%include "a"\n  %include "../b"  \n%key c',
+                current_path='sub',
+            ),
+        )
+
+    def test_parse_regions_interned_directives(self):
+        regions_a, regions_b = [
+            self.parser.parse_regions(
+                content=content,
+                current_path='.',
+                get_script_by_name=None,
+            )
+            for content in [
+                '%key foo\n%arg bar int\n%pragma once',
+                b'%key foo\n%arg bar int\n%pragma once'.decode('utf-8'),
+            ]
+        ]
+
+        for region_a, region_b in zip(regions_a, regions_b):
+            self.assertIs(region_a.content, region_b.content)
+
+        self.assertIs(regions_a[0].name, regions_b[0].name)
+        self.assertIs(regions_a[1].name, regions_b[1].name)
+
+
+class ResolveScriptNameTests(TestCase):
+
+    def test_resolve_script_name(self):
+        self.assertEqual('foo', resolve_script_name('', 'foo'))
+        self.assertEqual('foo', resolve_script_name('.', './foo'))
+        self.assertEqual('a/foo', resolve_script_name('a', 'foo'))
+        self.assertEqual('foo', resolve_script_name('a/b', '../../foo'))
+        self.assertEqual('../foo', resolve_script_name('', '../foo'))
+        self.assertEqual('a/b/foo', resolve_script_name('a\\b', 'foo'))
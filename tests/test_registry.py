@@ -0,0 +1,217 @@
+import os
+
+from mock import (
+    MagicMock,
+    call,
+)
+from unittest import TestCase
+
+from redis_lua.exceptions import ScriptNotFoundError
+from redis_lua.registry import ScriptRegistry
+from redis_lua.watchers import PollingWatcher
+
+from .helpers import ScriptDirectoryMixin
+
+
+def make_client():
+    client = MagicMock()
+    client.script_exists.side_effect = lambda *shas: [False] * len(shas)
+
+    return client
+
+
+def get_loaded_scripts(client):
+    return [
+        args[0]
+        for args, _ in client.pipeline.return_value.script_load.call_args_list
+    ]
+
+
+class ScriptRegistryTests(ScriptDirectoryMixin, TestCase):
+
+    def setUp(self):
+        super(ScriptRegistryTests, self).setUp()
+        self.write('lib', 'local lib = 1;')
+        self.write('mid', '%include "lib"\nlocal mid = lib;')
+        self.write('top', '%include "mid"\nreturn mid;')
+        self.write('other', 'return 42;')
+        self.client = make_client()
+        self.watcher = MagicMock()
+        self.registry = ScriptRegistry(
+            path=self.path,
+            clients=[self.client],
+            watcher=self.watcher,
+        )
+        self.client.pipeline.reset_mock()
+
+    def tearDown(self):
+        self.registry.close()
+
+    def test_registry_representation(self):
+        self.assertEqual(
+            'ScriptRegistry(path=%r)' % self.path,
+            repr(self.registry),
+        )
+
+    def test_registry_mapping(self):
+        self.assertEqual(4, len(self.registry))
+        self.assertEqual(
+            {'lib', 'mid', 'other', 'top'},
+            set(self.registry),
+        )
+        self.assertEqual('top', self.registry['top'].name)
+
+    def test_registry_default_watcher(self):
+        registry = ScriptRegistry(path=self.path)
+        registry.close()
+
+        self.assertIsNotNone(registry.watcher)
+
+    def test_registry_registers_scripts(self):
+        client = make_client()
+        ScriptRegistry(path=self.path, clients=[client], watcher=self.watcher)
+
+        self.assertEqual(4, len(get_loaded_scripts(client)))
+        self.assertEqual(1, client.script_exists.call_count)
+        self.assertEqual(1, client.pipeline.return_value.execute.call_count)
+
+    def test_registry_dependents(self):
+        self.write('both', '%include "lib"\n%include "mid"')
+        self.registry.reload(names=['both'])
+
+        self.assertEqual(
+            {'both', 'lib', 'mid', 'top'},
+            self.registry.graph.get_all_dependents(['lib']),
+        )
+
+        self.write('mid', 'local mid = 1;')
+        self.registry.reload(names=['mid'])
+
+        self.assertEqual(
+            {'both', 'lib'},
+            self.registry.graph.get_all_dependents(['lib']),
+        )
+        self.assertEqual(
+            {'other'},
+            self.registry.graph.get_all_dependents(['other']),
+        )
+
+    def test_registry_reload(self):
+        other = self.registry['other']
+        self.write('lib', 'local lib = 2;')
+
+        self.assertEqual(
+            {'lib', 'mid', 'top'},
+            self.registry.reload(names=['lib']),
+        )
+        self.assertIs(other, self.registry['other'])
+        self.assertIn('local lib = 2;', self.registry['top'].render())
+        self.assertIs(
+            self.registry['mid'],
+            self.registry['top'].regions[0].script,
+        )
+        self.assertIn(
+            self.registry['top'].rendered_bytes,
+            get_loaded_scripts(self.client),
+        )
+        self.assertEqual(3, len(get_loaded_scripts(self.client)))
+
+    def test_registry_reload_changed_includes(self):
+        self.write('top', '%include "other"\nreturn 1;')
+        self.registry.reload(names=['top'])
+        self.write('other', 'return 43;')
+
+        self.assertEqual(
+            {'other', 'top'},
+            self.registry.reload(names=['other']),
+        )
+        self.assertEqual(
+            {'lib', 'mid'},
+            self.registry.graph.get_all_dependents(['lib']),
+        )
+
+    def test_registry_reload_new_and_removed_scripts(self):
+        self.write('new', '%include "lib"')
+        os.remove(os.path.join(self.path, 'other.lua'))
+
+        self.assertEqual(
+            {'new', 'other'},
+            self.registry.reload(names=['new', 'other']),
+        )
+        self.assertEqual(
+            {'lib', 'mid', 'new', 'top'},
+            set(self.registry),
+        )
+
+    def test_registry_reload_failure(self):
+        scripts = dict(self.registry)
+        os.remove(os.path.join(self.path, 'lib.lua'))
+
+        with self.assertRaises(ScriptNotFoundError):
+            self.registry.reload(names=['lib'])
+
+        self.assertEqual(scripts, dict(self.registry))
+
+    def test_registry_clients(self):
+        client = make_client()
+        self.registry.add_client(client)
+
+        self.assertEqual(4, len(get_loaded_scripts(client)))
+
+        self.registry.remove_client(self.client)
+        self.write('other', 'return 43;')
+        self.registry.reload(names=['other'])
+
+        self.assertEqual(0, len(get_loaded_scripts(self.client)))
+        self.assertEqual(5, len(get_loaded_scripts(client)))
+
+    def test_registry_poll(self):
+        self.watcher.get_changes.return_value = set()
+
+        self.assertEqual(set(), self.registry.poll())
+
+        self.watcher.get_changes.return_value = {'other'}
+
+        self.assertEqual({'other'}, self.registry.poll(timeout=2))
+        self.assertEqual(
+            [call(timeout=0), call(timeout=2)],
+            self.watcher.get_changes.mock_calls,
+        )
+
+    def test_registry_watch(self):
+        registry = ScriptRegistry(
+            path=self.path,
+            watcher=PollingWatcher(path=self.path, interval=0.01),
+        )
+        top = registry['top']
+        registry.start(timeout=0.01)
+
+        try:
+            self.write('mid', '%include "lib"\nlocal mid = 2;')
+            filename = os.path.join(self.path, 'mid.lua')
+            stat = os.stat(filename)
+            os.utime(filename, (stat.st_atime, stat.st_mtime + 1))
+
+            for _ in range(500):
+                if registry['top'] is not top:
+                    break
+
+                registry.stopped.wait(0.01)
+        finally:
+            registry.close()
+
+        self.assertIsNot(top, registry['top'])
+        self.assertIsNone(registry.thread)
+
+    def test_registry_watch_errors(self):
+        self.watcher.get_changes.side_effect = RuntimeError
+
+        def get_changes(timeout):
+            self.registry.stopped.set()
+            raise RuntimeError
+
+        self.watcher.get_changes.side_effect = get_changes
+        self.registry.start()
+        self.registry.thread.join()
+
+        self.assertEqual(1, self.watcher.get_changes.call_count)
@@ -1,7 +1,31 @@
-from mock import MagicMock
+import six
+import sys
+
+from mock import (
+    MagicMock,
+    patch,
+)
 from unittest import TestCase
 
-from redis_lua.render import RenderContext
+from redis_lua.regions import (
+    KeyRegion,
+    ArgumentRegion,
+    FloatArray,
+    Hash,
+    IntegerArray,
+    MessagePack,
+    PragmaRegion,
+    ReturnRegion,
+    ScriptRegion,
+    TextRegion,
+)
+from redis_lua.render import (
+    FragmentCache,
+    MinifyingRenderContext,
+    RenderContext,
+    global_fragment_cache,
+)
+from redis_lua.script import Script
 
 
 class RenderContextTests(TestCase):
@@ -13,8 +37,10 @@ class RenderContextTests(TestCase):
         script = MagicMock()
         ok_region = MagicMock()
         ok_region.render.return_value = 'a'
+        ok_region.real_line_count = 1
         ko_region = MagicMock()
         ko_region.render.return_value = None
+        ko_region.real_line_count = 1
 
         script.regions = [
             ok_region,
@@ -29,8 +55,10 @@ class RenderContextTests(TestCase):
         script = MagicMock()
         ok_region = MagicMock()
         ok_region.render.return_value = 'a'
+        ok_region.real_line_count = 1
         ko_region = MagicMock()
         ko_region.render.return_value = None
+        ko_region.real_line_count = 1
 
         script.regions = [
             ok_region,
@@ -49,8 +77,10 @@ class RenderContextTests(TestCase):
         script.multiple_inclusion = False
         ok_region = MagicMock()
         ok_region.render.return_value = 'a'
+        ok_region.real_line_count = 1
         ko_region = MagicMock()
         ko_region.render.return_value = None
+        ko_region.real_line_count = 1
 
         script.regions = [
             ok_region,
@@ -109,6 +139,51 @@ class RenderContextTests(TestCase):
 
         self.assertEqual('local myarg = cjson.decode(ARGV[1])', result)
 
+    def test_render_arg_as_msgpack(self):
+        result = self.render_context.render_arg(
+            name='myarg',
+            type_=MessagePack,
+        )
+
+        self.assertEqual('local myarg = cmsgpack.unpack(ARGV[1])', result)
+
+    def test_render_arg_as_int_array(self):
+        result = self.render_context.render_arg(
+            name='myarg',
+            type_=IntegerArray,
+        )
+
+        self.assertEqual(
+            "local myarg = (function(s) local t = {} "
+            "for i = 1, #s / 8 do "
+            "t[i] = struct.unpack('<i8', s, i * 8 - 7) "
+            "end return t end)(ARGV[1])",
+            result,
+        )
+
+    def test_render_arg_as_float_array(self):
+        result = self.render_context.render_arg(
+            name='myarg',
+            type_=FloatArray,
+        )
+
+        self.assertIn("struct.unpack('<d', s, i * 8 - 7)", result)
+        self.assertTrue(result.endswith('(ARGV[1])'))
+
+    def test_render_arg_as_hash(self):
+        result = self.render_context.render_arg(
+            name='myarg',
+            type_=Hash,
+        )
+
+        self.assertEqual(
+            "local myarg = (function(s) local t = {} "
+            "for i = s + 1, s + 2 * ARGV[s], 2 do "
+            "t[ARGV[i]] = ARGV[i + 1] "
+            "end return t end)(tonumber(ARGV[1]))",
+            result,
+        )
+
     def test_render_return(self):
         result = self.render_context.render_return(
             type_=str,
@@ -135,3 +210,399 @@ class RenderContextTests(TestCase):
         )
 
         self.assertEqual('foo foo foo', result)
+
+
+class PrefixRenderContext(RenderContext):
+
+    def __init__(self, prefix, **kwargs):
+        super(PrefixRenderContext, self).__init__(**kwargs)
+        self.prefix = prefix
+
+    @property
+    def memo_key(self):
+        return self.prefix
+
+    def render_key(self, name):
+        return super(PrefixRenderContext, self).render_key(self.prefix + name)
+
+
+class FragmentCacheTests(TestCase):
+
+    def setUp(self):
+        self.fragment_cache = FragmentCache(max_size=8)
+        self.lib = Script(
+            name='lib',
+            regions=[
+                PragmaRegion(value='once', content='%pragma once'),
+                KeyRegion(name='lock', index=1, content='%key lock'),
+                TextRegion(content='local lib = 1;'),
+            ],
+        )
+        self.script = Script(
+            name='main',
+            regions=[
+                KeyRegion(name='key', index=1, content='%key key'),
+                ScriptRegion(script=self.lib, content='%include "lib"'),
+                ArgumentRegion(
+                    name='count',
+                    index=1,
+                    type_='int',
+                    content='%arg count int',
+                ),
+                TextRegion(content='return count'),
+            ],
+        )
+
+    def render(self, context, *scripts):
+        return [script.render(context) for script in scripts], context
+
+    def test_cache(self):
+        self.assertEqual(
+            'FragmentCache(count=0, max_size=8)',
+            repr(self.fragment_cache),
+        )
+
+        self.fragment_cache.add('a', 1)
+        self.fragment_cache.add('b', 2)
+
+        self.assertEqual(1, self.fragment_cache.get('a'))
+        self.assertIsNone(self.fragment_cache.get('c'))
+
+        self.fragment_cache.max_size = 2
+        self.fragment_cache.add('c', 3)
+
+        # 'b' is the least recently used fragment.
+        self.assertIsNone(self.fragment_cache.get('b'))
+        self.assertEqual(1, self.fragment_cache.get('a'))
+        self.assertEqual(2, len(self.fragment_cache))
+
+        self.fragment_cache.clear()
+
+        self.assertEqual(0, len(self.fragment_cache))
+
+    def test_render_script_reuses_fragments(self):
+        context = RenderContext(fragment_cache=self.fragment_cache)
+        expected = self.script.render(context)
+
+        self.assertEqual(2, len(self.fragment_cache))
+
+        with patch.object(
+            KeyRegion,
+            'render',
+            side_effect=AssertionError("Not reused"),
+        ):
+            context = RenderContext(fragment_cache=self.fragment_cache)
+            result = self.script.render(context)
+
+        self.assertEqual(expected, result)
+        self.assertEqual(2, context.last_key_index)
+        self.assertEqual(1, context.last_arg_index)
+        self.assertEqual({self.lib}, context.rendered_scripts)
+        self.assertEqual(
+            [(self.script, 2), (self.lib, 3)],
+            context.source_map.get_scripts_for_line(4),
+        )
+
+    def test_render_script_reuses_pragma_once_fragments(self):
+        other = Script(
+            name='other',
+            regions=[
+                ScriptRegion(script=self.lib, content='%include "lib"'),
+                TextRegion(content='return lock'),
+            ],
+        )
+        script = Script(
+            name='script',
+            regions=[
+                ScriptRegion(script=self.lib, content='%include "lib"'),
+                TextRegion(content='return 1'),
+            ],
+        )
+        other.render(RenderContext(fragment_cache=self.fragment_cache))
+
+        with patch.object(
+            KeyRegion,
+            'render',
+            side_effect=AssertionError("Not reused"),
+        ):
+            context = RenderContext(fragment_cache=self.fragment_cache)
+            result = script.render(context)
+
+        self.assertEqual(
+            '-- File can only be included once.\n'
+            'local lock = KEYS[1]\n'
+            'local lib = 1;\n'
+            'return 1',
+            result,
+        )
+        self.assertEqual(1, context.last_key_index)
+        self.assertEqual({self.lib}, context.rendered_scripts)
+        self.assertEqual(
+            [(script, 1), (self.lib, 3)],
+            context.source_map.get_scripts_for_line(3),
+        )
+        self.assertEqual(
+            [(script, 2)],
+            context.source_map.get_scripts_for_line(4),
+        )
+
+    def test_render_script_copies_fragments(self):
+        context = RenderContext(fragment_cache=self.fragment_cache)
+        self.script.render(context)
+        lib, main = self.fragment_cache.fragments.values()
+
+        self.assertEqual(
+            '-- File can only be included once.\n'
+            'local lock = KEYS[2]\n'
+            'local lib = 1;',
+            ''.join(lib.chunks),
+        )
+
+        # The chunks of included scripts are shared, not joined again.
+        for chunk in lib.chunks:
+            self.assertIn(id(chunk), [id(item) for item in main.chunks])
+
+        for fragment, script in [(lib, self.lib), (main, self.script)]:
+            self.assertIsNot(context.source_map, fragment.source_map)
+            self.assertIs(script, fragment.source_map.frames[0][0])
+            self.assertEqual(
+                ''.join(fragment.chunks).count('\n') + 1,
+                len(fragment.source_map),
+            )
+
+    def test_render_script_without_fragment_cache(self):
+        context = RenderContext()
+
+        self.assertIsNone(context.fragment_cache)
+        self.assertEqual(
+            self.script.render(
+                RenderContext(fragment_cache=self.fragment_cache),
+            ),
+            self.script.render(context),
+        )
+        self.assertEqual(0, len(global_fragment_cache))
+
+    def test_write_script_reuses_fragments(self):
+        stream = six.StringIO()
+        context = RenderContext(fragment_cache=self.fragment_cache)
+        context.write_script(self.script, stream)
+
+        # Streamed scripts are not buffered to be cached.
+        self.assertEqual(0, len(self.fragment_cache))
+
+        expected = self.script.render(
+            RenderContext(fragment_cache=self.fragment_cache),
+        )
+        stream = six.StringIO()
+
+        with patch.object(
+            KeyRegion,
+            'render',
+            side_effect=AssertionError("Not reused"),
+        ):
+            context = RenderContext(fragment_cache=self.fragment_cache)
+            context.write_script(self.script, stream)
+
+        self.assertEqual(expected, stream.getvalue())
+        self.assertEqual(len(expected.split('\n')), len(context.source_map))
+
+    def test_render_script_state(self):
+        other = Script(
+            name='other',
+            regions=[
+                ScriptRegion(script=self.lib, content='%include "lib"'),
+                KeyRegion(name='other', index=2, content='%key other'),
+            ],
+        )
+        results, context = self.render(
+            RenderContext(fragment_cache=self.fragment_cache),
+            self.script,
+            other,
+            self.script,
+        )
+        expected, expected_context = self.render(
+            PrefixRenderContext(prefix='', fragment_cache=FragmentCache()),
+            self.script,
+            other,
+            self.script,
+        )
+
+        self.assertEqual(expected, results)
+        self.assertEqual('local other = KEYS[3]', results[1])
+        self.assertEqual(
+            'local key = KEYS[4]\nreturn count',
+            results[2].replace('local count = tonumber(ARGV[2])\n', ''),
+        )
+
+        for attribute in ['last_key_index', 'last_arg_index']:
+            self.assertEqual(
+                getattr(expected_context, attribute),
+                getattr(context, attribute),
+            )
+
+        self.assertEqual(
+            list(expected_context.source_map.real_lines),
+            list(context.source_map.real_lines),
+        )
+        self.assertEqual(
+            list(expected_context.source_map.line_frames),
+            list(context.source_map.line_frames),
+        )
+        self.assertEqual(
+            expected_context.source_map.frames,
+            context.source_map.frames,
+        )
+
+    def test_render_script_memo_key(self):
+        results = [
+            self.script.render(
+                PrefixRenderContext(
+                    prefix=prefix,
+                    fragment_cache=self.fragment_cache,
+                ),
+            )
+            for prefix in ['a_', 'b_', 'a_']
+        ]
+
+        self.assertIn('local a_key = KEYS[1]', results[0])
+        self.assertIn('local b_key = KEYS[1]', results[1])
+        self.assertEqual(results[0], results[2])
+        self.assertEqual(4, len(self.fragment_cache))
+
+    def test_render_script_without_memo_key(self):
+        class CustomRenderContext(RenderContext):
+            pass
+
+        context = CustomRenderContext(fragment_cache=self.fragment_cache)
+
+        self.assertIsNone(context.memo_key)
+        self.assertEqual(self.script.render(), self.script.render(context))
+        self.assertEqual(0, len(self.fragment_cache))
+
+
+class IterativeRenderTests(TestCase):
+
+    def setUp(self):
+        self.script = None
+
+        for level in range(sys.getrecursionlimit() + 10):
+            regions = [TextRegion(content='local a_%d = 1;' % level)]
+
+            if self.script is not None:
+                regions.append(
+                    ScriptRegion(script=self.script, content='%include "a"'),
+                )
+
+            self.script = Script(name='a_%d' % level, regions=regions)
+
+    def test_render_script_deep_includes(self):
+        context = RenderContext(fragment_cache=FragmentCache())
+        result = self.script.render(context)
+        lines = result.split('\n')
+
+        self.assertEqual(sys.getrecursionlimit() + 10, len(lines))
+        self.assertEqual('local a_%d = 1;' % (len(lines) - 1), lines[0])
+        self.assertEqual('local a_0 = 1;', lines[-1])
+        self.assertEqual(
+            len(lines),
+            len(context.source_map.get_scripts_for_line(len(lines))),
+        )
+
+    def test_write_script(self):
+        class CustomRenderContext(RenderContext):
+            pass
+
+        for context in [
+            RenderContext(fragment_cache=FragmentCache()),
+            CustomRenderContext(),
+        ]:
+            stream = six.StringIO()
+
+            self.assertTrue(context.write_script(self.script, stream))
+            self.assertEqual(self.script.render(), stream.getvalue())
+            self.assertEqual(
+                self.script.line_count,
+                len(context.source_map),
+            )
+
+    def test_write_script_already_rendered(self):
+        self.script.multiple_inclusion = False
+        context = RenderContext(fragment_cache=FragmentCache())
+        context.render_script(self.script)
+        stream = six.StringIO()
+
+        self.assertFalse(context.write_script(self.script, stream))
+        self.assertEqual('', stream.getvalue())
+
+
+class MinifyingRenderContextTests(TestCase):
+
+    def setUp(self):
+        self.render_context = MinifyingRenderContext(
+            fragment_cache=FragmentCache(),
+        )
+
+    def test_render_script(self):
+        lib = Script(
+            name='lib',
+            regions=[
+                PragmaRegion(value='once', content='%pragma once'),
+                TextRegion(
+                    content='-- Library.\n\nlocal function f(x)\n'
+                    '    return x + y\nend',
+                ),
+            ],
+        )
+        script = Script(
+            name='main',
+            regions=[
+                KeyRegion(name='key', index=1, content='%key key'),
+                ArgumentRegion(
+                    name='count',
+                    index=1,
+                    type_='int',
+                    content='%arg count int',
+                ),
+                ScriptRegion(script=lib, content='%include "lib"'),
+                ReturnRegion(type_='int', content='%return int'),
+                TextRegion(content='\n  return f(count) -- Call.'),
+            ],
+        )
+        result = script.render(self.render_context)
+
+        self.assertEqual(
+            'local key=KEYS[1]\n'
+            'local count=tonumber(ARGV[1])\n'
+            'local function f(x)\n'
+            'return x+y\n'
+            'end\n'
+            'return f(count)',
+            result,
+        )
+        self.assertEqual(
+            [(script, 3), (lib, 5)],
+            self.render_context.source_map.get_scripts_for_line(4),
+        )
+        self.assertEqual(
+            [(script, 6)],
+            self.render_context.source_map.get_scripts_for_line(6),
+        )
+
+    def test_render_text_nothing_left(self):
+        self.assertIsNone(self.render_context.render_text('-- Comment.'))
+
+    def test_render_return(self):
+        self.assertIsNone(self.render_context.render_return(type_=int))
+
+    def test_render_pragma(self):
+        self.assertIsNone(self.render_context.render_pragma(value='once'))
+
+        with self.assertRaises(AssertionError):
+            self.render_context.render_pragma(value='unknown')
+
+    def test_memo_key(self):
+        class CustomRenderContext(MinifyingRenderContext):
+            pass
+
+        self.assertEqual((), self.render_context.memo_key)
+        self.assertIsNone(CustomRenderContext().memo_key)
@@ -1,14 +1,26 @@
+import hashlib
+import msgpack
+import pickle
+import sys
+
 from mock import (
     MagicMock,
+    call,
     patch,
 )
 from unittest import TestCase
 
 from redis.client import BasePipeline
+from redis.exceptions import (
+    NoScriptError,
+    ResponseError,
+)
 
+from redis_lua.exceptions import ScriptError
 from redis_lua.script import (
     Script,
     jdumps,
+    register_scripts,
 )
 from redis_lua.regions import (
     TextRegion,
@@ -17,7 +29,12 @@ from redis_lua.regions import (
     ArgumentRegion,
     ReturnRegion,
     PragmaRegion,
+    MessagePack,
+    IntegerArray,
+    FloatArray,
+    Hash,
 )
+from redis_lua.render import MinifyingRenderContext
 
 
 class ObjectsScriptTests(TestCase):
@@ -593,10 +610,8 @@ class ObjectsScriptTests(TestCase):
                     script=script_b,
                     content='%include "b"',
                 ),
-                # Next script inclusion will be ignored as the script was
-                # already included.
-                # It won't be possible to get an error from this inclusion line
-                # so we expect a like skip.
+                # Scripts can be included several times by default, so the
+                # next inclusion is rendered again.
                 ScriptRegion(
                     script=script_a,
                     content='%include "a"',
@@ -617,13 +632,111 @@ class ObjectsScriptTests(TestCase):
         self.assertEqual([(script, 4)], get_scripts_for_line(5))
         self.assertEqual([(script, 5), (script_b, 1)], get_scripts_for_line(6))
         self.assertEqual([(script, 5), (script_b, 2)], get_scripts_for_line(7))
+        self.assertEqual([(script, 6), (script_a, 1)], get_scripts_for_line(8))
+        self.assertEqual([(script, 6), (script_a, 2)], get_scripts_for_line(9))
+        self.assertEqual([(script, 7)], get_scripts_for_line(10))
+        self.assertEqual([(script, 8)], get_scripts_for_line(11))
+        self.assertEqual([(script, 9)], get_scripts_for_line(12))
+
+        with self.assertRaises(ValueError):
+            get_scripts_for_line(13)
+
+    def test_script_get_scripts_for_line_pragma_once(self):
+        script_a = Script(
+            name='a',
+            regions=[
+                PragmaRegion(value='once', content='%pragma once'),
+                TextRegion(content='>b'),
+            ],
+        )
+        script = Script(
+            name='foo',
+            regions=[
+                ScriptRegion(
+                    script=script_a,
+                    content='%include "a"',
+                ),
+                # The next inclusion is skipped as the script was already
+                # included, so no error can come from this line.
+                ScriptRegion(
+                    script=script_a,
+                    content='%include "a"',
+                ),
+                TextRegion(content='c'),
+            ],
+        )
+
+        get_scripts_for_line = script.get_scripts_for_line
+
+        self.assertEqual(3, script.line_count)
+        self.assertEqual([(script, 1), (script_a, 1)], get_scripts_for_line(1))
+        self.assertEqual([(script, 1), (script_a, 2)], get_scripts_for_line(2))
         # Here goes the line skip.
-        self.assertEqual([(script, 7)], get_scripts_for_line(8))
-        self.assertEqual([(script, 8)], get_scripts_for_line(9))
-        self.assertEqual([(script, 9)], get_scripts_for_line(10))
+        self.assertEqual([(script, 3)], get_scripts_for_line(3))
 
         with self.assertRaises(ValueError):
-            get_scripts_for_line(11)
+            get_scripts_for_line(4)
+
+    def test_script_get_source_line(self):
+        script_a = Script(
+            name='a',
+            regions=[
+                KeyRegion(name='key', index=1, content='%key key'),
+                TextRegion(content='local x = 1;\nlocal y = 2;'),
+            ],
+        )
+        script = Script(
+            name='foo',
+            regions=[
+                ScriptRegion(script=script_a, content='%include "a"'),
+                TextRegion(content='local z = 3;'),
+            ],
+        )
+
+        self.assertEqual('%key key', script_a.get_source_line(1))
+        self.assertEqual('local y = 2;', script_a.get_source_line(3))
+        self.assertEqual('%include "a"', script.get_source_line(1))
+        self.assertEqual('local z = 3;', script.get_source_line(2))
+
+        for real_line in [0, 3]:
+            with self.assertRaises(ValueError):
+                script.get_source_line(real_line)
+
+    def test_script_source_map(self):
+        script_a = Script(
+            name='a',
+            regions=[
+                PragmaRegion(value='once', content='%pragma once'),
+                TextRegion(content='local x = 1;'),
+            ],
+        )
+        script_b = Script(
+            name='b',
+            regions=[
+                ScriptRegion(script=script_a, content='%include "a"'),
+            ],
+        )
+        script = Script(
+            name='foo',
+            regions=[
+                ScriptRegion(script=script_a, content='%include "a"'),
+                ScriptRegion(script=script_b, content='%include "b"'),
+                TextRegion(content='local y = 2;'),
+            ],
+        )
+        rendered = script.render().split('\n')
+
+        self.assertEqual(len(rendered), len(script.source_map))
+        self.assertEqual(len(rendered), script.line_count)
+        self.assertEqual(
+            [(script, 2)],
+            script.get_scripts_for_line(3),
+        )
+        self.assertEqual(
+            [(script, 3)],
+            script.get_scripts_for_line(4),
+        )
+        self.assertEqual('local y = 2;', rendered[3])
 
     def test_script_get_line_info(self):
         name = 'foo'
@@ -716,10 +829,200 @@ class ObjectsScriptTests(TestCase):
         self.assertEqual((1, 1, 1, 1, 4, 6, a_regions[0]), get_line_info(4))
         self.assertEqual((1, 1, 1, 1, 5, 6, a_regions[0]), get_line_info(5))
         self.assertEqual((1, 1, 1, 1, 6, 6, a_regions[0]), get_line_info(6))
-        self.assertEqual((4, 4, 1, 7, 7, 1, a_regions[3]), get_line_info(7))
+        self.assertEqual((2, 2, 1, 7, 7, 3, a_regions[1]), get_line_info(7))
+        self.assertEqual((2, 2, 1, 7, 9, 3, a_regions[1]), get_line_info(9))
+        self.assertEqual((3, 3, 1, 10, 10, 3, a_regions[2]), get_line_info(10))
+        self.assertEqual((4, 4, 1, 13, 13, 1, a_regions[3]), get_line_info(13))
+
+        with self.assertRaises(ValueError):
+            get_line_info(14)
+
+    def test_script_line_count_deep_includes(self):
+        lib = Script(
+            name='lib',
+            regions=[
+                PragmaRegion(value='once', content='%pragma once'),
+                TextRegion(content='local lib = 1;'),
+            ],
+        )
+        script = None
+
+        # Every level includes the library, which was already visited by the
+        # time the previous level gets included.
+        for level in range(sys.getrecursionlimit() + 10):
+            regions = [
+                ScriptRegion(script=lib, content='%include "lib"'),
+                TextRegion(content='local a_%d = 1;' % level),
+            ]
+
+            if script is not None:
+                regions.append(
+                    ScriptRegion(script=script, content='%include "a"'),
+                )
+
+            script = Script(name='a_%d' % level, regions=regions)
+
+        self.assertEqual(
+            script.render().count('\n') + 1,
+            script.line_count,
+        )
+        self.assertEqual(1, script.render().count('local lib = 1;'))
+
+    def test_script_line_count_nested_includes(self):
+        def make_script(name, *regions):
+            return Script(
+                name=name,
+                regions=[
+                    ScriptRegion(script=region, content='%include "x"')
+                    if isinstance(region, Script) else
+                    TextRegion(content=region)
+                    for region in regions
+                ],
+            )
+
+        lib, other = [
+            Script(
+                name=name,
+                regions=[
+                    PragmaRegion(value='once', content='%pragma once'),
+                    TextRegion(content='local %s = 1;' % name),
+                ],
+            )
+            for name in ['lib', 'other']
+        ]
+        c = make_script('c', lib, other, 'local c = 1;')
+        b = make_script('b', lib, c, 'local b = 1;')
+        scripts = [
+            make_script('top', lib, b),
+            make_script('top_other', other, lib, b, 'return 1'),
+        ]
+
+        for script in scripts:
+            self.assertEqual(
+                script.render().count('\n') + 1,
+                script.line_count,
+            )
+
+        self.assertEqual(
+            {frozenset([lib]), frozenset([lib, other])},
+            set(c._line_counts),
+        )
+        self.assertIsNone(pickle.loads(pickle.dumps(c))._line_counts)
+
+    def test_script_find_line_info(self):
+        regions = [
+            TextRegion(content='a'),
+            TextRegion(content='b\nc\nd'),
+            TextRegion(content='e'),
+        ]
+        script = Script(
+            name='foo',
+            regions=regions,
+        )
+
+        self.assertEqual([1, 2, 5], script.line_starts)
 
         with self.assertRaises(ValueError):
-            get_line_info(8)
+            script.find_line_info(0)
+
+        self.assertIs(script.line_infos[0], script.find_line_info(1))
+        self.assertIs(script.line_infos[1], script.find_line_info(2))
+        self.assertIs(script.line_infos[1], script.find_line_info(4))
+        self.assertIs(script.line_infos[2], script.find_line_info(5))
+
+        with self.assertRaises(ValueError):
+            script.find_line_info(6)
+
+    def test_script_included_scripts(self):
+        c_script = Script(name='c', regions=[TextRegion(content='c')])
+        b_script = Script(
+            name='b',
+            regions=[ScriptRegion(script=c_script, content='%include "c"')],
+        )
+        a_script = Script(
+            name='a',
+            regions=[
+                ScriptRegion(script=b_script, content='%include "b"'),
+                TextRegion(content='a'),
+            ],
+        )
+
+        self.assertEqual(frozenset(), c_script.included_scripts)
+        self.assertEqual(frozenset([c_script]), b_script.included_scripts)
+        self.assertEqual(
+            frozenset([b_script, c_script]),
+            a_script.included_scripts,
+        )
+
+    def test_script_include_already_included_scripts_only(self):
+        c_script = Script(
+            name='c',
+            regions=[
+                PragmaRegion(value='once', content='%pragma once'),
+                TextRegion(content='1'),
+            ],
+        )
+        b_script = Script(
+            name='b',
+            regions=[ScriptRegion(script=c_script, content='%include "c"')],
+        )
+        regions = [
+            ScriptRegion(script=c_script, content='%include "c"'),
+            ScriptRegion(script=b_script, content='%include "b"'),
+            TextRegion(content='3'),
+        ]
+        script = Script(name='a', regions=regions)
+
+        # The second include renders as an empty line.
+        self.assertEqual(4, script.line_count)
+        self.assertEqual(4, len(script.render().split('\n')))
+        self.assertEqual(
+            [
+                (1, 1, 1, 1, 1, 2, regions[0]),
+                (2, 2, 1, 3, 3, 1, regions[1]),
+                (3, 3, 1, 4, 4, 1, regions[2]),
+            ],
+            script.line_infos,
+        )
+
+    def test_script_duplicate_nested_keys_and_args(self):
+        b_script = Script(
+            name='b',
+            regions=[
+                KeyRegion(name='key', index=1, content='%key key'),
+                ArgumentRegion(name='arg', index=1, type_='int', content=''),
+            ],
+        )
+
+        with self.assertRaises(ValueError) as error:
+            Script(
+                name='a',
+                regions=[
+                    KeyRegion(name='key', index=1, content='%key key'),
+                    ScriptRegion(script=b_script, content='%include "b"'),
+                ],
+            )
+
+        self.assertEqual("Duplicate key(s) ['key']", str(error.exception))
+
+        with self.assertRaises(ValueError) as error:
+            Script(
+                name='a',
+                regions=[
+                    ArgumentRegion(
+                        name='arg',
+                        index=1,
+                        type_='int',
+                        content='',
+                    ),
+                    ScriptRegion(script=b_script, content='%include "b"'),
+                ],
+            )
+
+        self.assertEqual(
+            "Duplicate arguments(s) %r" % [('arg', int)],
+            str(error.exception),
+        )
 
     def test_script_as_string(self):
         name = 'foo'
@@ -763,11 +1066,67 @@ class ObjectsScriptTests(TestCase):
         self.assertFalse(script_a == script_c)
         self.assertFalse(hash(script_a) == hash(script_c))
         self.assertFalse(script_a == script_d)
-        self.assertTrue(hash(script_a) == hash(script_d))
+        self.assertFalse(hash(script_a) == hash(script_d))
         self.assertFalse(script_a == 42)
 
-    @patch('redis_lua.script.RedisScript')
-    def test_script_run(self, _):
+    def test_script_digest(self):
+        def make_scripts(content):
+            script_a = Script(name='a', regions=[TextRegion(content=content)])
+            script_b = Script(
+                name='b',
+                regions=[
+                    ScriptRegion(script=script_a, content='%include "a"'),
+                ],
+            )
+
+            return script_a, script_b
+
+        script_a, script_b = make_scripts('x')
+        other_a, other_b = make_scripts('x')
+        different_a, different_b = make_scripts('y')
+
+        self.assertEqual(40, len(script_a.digest))
+        self.assertEqual(script_a.digest, other_a.digest)
+        self.assertEqual(script_b.digest, other_b.digest)
+        self.assertNotEqual(script_a.digest, different_a.digest)
+        self.assertNotEqual(script_b.digest, different_b.digest)
+        self.assertEqual(script_b, other_b)
+        self.assertNotEqual(script_b, different_b)
+
+    def test_script_digest_region_types(self):
+        key_script = Script(
+            name='a',
+            regions=[KeyRegion(name='x', index=1, content='%key x')],
+        )
+        arg_script = Script(
+            name='a',
+            regions=[
+                ArgumentRegion(
+                    name='x',
+                    index=1,
+                    type_=None,
+                    content='%key x',
+                ),
+            ],
+        )
+        int_arg_script = Script(
+            name='a',
+            regions=[
+                ArgumentRegion(
+                    name='x',
+                    index=1,
+                    type_='int',
+                    content='%key x',
+                ),
+            ],
+        )
+
+        self.assertEqual(
+            3,
+            len({key_script, arg_script, int_arg_script}),
+        )
+
+    def test_script_run(self):
         name = 'foo'
         regions = [
             KeyRegion(
@@ -816,8 +1175,9 @@ class ObjectsScriptTests(TestCase):
             name=name,
             regions=regions,
         )
-        script._redis_script = MagicMock(return_value="result")
-        result = script.get_runner(client=None)(
+        client = MagicMock()
+        client.evalsha.return_value = "result"
+        result = script.get_runner(client=client)(
             arg1='ARG',
             arg2=2,
             arg3=False,
@@ -828,20 +1188,19 @@ class ObjectsScriptTests(TestCase):
         )
 
         self.assertEqual("result", result)
-        script._redis_script.assert_called_once_with(
-            keys=['KEY', 'KEY 2'],
-            args=[
-                'ARG',
-                2,
-                0,
-                jdumps([1, 2.5, None, 'a']),
-                jdumps({'b': None}),
-            ],
-            client=None,
+        client.evalsha.assert_called_once_with(
+            script.sha1,
+            2,
+            'KEY',
+            'KEY 2',
+            'ARG',
+            2,
+            0,
+            jdumps([1, 2.5, None, 'a']),
+            jdumps({'b': None}),
         )
 
-    @patch('redis_lua.script.RedisScript')
-    def test_script_call_in_pipeline(self, redis_script):
+    def test_script_call_in_pipeline(self):
         name = 'foo'
         regions = [
             ReturnRegion(
@@ -854,19 +1213,19 @@ class ObjectsScriptTests(TestCase):
             regions=regions,
         )
         client = MagicMock(spec=BasePipeline)
-        redis_script.return_value = MagicMock(return_value=42)
+        client.scripts = set()
+        client.evalsha = MagicMock()
         result = script.get_runner(client=client)()
 
         self.assertTrue(hasattr(result, '__call__'))
         self.assertEqual("42", result(42))
-        redis_script.return_value.assert_called_once_with(
-            keys=[],
-            args=[],
-            client=client,
+        client.evalsha.assert_called_once_with(script.sha1, 0)
+        self.assertEqual(
+            [(script.sha1, script.rendered_bytes)],
+            [(item.sha, item.script) for item in client.scripts],
         )
 
-    @patch('redis_lua.script.RedisScript')
-    def test_script_call_return_as_string(self, _):
+    def test_script_call_return_as_string(self):
         name = 'foo'
         regions = [
             ReturnRegion(
@@ -878,18 +1237,14 @@ class ObjectsScriptTests(TestCase):
             name=name,
             regions=regions,
         )
-        script._redis_script = MagicMock(return_value=42)
-        result = script.get_runner(client=None)()
+        client = MagicMock()
+        client.evalsha.return_value = 42
+        result = script.get_runner(client=client)()
 
         self.assertEqual("42", result)
-        script._redis_script.assert_called_once_with(
-            keys=[],
-            args=[],
-            client=None,
-        )
+        client.evalsha.assert_called_once_with(script.sha1, 0)
 
-    @patch('redis_lua.script.RedisScript')
-    def test_script_call_return_as_integer(self, _):
+    def test_script_call_return_as_integer(self):
         name = 'foo'
         regions = [
             ReturnRegion(
@@ -901,18 +1256,14 @@ class ObjectsScriptTests(TestCase):
             name=name,
             regions=regions,
         )
-        script._redis_script = MagicMock(return_value="42")
-        result = script.get_runner(client=None)()
+        client = MagicMock()
+        client.evalsha.return_value = "42"
+        result = script.get_runner(client=client)()
 
         self.assertEqual(42, result)
-        script._redis_script.assert_called_once_with(
-            keys=[],
-            args=[],
-            client=None,
-        )
+        client.evalsha.assert_called_once_with(script.sha1, 0)
 
-    @patch('redis_lua.script.RedisScript')
-    def test_script_call_return_as_boolean(self, _):
+    def test_script_call_return_as_boolean(self):
         name = 'foo'
         regions = [
             ReturnRegion(
@@ -924,18 +1275,14 @@ class ObjectsScriptTests(TestCase):
             name=name,
             regions=regions,
         )
-        script._redis_script = MagicMock(return_value=5)
-        result = script.get_runner(client=None)()
+        client = MagicMock()
+        client.evalsha.return_value = 5
+        result = script.get_runner(client=client)()
 
         self.assertEqual(True, result)
-        script._redis_script.assert_called_once_with(
-            keys=[],
-            args=[],
-            client=None,
-        )
+        client.evalsha.assert_called_once_with(script.sha1, 0)
 
-    @patch('redis_lua.script.RedisScript')
-    def test_script_call_return_as_list(self, _):
+    def test_script_call_return_as_list(self):
         name = 'foo'
         regions = [
             ReturnRegion(
@@ -948,18 +1295,14 @@ class ObjectsScriptTests(TestCase):
             regions=regions,
         )
         value = [1, 'a', None, 3.5]
-        script._redis_script = MagicMock(return_value=jdumps(value))
-        result = script.get_runner(client=None)()
+        client = MagicMock()
+        client.evalsha.return_value = jdumps(value)
+        result = script.get_runner(client=client)()
 
         self.assertEqual(value, result)
-        script._redis_script.assert_called_once_with(
-            keys=[],
-            args=[],
-            client=None,
-        )
+        client.evalsha.assert_called_once_with(script.sha1, 0)
 
-    @patch('redis_lua.script.RedisScript')
-    def test_script_call_return_as_dict(self, _):
+    def test_script_call_return_as_dict(self):
         name = 'foo'
         regions = [
             ReturnRegion(
@@ -972,14 +1315,192 @@ class ObjectsScriptTests(TestCase):
             regions=regions,
         )
         value = {'a': 1, 'b': 3.5, 'c': None, 'd': ['a', 2], 'e': 's'}
-        script._redis_script = MagicMock(return_value=jdumps(value))
-        result = script.get_runner(client=None)()
+        client = MagicMock()
+        client.evalsha.return_value = jdumps(value)
+        result = script.get_runner(client=client)()
+
+        self.assertEqual(value, result)
+        client.evalsha.assert_called_once_with(script.sha1, 0)
+
+    def test_script_call_msgpack_argument(self):
+        script = Script(
+            name='foo',
+            regions=[
+                ArgumentRegion(
+                    name='arg1',
+                    index=1,
+                    type_='msgpack',
+                    content='%arg arg1 msgpack',
+                ),
+            ],
+        )
+        value = {'a': [1, 2.5, None, u'caf\xe9', b'\xff']}
+        client = MagicMock()
+        script.get_runner(client=client)(arg1=value)
+        (_, _, packed), _ = client.evalsha.call_args
+
+        self.assertIsInstance(packed, bytes)
+        self.assertEqual(value, msgpack.unpackb(packed, raw=False))
+
+    @patch('redis_lua.script.msgpack', None)
+    def test_script_call_msgpack_argument_without_msgpack(self):
+        with self.assertRaises(ImportError):
+            Script.convert_argument_for_call(MessagePack, {})
+
+    def test_script_call_return_as_msgpack(self):
+        script = Script(
+            name='foo',
+            regions=[
+                ReturnRegion(type_='msgpack', content='%return msgpack'),
+            ],
+        )
+        # Like cmsgpack, pack binary strings with the string type.
+        value = {b'a': [1, 2.5, None, u'caf\xe9'.encode('utf-8'), b'\xff\xfe']}
+        client = MagicMock()
+        client.evalsha.return_value = msgpack.packb(value, use_bin_type=False)
+        result = script.get_runner(client=client)()
 
         self.assertEqual(value, result)
-        script._redis_script.assert_called_once_with(
-            keys=[],
-            args=[],
-            client=None,
+        client.evalsha.assert_called_once_with(script.sha1, 0)
+
+    @patch('redis_lua.script.msgpack', None)
+    def test_script_call_return_as_msgpack_without_msgpack(self):
+        with self.assertRaises(ImportError):
+            Script.convert_return_value_from_call(MessagePack, b'\x80')
+
+    def test_script_call_int_array_argument(self):
+        script = Script(
+            name='foo',
+            regions=[
+                ArgumentRegion(
+                    name='ids',
+                    index=1,
+                    type_='int_array',
+                    content='%arg ids int_array',
+                ),
+            ],
+        )
+        client = MagicMock()
+        script.get_runner(client=client)(ids=iter([1, -2, 2 ** 40]))
+
+        client.evalsha.assert_called_once_with(
+            script.sha1,
+            0,
+            b'\x01\0\0\0\0\0\0\0'
+            b'\xfe\xff\xff\xff\xff\xff\xff\xff'
+            b'\0\0\0\0\0\x01\0\0',
+        )
+
+    def test_script_call_hash_arguments(self):
+        script = Script(
+            name='foo',
+            regions=[
+                KeyRegion(name='key1', index=1, content='%key key1'),
+                ArgumentRegion(
+                    name='a',
+                    index=1,
+                    type_='hash',
+                    content='%arg a hash',
+                ),
+                ArgumentRegion(
+                    name='b',
+                    index=2,
+                    type_='int',
+                    content='%arg b int',
+                ),
+                ArgumentRegion(
+                    name='c',
+                    index=3,
+                    type_='pairs',
+                    content='%arg c pairs',
+                ),
+                ArgumentRegion(
+                    name='d',
+                    index=4,
+                    type_='hash',
+                    content='%arg d hash',
+                ),
+            ],
+        )
+        client = MagicMock()
+        script.get_runner(client=client)(
+            key1='KEY',
+            a={'x': 1},
+            b=2,
+            c=[('y', 'z')],
+            d={},
+        )
+
+        client.evalsha.assert_called_once_with(
+            script.sha1,
+            1,
+            'KEY',
+            5, 2, 8, 11,
+            1, 'x', 1,
+            1, 'y', 'z',
+            0,
+        )
+        self.assertEqual(
+            [('a', Hash), ('b', int), ('c', Hash), ('d', Hash)],
+            script.args,
+        )
+
+    def test_script_call_return_as_array(self):
+        for type_, value in [
+            (IntegerArray, [1, -2, 2 ** 40]),
+            (FloatArray, [0.5, -1.25, 1e100]),
+            (IntegerArray, []),
+        ]:
+            self.assertEqual(
+                value,
+                Script.convert_return_value_from_call(
+                    type_,
+                    Script.convert_argument_for_call(type_, value),
+                ),
+            )
+
+    def test_script_call_noscript(self):
+        script = Script(
+            name='foo',
+            regions=[
+                KeyRegion(name='key1', index=1, content='%key key1'),
+                TextRegion(content='return 1'),
+            ],
+        )
+        client = MagicMock()
+        client.evalsha.side_effect = [NoScriptError('NOSCRIPT'), 1]
+        result = script.get_runner(client=client)(key1='KEY')
+
+        self.assertEqual(1, result)
+        client.script_load.assert_called_once_with(script.rendered_bytes)
+        self.assertEqual(
+            [call(script.sha1, 1, 'KEY')] * 2,
+            client.evalsha.call_args_list,
+        )
+
+    def test_script_sha1(self):
+        script = Script(
+            name='foo',
+            regions=[TextRegion(content=u'return "caf\xe9"')],
+        )
+
+        self.assertEqual(
+            u'return "caf\xe9"'.encode('utf-8'),
+            script.rendered_bytes,
+        )
+        self.assertEqual(
+            hashlib.sha1(script.rendered_bytes).hexdigest(),
+            script.sha1,
+        )
+        self.assertEqual(script.sha1, pickle.loads(pickle.dumps(script)).sha1)
+
+    def test_script_rendered_bytes_cached(self):
+        script = Script(name='foo', regions=[TextRegion(content='return 1')])
+        rendered_bytes = script.rendered_bytes
+
+        self.assertIs(rendered_bytes, script.rendered_bytes)
+        self.assertIsNone(
+            pickle.loads(pickle.dumps(script))._rendered_bytes,
         )
 
     def test_script_call_missing_key(self):
@@ -1050,3 +1571,167 @@ class ObjectsScriptTests(TestCase):
 
         with self.assertRaises(TypeError):
             script.get_runner(client=None)(unknown_key='VALUe')
+
+
+class RenderingRunnerTests(TestCase):
+
+    def setUp(self):
+        self.lib = Script(
+            name='lib',
+            regions=[TextRegion(content='-- Lib.\n\nlocal b = c;')],
+        )
+        self.script = Script(
+            name='foo',
+            regions=[
+                KeyRegion(name='key1', index=1, content='%key key1'),
+                ScriptRegion(script=self.lib, content='%include "lib"'),
+                TextRegion(content='return   b'),
+            ],
+        )
+        self.text = 'local key1=KEYS[1]\nlocal b=c;\nreturn b'
+        self.sha1 = hashlib.sha1(self.text.encode('utf-8')).hexdigest()
+
+    def test_get_rendering(self):
+        rendering = self.script.get_rendering(
+            context_class=MinifyingRenderContext,
+        )
+
+        self.assertEqual(self.text, rendering.text)
+        self.assertEqual(self.sha1, rendering.sha1)
+        self.assertEqual(
+            [(self.script, 2), (self.lib, 3)],
+            rendering.source_map.get_scripts_for_line(2),
+        )
+        self.assertIs(
+            rendering,
+            self.script.get_rendering(context_class=MinifyingRenderContext),
+        )
+        self.assertIsNone(
+            pickle.loads(pickle.dumps(self.script))._renderings,
+        )
+
+    def test_get_rendering_default(self):
+        rendering = self.script.get_rendering()
+
+        self.assertEqual(self.script.render(), rendering.text)
+        self.assertEqual(self.script.sha1, rendering.sha1)
+        self.assertIs(self.script.source_map, rendering.source_map)
+
+    def test_runner(self):
+        client = MagicMock()
+        client.evalsha.side_effect = [NoScriptError('NOSCRIPT'), 1]
+        runner = self.script.get_runner(
+            client=client,
+            context_class=MinifyingRenderContext,
+        )
+
+        self.assertEqual(1, runner(key1='KEY'))
+        client.script_load.assert_called_once_with(self.text.encode('utf-8'))
+        self.assertEqual(
+            [call(self.sha1, 1, 'KEY')] * 2,
+            client.evalsha.call_args_list,
+        )
+
+    def test_runner_in_pipeline(self):
+        client = MagicMock(spec=BasePipeline)
+        client.scripts = set()
+        client.evalsha = MagicMock()
+        self.script.get_runner(
+            client=client,
+            context_class=MinifyingRenderContext,
+        )(key1='KEY')
+
+        client.evalsha.assert_called_once_with(self.sha1, 1, 'KEY')
+        self.assertEqual(
+            [(self.sha1, self.text.encode('utf-8'))],
+            [(item.sha, item.script) for item in client.scripts],
+        )
+
+    def test_runner_in_pipeline_scripts(self):
+        client = MagicMock(spec=BasePipeline)
+        client.scripts = set()
+        client.evalsha = MagicMock()
+
+        for context_class in [None, None, MinifyingRenderContext]:
+            self.script.get_runner(
+                client=client,
+                context_class=context_class,
+            )(key1='KEY')
+
+        self.assertEqual(2, len(client.scripts))
+
+        default, minified = sorted(
+            client.scripts,
+            key=lambda item: item.sha == self.sha1,
+        )
+        same = type(default)(self.script)
+
+        self.assertEqual(self.script.sha1, default.sha)
+        self.assertTrue(default == same)
+        self.assertFalse(default != same)
+        self.assertEqual(hash(same), hash(default))
+        self.assertFalse(default == minified)
+        self.assertTrue(default != minified)
+        self.assertTrue(default != self.script.sha1)
+
+    def test_runner_error(self):
+        client = MagicMock()
+        client.evalsha.side_effect = ResponseError(
+            "ERR something is wrong: f_1234abc:2: unknown variable c",
+        )
+        runner = self.script.get_runner(
+            client=client,
+            context_class=MinifyingRenderContext,
+        )
+
+        with self.assertRaises(ScriptError) as error:
+            runner(key1='KEY')
+
+        # Line 2 of the minified text is line 3 of the included script.
+        self.assertIn('Script "lib", line 3', str(error.exception))
+        self.assertIn('local b = c;', str(error.exception))
+
+
+class RegisterScriptsTests(TestCase):
+
+    def setUp(self):
+        self.scripts = [
+            Script(name=name, regions=[TextRegion(content='return 1')])
+            for name in ['a', 'b']
+        ]
+        self.scripts.append(
+            Script(name='c', regions=[TextRegion(content='return 2')]),
+        )
+        self.client = MagicMock()
+        self.pipeline = self.client.pipeline.return_value
+
+    def test_register_scripts(self):
+        self.client.script_exists.return_value = [False, True]
+        result = register_scripts(client=self.client, scripts=self.scripts)
+
+        self.assertEqual([self.scripts[0]], result)
+        self.client.script_exists.assert_called_once_with(
+            self.scripts[0].sha1,
+            self.scripts[2].sha1,
+        )
+        self.client.pipeline.assert_called_once_with(transaction=False)
+        self.pipeline.script_load.assert_called_once_with(
+            self.scripts[0].rendered_bytes,
+        )
+        self.pipeline.execute.assert_called_once_with()
+        self.assertEqual(0, self.client.script_load.call_count)
+
+    def test_register_scripts_existing(self):
+        self.client.script_exists.return_value = [True, True]
+
+        self.assertEqual(
+            [],
+            register_scripts(client=self.client, scripts=self.scripts),
+        )
+        self.assertEqual(1, self.client.script_exists.call_count)
+        self.assertEqual(0, self.client.pipeline.call_count)
+
+    def test_register_scripts_empty(self):
+        self.assertEqual([], register_scripts(client=self.client, scripts=[]))
+        self.assertEqual(0, self.client.script_exists.call_count)
+        self.assertEqual(0, self.client.pipeline.call_count)
@@ -0,0 +1,178 @@
+import os
+import shutil
+import time
+
+from mock import patch
+from unittest import (
+    TestCase,
+    skipIf,
+)
+
+from redis_lua.watchers import (
+    InotifyWatcher,
+    PollingWatcher,
+    get_watcher,
+    inotify_simple,
+)
+
+from .helpers import ScriptDirectoryMixin
+
+
+class WatcherTestsMixin(ScriptDirectoryMixin):
+
+    def setUp(self):
+        super(WatcherTestsMixin, self).setUp()
+        self.write('a', 'local a = 1;')
+        self.write('sub/b', 'local b = 1;')
+        self.watcher = self.create_watcher()
+
+    def tearDown(self):
+        self.watcher.close()
+
+    def write(self, name, content):
+        filename = super(WatcherTestsMixin, self).write(name, content)
+
+        # Make sure the change is noticeable even with coarse timestamps.
+        stat = os.stat(filename)
+        os.utime(filename, (stat.st_atime, stat.st_mtime + 1))
+
+    def test_watcher_representation(self):
+        self.assertEqual(
+            '%s(path=%r)' % (self.watcher.__class__.__name__, self.path),
+            repr(self.watcher),
+        )
+
+    def test_watcher_no_changes(self):
+        self.assertEqual(set(), self.watcher.get_changes())
+
+    def test_watcher_changes(self):
+        self.write('a', 'local a = 2;')
+        self.write('sub/c', 'local c = 1;')
+
+        with open(os.path.join(self.path, 'sub', 'd.txt'), 'w') as _file:
+            _file.write('foo')
+
+        os.remove(os.path.join(self.path, 'sub', 'b.lua'))
+
+        self.assertEqual(
+            {'a', 'sub/b', 'sub/c'},
+            self.watcher.get_changes(timeout=0.1),
+        )
+        self.assertEqual(set(), self.watcher.get_changes())
+
+    def test_watcher_new_directory(self):
+        self.write('new/sub/e', 'local e = 1;')
+
+        self.assertEqual({'new/sub/e'}, self.watcher.get_changes(timeout=0.1))
+
+        self.write('new/sub/e', 'local e = 2;')
+
+        self.assertEqual({'new/sub/e'}, self.watcher.get_changes(timeout=0.1))
+
+
+class PollingWatcherTests(WatcherTestsMixin, TestCase):
+
+    def create_watcher(self):
+        return PollingWatcher(path=self.path, interval=0.01)
+
+    def test_polling_watcher_timeout(self):
+        start = time.time()
+
+        self.assertEqual(set(), self.watcher.get_changes(timeout=0.05))
+        self.assertGreaterEqual(time.time() - start, 0.05)
+
+
+@skipIf(inotify_simple is None, "inotify is not available.")
+class InotifyWatcherTests(WatcherTestsMixin, TestCase):
+
+    def create_watcher(self):
+        return InotifyWatcher(path=self.path)
+
+    def test_inotify_watcher_removed_directory(self):
+        shutil.rmtree(os.path.join(self.path, 'sub'))
+
+        self.assertEqual({'sub/b'}, self.watcher.get_changes(timeout=0.1))
+        self.assertEqual({1: ''}, self.watcher.directories)
+
+    def test_inotify_watcher_moved_directory(self):
+        os.rename(
+            os.path.join(self.path, 'sub'),
+            os.path.join(self.path, 'moved'),
+        )
+
+        self.assertEqual(
+            {'sub/b', 'moved/b'},
+            self.watcher.get_changes(timeout=0.1),
+        )
+
+        self.write('moved/b', 'local b = 2;')
+
+        self.assertEqual({'moved/b'}, self.watcher.get_changes(timeout=0.1))
+        self.assertEqual({'a', 'moved/b'}, self.watcher.names)
+
+    def test_inotify_watcher_moved_out_directory(self):
+        path = self.make_directory()
+        os.rename(
+            os.path.join(self.path, 'sub'),
+            os.path.join(path, 'sub'),
+        )
+
+        self.assertEqual({'sub/b'}, self.watcher.get_changes(timeout=0.1))
+        self.assertEqual({1: ''}, self.watcher.directories)
+
+        with open(os.path.join(path, 'sub', 'b.lua'), 'w') as _file:
+            _file.write('local b = 2;')
+
+        self.assertEqual(set(), self.watcher.get_changes(timeout=0.1))
+
+    def test_inotify_watcher_directory_symlink(self):
+        os.symlink('..', os.path.join(self.path, 'sub', 'loop'))
+        watcher = InotifyWatcher(path=self.path)
+        self.addCleanup(watcher.close)
+
+        self.assertEqual(['', 'sub/'], sorted(watcher.directories.values()))
+        self.assertEqual({'a', 'sub/b'}, watcher.names)
+
+    def test_inotify_watcher_removed_watch(self):
+        event = inotify_simple.Event(
+            wd=1,
+            mask=inotify_simple.flags.DELETE | inotify_simple.flags.ISDIR,
+            cookie=0,
+            name='sub',
+        )
+
+        with patch.object(self.watcher.inotify, 'read', return_value=[event]):
+            with patch.object(
+                self.watcher.inotify,
+                'rm_watch',
+                side_effect=OSError("Invalid argument"),
+            ):
+                self.assertEqual({'sub/b'}, self.watcher.get_changes())
+
+        self.assertEqual({1: ''}, self.watcher.directories)
+
+    def test_inotify_watcher_unknown_watch(self):
+        event = inotify_simple.Event(
+            wd=42,
+            mask=inotify_simple.flags.CREATE,
+            cookie=0,
+            name='a.lua',
+        )
+
+        with patch.object(self.watcher.inotify, 'read', return_value=[event]):
+            self.assertEqual(set(), self.watcher.get_changes())
+
+
+class GetWatcherTests(ScriptDirectoryMixin, TestCase):
+
+    @patch('redis_lua.watchers.inotify_simple', None)
+    def test_get_watcher_polling(self):
+        self.assertIsInstance(get_watcher(path=self.path), PollingWatcher)
+
+    @skipIf(inotify_simple is None, "inotify is not available.")
+    @patch('redis_lua.watchers.sys.platform', 'linux')
+    def test_get_watcher_inotify(self):
+        watcher = get_watcher(path=self.path)
+        watcher.close()
+
+        self.assertIsInstance(watcher, InotifyWatcher)